@@ -20,6 +20,7 @@ from uvdat.core.models import (
     Project,
     RasterData,
     Region,
+    SimplifiedGeometry,
     SizeConfig,
     SizeRangeConfig,
     TaskResult,
@@ -115,6 +116,11 @@ class VectorFeatureAdmin(admin.ModelAdmin):
     list_select_related = ["vector_data__dataset"]
 
 
+@admin.register(SimplifiedGeometry)
+class SimplifiedGeometryAdmin(admin.ModelAdmin):
+    list_display = ["id", "feature", "min_zoom", "max_zoom"]
+
+
 @admin.register(Region)
 class RegionAdmin(admin.ModelAdmin):
     list_display = ["id", "name", "dataset"]
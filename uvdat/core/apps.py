@@ -6,3 +6,11 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     name = "uvdat.core"
     verbose_name = "UVDAT: Core"
+
+    def ready(self):
+        from uvdat.core.raster.vsi import configure_gdal  # noqa: PLC0415
+
+        # Connect the signals invalidating tiles which depend on layers
+        import uvdat.core.tiles.cache  # noqa: F401, PLC0415
+
+        configure_gdal()
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import contextlib
+import fcntl
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import shutil
+import tempfile
+from typing import TYPE_CHECKING
+
+from django.conf import settings
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+    from django.db.models.fields.files import FieldFile
+
+logger = logging.getLogger(__name__)
+
+
+@contextlib.contextmanager
+def _locked(path: Path, operation: int) -> Iterator[bool]:
+    """Hold a lock on a lock file; yields whether it was acquired, for non-blocking locks."""
+    with path.open("a") as lock_file:
+        try:
+            fcntl.flock(lock_file, operation)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class LocalFileCache:
+    """
+    A size-bounded local cache of stored files, shared by the processes of a worker.
+
+    Entries are addressed by the storage name of their file and the data version of the model
+    owning it, or its size for models without versions, so a rewritten file is a new entry.
+    Files are used under a shared lock, and the least recently used entries which aren't in
+    use are evicted once the cache exceeds its maximum size. Hits and misses are counted in
+    a `stats.json` file of the cache directory.
+    """
+
+    def __init__(self, directory: Path, max_size: int):
+        self.directory = directory
+        self.max_size = max_size
+
+    def _entry_key(self, field_file: FieldFile) -> str:
+        # Versioned data is rewritten under a new version, which also saves a request for the
+        # size of its file
+        version = getattr(field_file.instance, "data_version", None)
+        identity = f"{field_file.storage.__class__.__name__}:{field_file.name}:" + (
+            f"v{version}" if version is not None else str(field_file.size)
+        )
+        return hashlib.sha256(identity.encode()).hexdigest()
+
+    @contextlib.contextmanager
+    def _cache_lock(self) -> Iterator[None]:
+        with _locked(self.directory / "cache.lock", fcntl.LOCK_EX):
+            yield
+
+    def _count(self, counter: str):
+        stats_path = self.directory / "stats.json"
+        with self._cache_lock():
+            stats = self.stats()
+            stats[counter] += 1
+            stats_path.write_text(json.dumps(stats))
+
+    def stats(self) -> dict[str, int]:
+        """Return the numbers of hits and misses of the cache."""
+        try:
+            return json.loads((self.directory / "stats.json").read_text())
+        except (FileNotFoundError, ValueError):
+            return {"hits": 0, "misses": 0}
+
+    def _entries(self) -> list[tuple[float, int, Path]]:
+        entries = []
+        for entry in self.directory.iterdir():
+            if not entry.is_dir():
+                continue
+            try:
+                files = [f.stat() for f in entry.iterdir()]
+            except FileNotFoundError:
+                continue
+            if files:
+                entries.append(
+                    (max(s.st_mtime for s in files), sum(s.st_size for s in files), entry)
+                )
+        return entries
+
+    def evict(self):
+        """Evict the least recently used entries not in use, down to the maximum size."""
+        with self._cache_lock():
+            entries = self._entries()
+            total_size = sum(size for _mtime, size, _entry in entries)
+            for _mtime, size, entry in sorted(entries):
+                if total_size <= self.max_size:
+                    break
+                # Lock files are kept, as other processes may be waiting on them
+                with _locked(entry.with_suffix(".lock"), fcntl.LOCK_EX | fcntl.LOCK_NB) as acquired:
+                    if not acquired:
+                        continue
+                    shutil.rmtree(entry, ignore_errors=True)
+                total_size -= size
+
+    def _fill(self, field_file: FieldFile, path: Path):
+        path.parent.mkdir(exist_ok=True)
+        # Download beside the entry, so that the file only appears once complete
+        temp_path = None
+        try:
+            with (
+                field_file.open("rb") as source,
+                tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as destination,
+            ):
+                temp_path = Path(destination.name)
+                shutil.copyfileobj(source, destination, length=16 * 1024**2)
+            temp_path.replace(path)
+        finally:
+            # Partial downloads are removed if the download fails
+            if temp_path is not None:
+                temp_path.unlink(missing_ok=True)
+
+    @contextlib.contextmanager
+    def local_path(self, field_file: FieldFile) -> Iterator[Path]:
+        """Provide the path of a local copy of a stored file, while it's in use."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entry = self.directory / self._entry_key(field_file)
+        path = entry / Path(field_file.name).name
+        lock_path = entry.with_suffix(".lock")
+
+        hit = None
+        while True:
+            with _locked(lock_path, fcntl.LOCK_EX):
+                exists = path.exists()
+                if exists:
+                    # Entry recency is tracked by modification time
+                    os.utime(path)
+                else:
+                    self._fill(field_file, path)
+            if hit is None:
+                hit = exists
+                self._count("hits" if hit else "misses")
+                logger.debug("File cache %s for %s", "hit" if hit else "miss", field_file.name)
+
+            with _locked(lock_path, fcntl.LOCK_SH):
+                # The entry may have been evicted by another process before it was locked
+                if path.exists():
+                    if not hit:
+                        # Entries in use, including this one, are never evicted
+                        self.evict()
+                    yield path
+                    return
+
+
+def get_file_cache() -> LocalFileCache:
+    return LocalFileCache(Path(settings.UVDAT_FILE_CACHE_DIR), settings.UVDAT_FILE_CACHE_MAX_SIZE)
+
+
+@contextlib.contextmanager
+def cached_local_path(field_file: FieldFile) -> Iterator[Path]:
+    """Provide a local path of a stored file, from the shared file cache of the worker."""
+    with get_file_cache().local_path(field_file) as path:
+        yield path
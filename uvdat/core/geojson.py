@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import json
+import re
+from typing import TYPE_CHECKING, Any, TextIO
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+
+# Features are read, reprojected, written and saved in chunks of this many, so that memory
+# use is bounded by the size of a chunk rather than of a file
+FEATURE_CHUNK_SIZE = 5000
+
+# Text is read in blocks of at least this many characters
+READ_SIZE = 1024 * 1024
+
+WHITESPACE = re.compile(r"\s*")
+DECODER = json.JSONDecoder()
+
+
+class GeoJSONStreamError(ValueError):
+    pass
+
+
+class _JSONStream:
+    """A JSON text read in blocks, from which values are decoded one at a time."""
+
+    def __init__(self, f: TextIO):
+        self.f = f
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def read(self, size: int):
+        chunk = self.f.read(size)
+        self.eof = not chunk
+        # Decoded text is dropped, so the buffer only holds the value being decoded
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+
+    def peek(self) -> str:
+        """Return the next character which isn't whitespace."""
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if self.eof:
+                raise GeoJSONStreamError("Unexpected end of GeoJSON.")
+            self.read(READ_SIZE)
+
+    def expect(self, chars: str) -> str:
+        char = self.peek()
+        if char not in chars:
+            raise GeoJSONStreamError(f"Expected one of {chars!r} in GeoJSON, found {char!r}.")
+        self.pos += 1
+        return char
+
+    def decode(self) -> Any:
+        self.peek()
+        read_size = READ_SIZE
+        while True:
+            try:
+                value, end = DECODER.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as e:
+                if self.eof:
+                    raise GeoJSONStreamError(f"Invalid GeoJSON: {e}") from None
+            else:
+                # A number at the end of the buffer may continue in the next block
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            # Values larger than a block are read in blocks of doubling size, so that they
+            # are decoded in linear time
+            self.read(read_size)
+            read_size = max(read_size, len(self.buffer))
+
+    def members(self) -> Iterator[str]:
+        """Yield the keys of an object, after each of which its value must be consumed."""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.decode()
+            if not isinstance(key, str):
+                raise GeoJSONStreamError("Invalid GeoJSON: keys must be strings.")
+            self.expect(":")
+            yield key
+            if self.expect(",}") == "}":
+                return
+
+    def items(self) -> Iterator[Any]:
+        """Yield the values of an array."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.decode()
+            if self.expect(",]") == "]":
+                return
+
+
+def iter_geojson_features(f: TextIO) -> Iterator[dict]:
+    """
+    Yield the features of a GeoJSON FeatureCollection, one at a time.
+
+    The file is read in blocks and each feature is decoded on its own, so only one feature
+    is held in memory at a time, whatever the size of the file.
+    """
+    stream = _JSONStream(f)
+    for key in stream.members():
+        if key == "features":
+            yield from stream.items()
+        else:
+            stream.decode()
+
+
+def get_geojson_crs(f: TextIO) -> str | None:
+    """
+    Return the name of the CRS of a GeoJSON FeatureCollection, given by a legacy `crs` member.
+
+    Features preceding the `crs` member are decoded but not kept.
+    """
+    stream = _JSONStream(f)
+    for key in stream.members():
+        if key == "crs":
+            crs = stream.decode()
+            return crs.get("properties", {}).get("name") if isinstance(crs, dict) else None
+        if key == "features":
+            for _feature in stream.items():
+                pass
+        else:
+            stream.decode()
+    return None
+
+
+def write_feature_collection(f: TextIO, features: Iterable[dict]) -> int:
+    """Write features as a GeoJSON FeatureCollection as they are iterated, returning their count."""
+    f.write('{"type": "FeatureCollection", "features": [')
+    count = 0
+    for feature in features:
+        f.write(",\n" if count else "\n")
+        f.write(json.dumps(feature))
+        count += 1
+    f.write("\n]}\n")
+    return count
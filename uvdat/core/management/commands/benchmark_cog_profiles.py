@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import contextlib
+from pathlib import Path
+import random
+import statistics
+import tempfile
+import time
+
+import djclick as click
+import rasterio
+from rasterio.windows import Window
+
+from uvdat.core.file_cache import cached_local_path
+from uvdat.core.models import RasterData
+from uvdat.core.raster.cog import (
+    COG_PROFILES,
+    parse_cog_profile,
+    write_cog,
+    write_multiframe_cog,
+)
+
+# Size of the tiles read to time reads, like the tiles served by the API
+TILE_SIZE = 256
+
+
+def time_tile_reads(cog_path: Path, reads: int, seed: int = 0) -> list[float]:
+    """
+    Time reads of random tiles of a COG, at random zoom levels, in milliseconds.
+
+    Each tile is read from a newly opened dataset, so that blocks aren't cached between reads.
+    """
+    rng = random.Random(seed)  # noqa: S311
+    with rasterio.open(cog_path) as dataset:
+        width, height = dataset.width, dataset.height
+        factors = [1, *dataset.overviews(1)]
+    durations = []
+    for _ in range(reads):
+        factor = rng.choice(factors)
+        size = min(TILE_SIZE * factor, width, height)
+        window = Window(
+            rng.randrange(width - size + 1), rng.randrange(height - size + 1), size, size
+        )
+        out_size = max(size // factor, 1)
+        start = time.perf_counter()
+        with rasterio.open(cog_path) as dataset:
+            dataset.read(1, window=window, out_shape=(out_size, out_size))
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+def benchmark_profile(source_path: Path, profile_name: str, reads: int, temp_dir: Path) -> dict:
+    """Convert a raster with a COG profile, and measure the COG."""
+    profile = parse_cog_profile(profile_name)
+    cog_path = temp_dir / f"{source_path.stem}.{profile_name}.tiff"
+    start = time.perf_counter()
+    if write_multiframe_cog(source_path, cog_path, profile) is None:
+        write_cog(source_path, cog_path, profile)
+    conversion_time = time.perf_counter() - start
+    durations = time_tile_reads(cog_path, reads)
+    result = {
+        "size": cog_path.stat().st_size,
+        "conversion_time": conversion_time,
+        "read_p50": statistics.median(durations),
+        "read_p95": statistics.quantiles(durations, n=20)[-1] if len(durations) > 1 else 0,
+    }
+    cog_path.unlink()
+    return result
+
+
+@click.command()
+@click.argument("paths", nargs=-1, type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option("--raster", "raster_ids", type=int, multiple=True, help="RasterData ID to convert")
+@click.option(
+    "--profile",
+    "profiles",
+    type=click.Choice(sorted(COG_PROFILES)),
+    multiple=True,
+    help="COG profile to benchmark; all profiles by default",
+)
+@click.option("--reads", type=int, default=100, show_default=True, help="Tile reads timed")
+def benchmark_cog_profiles(*, paths, raster_ids, profiles, reads):
+    """Report the size, conversion time and tile read latency of rasters in each COG profile."""
+    if not paths and not raster_ids:
+        raise click.ClickException("Please specify at least one raster file or RasterData.")
+    profiles = profiles or sorted(COG_PROFILES)
+
+    with contextlib.ExitStack() as stack:
+        sources = list(paths)
+        sources.extend(
+            stack.enter_context(cached_local_path(raster_data.cloud_optimized_geotiff))
+            for raster_data in RasterData.objects.filter(id__in=raster_ids).order_by("id")
+        )
+        temp_dir = Path(stack.enter_context(tempfile.TemporaryDirectory()))
+
+        click.echo(
+            f"{'raster':<32} {'profile':<10} {'size (MB)':>10} {'ratio':>7} "
+            f"{'convert (s)':>12} {'read p50 (ms)':>14} {'read p95 (ms)':>14}"
+        )
+        for source_path in sources:
+            source_size = source_path.stat().st_size
+            for profile_name in profiles:
+                result = benchmark_profile(source_path, profile_name, reads, temp_dir)
+                click.echo(
+                    f"{source_path.name[:32]:<32} {profile_name:<10} "
+                    f"{result['size'] / 1024**2:>10.2f} {result['size'] / source_size:>7.2f} "
+                    f"{result['conversion_time']:>12.2f} {result['read_p50']:>14.2f} "
+                    f"{result['read_p95']:>14.2f}"
+                )
@@ -194,7 +194,7 @@ def ingest_projects(data: list[ProjectItem], *, replace=False) -> None:
 def ingest_charts(data: list[ChartItem], *, replace=False, skip_cache=False) -> None:
     for chart in data:
         click.echo(f"\t- {chart['name']}")
-        existing = Chart.objects.filter(name=chart["name"])
+        existing = Chart.objects.filter(name=chart["name"], project__name=chart["project"])
         create_new = True
         if existing.count():
             if replace:
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import itertools
+import json
+import multiprocessing
+import os
+
+from django.contrib.gis.db.models import Extent
+from django.db import connections
+import djclick as click
+
+from uvdat.core.models import LayerFrame, VectorData
+from uvdat.core.tiles import render_vector_tile
+from uvdat.core.tiles.archive import TileArchive, get_archive_path, iter_tiles, save_archive
+from uvdat.core.tiles.budget import TileBudget, parse_tile_budget
+from uvdat.core.tiles.vector import resolve_tile_options
+
+# Number of tiles rendered between writes to the archive, which are also resume points
+BATCH_SIZE = 256
+
+
+def render_tile(args: tuple[int, int, int, int, list[str] | None, TileBudget | None]):
+    vector_data_id, z, x, y, properties, budget = args
+    tile = render_vector_tile(vector_data_id, z, x, y, properties=properties, budget=budget)
+    return z, x, y, tile.data
+
+
+def open_archive(  # noqa: PLR0913
+    vector_data: VectorData,
+    min_zoom: int,
+    max_zoom: int,
+    properties,
+    budget,
+    *,
+    restart: bool,
+) -> TileArchive:
+    """Open the archive of a VectorData, starting over if it was seeded with other options."""
+    path = get_archive_path(vector_data)
+    if path.exists():
+        archive = TileArchive(path, readonly=False)
+        metadata = archive.metadata
+        if not restart and metadata.get("seed_options") == json.dumps(
+            [min_zoom, max_zoom, properties, budget]
+        ):
+            return archive
+        archive.close()
+        path.unlink()
+
+    archive = TileArchive(path, readonly=False)
+    archive.set_metadata(
+        name=vector_data.name,
+        format="pbf",
+        type="overlay",
+        minzoom=str(min_zoom),
+        maxzoom=str(max_zoom),
+        json=json.dumps({"vector_layers": [{"id": "default", "fields": {}}]}),
+        properties=json.dumps(properties),
+        budget=json.dumps(budget),
+        seed_options=json.dumps([min_zoom, max_zoom, properties, budget]),
+        complete="false",
+    )
+    return archive
+
+
+def seed_vector_tiles(
+    vector_data: VectorData,
+    min_zoom: int,
+    max_zoom: int,
+    processes: int,
+    *,
+    restart: bool = False,
+):
+    # Archived tiles are rendered as the tiles endpoint renders them by default,
+    # with all properties
+    properties, budget = resolve_tile_options(vector_data.id, None, parse_tile_budget())
+    extent = vector_data.features.aggregate(extent=Extent("web_mercator_geometry"))["extent"]
+    archive = open_archive(vector_data, min_zoom, max_zoom, properties, budget, restart=restart)
+    try:
+        if extent is not None:
+            seeded = archive.get_seeded_tiles()
+            remaining = [
+                (vector_data.id, z, x, y, properties, budget)
+                for z, x, y in iter_tiles(extent, min_zoom, max_zoom)
+                if (z, x, y) not in seeded
+            ]
+            click.echo(f"\t{len(seeded)} tiles already seeded, {len(remaining)} tiles remaining.")
+
+            with contextlib.ExitStack() as stack:
+                map_tiles = map
+                if processes > 1:
+                    # Forked workers must not share the database connections of this process
+                    connections.close_all()
+                    pool = stack.enter_context(
+                        ProcessPoolExecutor(
+                            processes, mp_context=multiprocessing.get_context("fork")
+                        )
+                    )
+                    map_tiles = pool.map
+                done = 0
+                for batch in itertools.batched(remaining, BATCH_SIZE):
+                    archive.write_tiles(list(map_tiles(render_tile, batch)))
+                    done += len(batch)
+                    click.echo(f"\t{done}/{len(remaining)} tiles seeded.")
+
+        archive.set_metadata(complete="true")
+    finally:
+        archive.close()
+    # Archives are seeded locally, then saved to storage for the processes serving tiles
+    path = get_archive_path(vector_data)
+    save_archive(vector_data, path)
+    path.unlink()
+
+
+@click.command()
+@click.option("--vector", "vector_ids", type=int, multiple=True, help="VectorData ID to seed")
+@click.option(
+    "--layer", "layer_ids", type=int, multiple=True, help="Layer ID to seed all VectorData of"
+)
+@click.option("--min-zoom", type=int, default=0, show_default=True)
+@click.option("--max-zoom", type=int, default=12, show_default=True)
+@click.option("--processes", type=int, default=os.cpu_count(), help="Number of rendering processes")
+@click.option(
+    "--restart",
+    is_flag=True,
+    default=False,
+    help="Seed archives from scratch instead of resuming partially seeded ones.",
+)
+def seed_tiles(*, vector_ids, layer_ids, min_zoom, max_zoom, processes, restart):  # noqa: PLR0913
+    """Pre-render the vector tiles of VectorData into MBTiles archives served by the API."""
+    vector_ids = set(vector_ids)
+    vector_ids.update(
+        LayerFrame.objects.filter(layer_id__in=layer_ids, vector__isnull=False).values_list(
+            "vector_id", flat=True
+        )
+    )
+    if not vector_ids:
+        raise click.ClickException("Please specify at least one VectorData or Layer to seed.")
+
+    for vector_data in VectorData.objects.filter(id__in=vector_ids).order_by("id"):
+        click.echo(f"Seeding tiles of {vector_data}...")
+        seed_vector_tiles(vector_data, min_zoom, max_zoom, processes, restart=restart)
+        click.secho(f"Seeded {vector_data.tile_archive.name}.", fg="green")
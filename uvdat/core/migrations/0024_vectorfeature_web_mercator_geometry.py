@@ -0,0 +1,31 @@
+# Generated by Django 6.0.3 on 2026-10-16 14:05
+from __future__ import annotations
+
+import django.contrib.gis.db.models.fields
+import django.contrib.gis.db.models.functions
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0023_task_subscribers"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="vectorfeature",
+            name="web_mercator_geometry",
+            field=models.GeneratedField(
+                db_persist=True,
+                expression=django.contrib.gis.db.models.functions.Transform("geometry", 3857),
+                output_field=django.contrib.gis.db.models.fields.GeometryField(srid=3857),
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="vectorfeature",
+            index=django.contrib.postgres.indexes.GistIndex(
+                fields=["web_mercator_geometry"], name="vectorfeature-mercator-index"
+            ),
+        ),
+    ]
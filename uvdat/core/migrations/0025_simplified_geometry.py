@@ -0,0 +1,42 @@
+# Generated by Django 6.0.3 on 2026-10-16 15:20
+from __future__ import annotations
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0024_vectorfeature_web_mercator_geometry"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SimplifiedGeometry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("min_zoom", models.PositiveSmallIntegerField()),
+                ("max_zoom", models.PositiveSmallIntegerField()),
+                (
+                    "geometry",
+                    django.contrib.gis.db.models.fields.GeometryField(
+                        spatial_index=False, srid=3857
+                    ),
+                ),
+                (
+                    "feature",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="simplified_geometries",
+                        to="core.vectorfeature",
+                    ),
+                ),
+            ],
+        ),
+    ]
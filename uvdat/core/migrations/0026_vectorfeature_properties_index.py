@@ -0,0 +1,22 @@
+# Generated by Django 6.0.3 on 2026-10-16 16:05
+from __future__ import annotations
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0025_simplified_geometry"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="vectorfeature",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["properties"],
+                name="vectorfeature-properties-index",
+                opclasses=["jsonb_path_ops"],
+            ),
+        ),
+    ]
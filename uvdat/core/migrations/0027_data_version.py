@@ -0,0 +1,34 @@
+# Generated by Django 6.0.3 on 2026-10-16 17:10
+from __future__ import annotations
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0026_vectorfeature_properties_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="rasterdata",
+            name="data_modified",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name="rasterdata",
+            name="data_version",
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name="vectordata",
+            name="data_modified",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name="vectordata",
+            name="data_version",
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 6.0.3 on 2026-10-16 19:05
+from __future__ import annotations
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0027_data_version"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DerivedRasterData",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("data_version", models.PositiveIntegerField(default=1)),
+                ("data_modified", models.DateTimeField(default=django.utils.timezone.now)),
+                ("name", models.CharField(default="Derived Raster Data", max_length=255)),
+                ("expression", models.TextField()),
+                ("inputs", models.JSONField(default=dict)),
+                ("metadata", models.JSONField(blank=True, null=True)),
+                (
+                    "dataset",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="derived_rasters",
+                        to="core.dataset",
+                    ),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+    ]
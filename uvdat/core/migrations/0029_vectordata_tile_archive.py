@@ -0,0 +1,19 @@
+# Generated by Django 6.0.3 on 2026-10-17 09:12
+from __future__ import annotations
+
+from django.db import migrations
+import s3_file_field.fields
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0028_derivedrasterdata"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="vectordata",
+            name="tile_archive",
+            field=s3_file_field.fields.S3FileField(blank=True, null=True),
+        ),
+    ]
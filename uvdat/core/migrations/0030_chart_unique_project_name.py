@@ -0,0 +1,24 @@
+# Generated by Django 6.0.3 on 2026-10-17 14:05
+from __future__ import annotations
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0029_vectordata_tile_archive"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="chart",
+            name="name",
+            field=models.CharField(max_length=255),
+        ),
+        migrations.AddConstraint(
+            model_name="chart",
+            constraint=models.UniqueConstraint(
+                fields=("project", "name"), name="unique-project-chart-name"
+            ),
+        ),
+    ]
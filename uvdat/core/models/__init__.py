@@ -3,7 +3,7 @@ from __future__ import annotations
 from .basemap import Basemap
 from .chart import Chart
 from .colormap import Colormap
-from .data import RasterData, VectorData, VectorFeature
+from .data import DerivedRasterData, RasterData, SimplifiedGeometry, VectorData, VectorFeature
 from .dataset import Dataset, DatasetTag
 from .file_item import FileItem
 from .layer import Layer, LayerFrame
@@ -29,6 +29,7 @@ __all__ = [
     "ColormapConfig",
     "Dataset",
     "DatasetTag",
+    "DerivedRasterData",
     "FileItem",
     "FilterConfig",
     "Layer",
@@ -40,6 +41,7 @@ __all__ = [
     "Project",
     "RasterData",
     "Region",
+    "SimplifiedGeometry",
     "SizeConfig",
     "SizeRangeConfig",
     "TaskResult",
@@ -7,7 +7,7 @@ from .querysets import ProjectQuerySet
 
 
 class Chart(models.Model):
-    name = models.CharField(max_length=255, unique=True)
+    name = models.CharField(max_length=255)
     description = models.TextField(blank=True, default="")
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="charts", null=True)
     metadata = models.JSONField(blank=True, null=True)
@@ -18,6 +18,12 @@ class Chart(models.Model):
     project_filter_path = "project"
     objects = ProjectQuerySet.as_manager()
 
+    class Meta:
+        constraints = [
+            # Chart names are unique within a project
+            models.UniqueConstraint(name="unique-project-chart-name", fields=["project", "name"])
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.id})"
 
@@ -1,14 +1,16 @@
 from __future__ import annotations
 
 import json
-from pathlib import Path
-import tempfile
+import math
 
 from django.contrib.gis.db import models as geomodels
+from django.contrib.gis.db.models.functions import Transform
+from django.contrib.postgres.indexes import GinIndex, GistIndex
 from django.core.files.base import ContentFile
 from django.db import models
 from django.dispatch import receiver
-import large_image
+from django.utils import timezone
+import numpy as np
 from s3_file_field import S3FileField
 
 from .dataset import Dataset
@@ -16,7 +18,28 @@ from .file_item import FileItem
 from .querysets import ProjectQuerySet
 
 
-class RasterData(models.Model):
+class VersionedData(models.Model):
+    """
+    Data with a version, which is bumped whenever its contents are rewritten.
+
+    The version stamps derived representations of the data, such as tiles and summaries,
+    for caching.
+    """
+
+    data_version = models.PositiveIntegerField(default=1)
+    data_modified = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        abstract = True
+
+    def bump_data_version(self):
+        type(self).objects.filter(pk=self.pk).update(
+            data_version=models.F("data_version") + 1, data_modified=timezone.now()
+        )
+        self.refresh_from_db(fields=["data_version", "data_modified"])
+
+
+class RasterData(VersionedData):
     name = models.CharField(max_length=255, default="Raster Data")
     dataset = models.ForeignKey(Dataset, related_name="rasters", on_delete=models.CASCADE)
     source_file = models.ForeignKey(FileItem, null=True, on_delete=models.CASCADE)
@@ -30,24 +53,51 @@ class RasterData(models.Model):
         return f"{self.name} ({self.id})"
 
     def get_image_data(self, resolution: float = 1.0):
-        with tempfile.TemporaryDirectory() as tmp:
-            raster_path = Path(tmp, "raster")
-            with raster_path.open("wb") as raster_file:
-                raster_file.write(self.cloud_optimized_geotiff.read())
-            source = large_image.open(raster_path)
-            data, _data_format = source.getRegion(format="numpy")
-            data = data[:, :, 0]
-            if resolution != 1.0:
-                step = int(1 / resolution)
-                data = data[::step][::step]
-            return data.tolist()
-
-
-class VectorData(models.Model):
+        """Return the first band as nested lists, resampled by a `resolution` factor."""
+        # Slow import, so do it lazily
+        from uvdat.core.raster import read_raster_window  # noqa: PLC0415
+
+        size = None
+        if resolution != 1.0:
+            metadata = self.metadata or {}
+            full_size = max(metadata.get("sizeX", 0), metadata.get("sizeY", 0))
+            size = max(1, math.ceil(full_size * resolution)) if full_size else None
+        data = read_raster_window(self, size=size).data
+        if data.dtype.kind == "f":
+            data = np.ma.masked_invalid(data)
+        # Masked and NaN values are null in JSON, rather than fill values
+        return np.where(np.ma.getmaskarray(data), None, data.data.astype(object)).tolist()
+
+
+class DerivedRasterData(VersionedData):
+    """
+    A raster computed from bands of the rasters of a dataset by an expression, such as NDVI.
+
+    The expression is evaluated when tiles or windows are read, so no COG is written. Its
+    `inputs` map the variables of the expression to a `raster` of the dataset, and an
+    optional `band` and `frame` of it.
+    """
+
+    name = models.CharField(max_length=255, default="Derived Raster Data")
+    dataset = models.ForeignKey(Dataset, related_name="derived_rasters", on_delete=models.CASCADE)
+    expression = models.TextField()
+    inputs = models.JSONField(default=dict)
+    metadata = models.JSONField(blank=True, null=True)
+
+    project_filter_path = "dataset__project"
+    objects = ProjectQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.name} ({self.id})"
+
+
+class VectorData(VersionedData):
     name = models.CharField(max_length=255, default="Vector Data")
     dataset = models.ForeignKey(Dataset, related_name="vectors", on_delete=models.CASCADE)
     source_file = models.ForeignKey(FileItem, null=True, on_delete=models.CASCADE)
     geojson_data = S3FileField(null=True)
+    # Pre-rendered vector tiles, seeded by the seed_tiles command
+    tile_archive = S3FileField(null=True, blank=True)
     summary = models.JSONField(blank=True, null=True)
     metadata = models.JSONField(blank=True, null=True)
 
@@ -66,6 +116,7 @@ class VectorData(models.Model):
             raise TypeError(f"Invalid content type supplied: {type(content)}")
 
         self.geojson_data.save("vectordata.geojson", ContentFile(data.encode()))
+        self.bump_data_version()
 
     def read_geojson_data(self) -> dict:
         """Read and load the data from geojson_data into a dict."""
@@ -141,8 +192,25 @@ class VectorFeature(models.Model):
         VectorData, on_delete=models.CASCADE, related_name="features", null=True
     )
     geometry = geomodels.GeometryField()
+    # Stored in web mercator, so that vector tile queries can use a spatial index
+    web_mercator_geometry = models.GeneratedField(
+        expression=Transform("geometry", 3857),
+        output_field=geomodels.GeometryField(srid=3857),
+        db_persist=True,
+    )
     properties = models.JSONField()
 
+    class Meta:
+        indexes = [
+            GistIndex(fields=["web_mercator_geometry"], name="vectorfeature-mercator-index"),
+            # Supports property containment queries, such as vector tile filters
+            GinIndex(
+                fields=["properties"],
+                opclasses=["jsonb_path_ops"],
+                name="vectorfeature-properties-index",
+            ),
+        ]
+
     def __str__(self):
         return f"VectorFeature ({self.id})"
 
@@ -151,6 +219,20 @@ class VectorFeature(models.Model):
         return self.vector_data.dataset
 
 
+class SimplifiedGeometry(models.Model):
+    """A simplified web mercator geometry of a VectorFeature, for vector tiles in a zoom band."""
+
+    feature = models.ForeignKey(
+        VectorFeature, on_delete=models.CASCADE, related_name="simplified_geometries"
+    )
+    min_zoom = models.PositiveSmallIntegerField()
+    max_zoom = models.PositiveSmallIntegerField()
+    geometry = geomodels.GeometryField(srid=3857, spatial_index=False)
+
+    def __str__(self):
+        return f"SimplifiedGeometry ({self.id})"
+
+
 @receiver(models.signals.post_delete, sender=RasterData)
 def delete_raster_content(sender, instance, **kwargs):
     if instance.cloud_optimized_geotiff:
@@ -161,3 +243,5 @@ def delete_raster_content(sender, instance, **kwargs):
 def delete_vector_content(sender, instance, **kwargs):
     if instance.geojson_data:
         instance.geojson_data.delete(save=False)
+    if instance.tile_archive:
+        instance.tile_archive.delete(save=False)
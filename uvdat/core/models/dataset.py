@@ -2,7 +2,9 @@ from __future__ import annotations
 
 import typing
 
+from django.core.files.storage import default_storage
 from django.db import models, transaction
+from django.dispatch import receiver
 from guardian.models import UserObjectPermission
 from guardian.shortcuts import assign_perm, get_users_with_perms
 
@@ -113,3 +115,11 @@ class Dataset(models.Model):
         else:
             convert_dataset_signature.apply()
             return None
+
+
+@receiver(models.signals.post_delete, sender=Dataset)
+def delete_dataset_content(sender, instance, **kwargs):
+    # Overviews of the mosaic of the dataset, built by `build_dataset_mosaic`
+    overviews = (instance.metadata or {}).get("mosaic_overviews") or {}
+    if overviews.get("name"):
+        default_storage.delete(overviews["name"])
@@ -0,0 +1,17 @@
+from __future__ import annotations
+
+from .window import (
+    RasterWindow,
+    RasterWindowError,
+    encode_raster_window,
+    parse_window_options,
+    read_raster_window,
+)
+
+__all__ = [
+    "RasterWindow",
+    "RasterWindowError",
+    "encode_raster_window",
+    "parse_window_options",
+    "read_raster_window",
+]
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import contextlib
+from pathlib import Path
+import tempfile
+
+import rasterio
+from rasterio.shutil import copy as copy_dataset
+
+from .frames import open_frame_pages
+
+# Size of the GDAL block cache during conversion, in megabytes, which bounds its memory use
+COG_CACHE_MAX = 256
+
+# Options of all COGs: existing overviews are rebuilt, and files over 4GB are BigTIFFs
+COG_COMMON_OPTIONS = {
+    "OVERVIEWS": "IGNORE_EXISTING",
+    "BIGTIFF": "IF_SAFER",
+    "NUM_THREADS": "ALL_CPUS",
+}
+
+COG_COMPRESSIONS = {"NONE", "LZW", "DEFLATE", "ZSTD", "LERC", "LERC_DEFLATE", "LERC_ZSTD"}
+COG_RESAMPLINGS = {"NEAREST", "AVERAGE", "BILINEAR", "CUBIC", "MODE", "RMS"}
+
+# Named conversion profiles. The error of LERC compressions bounds the precision of values,
+# which for depths in meters is a millimeter.
+COG_PROFILES = {
+    "deflate": {"compression": "DEFLATE", "predictor": True},
+    "zstd": {"compression": "ZSTD", "predictor": True, "level": 9},
+    "lerc": {"compression": "LERC_ZSTD", "max_z_error": 0},
+    "depth": {"compression": "LERC_ZSTD", "max_z_error": 0.001, "resampling": "average"},
+}
+DEFAULT_COG_PROFILE = "deflate"
+DEFAULT_TILE_SIZE = 512
+
+
+class CogProfileError(ValueError):
+    pass
+
+
+def parse_cog_profile(value: str | dict | None) -> dict:
+    """
+    Parse a conversion profile, given by name or as options.
+
+    Options are `compression`, `predictor`, `level`, `tile_size`, `resampling` of overviews
+    and `max_z_error` of LERC compressions. They may extend a named `profile`.
+    """
+    if value is None:
+        value = DEFAULT_COG_PROFILE
+    if isinstance(value, str):
+        value = {"profile": value}
+    if not isinstance(value, dict):
+        raise CogProfileError(f"Invalid COG profile {value!r}.")
+    name = value.get("profile", DEFAULT_COG_PROFILE)
+    if name not in COG_PROFILES:
+        raise CogProfileError(f'Unknown COG profile "{name}".')
+
+    profile = {
+        "tile_size": DEFAULT_TILE_SIZE,
+        "resampling": "nearest",
+        **COG_PROFILES[name],
+        **{k: v for k, v in value.items() if k != "profile"},
+    }
+    profile["compression"] = str(profile["compression"]).upper()
+    profile["resampling"] = str(profile["resampling"]).upper()
+    _validate_cog_profile(profile)
+    return profile
+
+
+def _validate_cog_profile(profile: dict):
+    if profile["compression"] not in COG_COMPRESSIONS:
+        raise CogProfileError(f'Unknown compression "{profile["compression"]}".')
+    if profile["resampling"] not in COG_RESAMPLINGS:
+        raise CogProfileError(f'Unknown resampling "{profile["resampling"]}".')
+    tile_size = profile["tile_size"]
+    if not isinstance(tile_size, int) or tile_size % 16 or not 64 <= tile_size <= 4096:
+        raise CogProfileError("Tile size must be a multiple of 16 between 64 and 4096.")
+    for key, cast in (("level", int), ("max_z_error", float)):
+        if profile.get(key) is not None:
+            try:
+                profile[key] = cast(profile[key])
+            except (TypeError, ValueError):
+                raise CogProfileError(f'Invalid {key} "{profile[key]}".') from None
+
+
+def get_cog_creation_options(profile: dict) -> dict:
+    """Return the options of GDAL's COG driver for a parsed conversion profile."""
+    options = {
+        **COG_COMMON_OPTIONS,
+        "COMPRESS": profile["compression"],
+        "BLOCKSIZE": profile["tile_size"],
+        "RESAMPLING": profile["resampling"],
+    }
+    if profile.get("predictor") and not profile["compression"].startswith("LERC"):
+        options["PREDICTOR"] = "YES"
+    if profile.get("level") is not None:
+        options["LEVEL"] = profile["level"]
+    if profile.get("max_z_error") is not None:
+        options["MAX_Z_ERROR"] = profile["max_z_error"]
+    return options
+
+
+def write_cog(source_path: Path | str, cog_path: Path, profile: dict | None = None) -> Path:
+    """
+    Convert a raster readable by GDAL to a cloud optimized GeoTIFF, with overviews.
+
+    GDAL's COG driver copies the source window by window through its block cache, so memory
+    use is bounded by `COG_CACHE_MAX` rather than the size of the raster. All bands, their data
+    type and nodata values are preserved. The COG is written with a parsed conversion
+    profile, or the default one.
+    """
+    options = get_cog_creation_options(profile or parse_cog_profile(None))
+    with (
+        rasterio.Env(GDAL_CACHEMAX=COG_CACHE_MAX),
+        rasterio.open(source_path) as source,
+    ):
+        copy_dataset(source, cog_path, driver="COG", **options)
+    return cog_path
+
+
+def write_multiframe_cog(
+    source_path: Path, cog_path: Path, profile: dict | None = None
+) -> Path | None:
+    """
+    Convert a multi-frame raster to a multi-page TIFF of cloud optimized frames.
+
+    Frames are the subdatasets of the source with its size and bands, as read by large_image.
+    Each is converted to a COG, and the COGs are combined as the pages of one TIFF. GDAL only
+    finds the overviews of a page among its SubIFDs, so the overviews of each COG are moved
+    there. The directories of all pages are written at the start of the file, so that opening
+    any frame takes few range requests. Returns None if the source has a single frame.
+    """
+    # Installed with large-image-converter
+    import tifftools  # noqa: PLC0415
+
+    with contextlib.ExitStack() as stack:
+        source = stack.enter_context(rasterio.open(source_path))
+        frame_paths = [page.name for page in open_frame_pages(source, stack)]
+    if len(frame_paths) <= 1:
+        return None
+
+    with tempfile.TemporaryDirectory(dir=cog_path.parent) as frame_dir:
+        pages = []
+        for i, frame_path in enumerate(frame_paths):
+            frame_cog = write_cog(frame_path, Path(frame_dir) / f"frame_{i}.tiff", profile)
+            page, *overviews = tifftools.read_tiff(str(frame_cog))["ifds"]
+            if overviews:
+                page["tags"][tifftools.Tag.SubIFD.value] = {
+                    "datatype": tifftools.Datatype.IFD8,
+                    "ifds": [[overview] for overview in overviews],
+                }
+            pages.append(page)
+        tifftools.write_tiff(pages, str(cog_path), allowExisting=True, ifdsFirst=True)
+    return cog_path
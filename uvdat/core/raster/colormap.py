@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import contextlib
+import functools
+import hashlib
+import json
+import math
+from typing import TYPE_CHECKING, NamedTuple
+
+import numpy as np
+
+from .stats import get_raster_stats
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from uvdat.core.models import Colormap, LayerStyle, RasterData
+
+# Entries of the lookup table of a colormap, over the positions of values in its range
+LUT_SIZE = 65536
+
+# Colormap of data styled without one
+GRAYSCALE_MARKERS = ((0.0, "#000000"), (1.0, "#ffffff"))
+
+# Integer data of at most 16 bits is colored through tables indexed by value, of at most
+# as many entries as LUT_SIZE
+LUT_MAX_VALUE_BITS = 16
+
+
+class RasterStyleError(ValueError):
+    pass
+
+
+class BandStyle(NamedTuple):
+    band: int
+    # Positions in [0, 1] and hex colors of the colormap, in order of position
+    markers: tuple[tuple[float, str], ...]
+    minimum: float
+    maximum: float
+    # Number of colors of a discrete colormap, or None for a continuous one
+    discrete_colors: int | None
+    # Whether values out of range take the color of the closest end, or are transparent
+    clamp: bool
+
+
+def parse_color(value: str) -> tuple[int, int, int, int]:
+    """Parse a `#RGB`, `#RGBA`, `#RRGGBB` or `#RRGGBBAA` color."""
+    digits = value.removeprefix("#")
+    if len(digits) in {3, 4}:
+        digits = "".join(digit * 2 for digit in digits)
+    if len(digits) == 6:
+        digits += "ff"
+    if len(digits) == 8:
+        with contextlib.suppress(ValueError):
+            return tuple(int(digits[i : i + 2], 16) for i in range(0, 8, 2))
+    raise RasterStyleError(f'Invalid color "{value}".')
+
+
+@functools.lru_cache(maxsize=64)
+def get_colormap_lut(
+    markers: tuple[tuple[float, str], ...], discrete_colors: int | None = None
+) -> np.ndarray:
+    """
+    Return the RGBA colors of `LUT_SIZE` positions evenly spaced over a colormap.
+
+    Colors are interpolated between markers. A discrete colormap has bins of equal width,
+    colored by the colormap at evenly spaced positions. Tables are cached by colormap, so
+    they are built once per process.
+    """
+    positions = np.linspace(0, 1, LUT_SIZE)
+    if discrete_colors:
+        bins = np.minimum(np.floor(positions * discrete_colors), discrete_colors - 1)
+        positions = bins / max(discrete_colors - 1, 1)
+    colors = np.array([parse_color(color) for _, color in markers], dtype=np.float64)
+    values = [value for value, _ in markers]
+    lut = np.stack([np.interp(positions, values, colors[:, i]) for i in range(4)], axis=-1)
+    return np.round(lut).astype(np.uint8)
+
+
+def _lookup(style: BandStyle, values: np.ndarray) -> np.ndarray:
+    lut = get_colormap_lut(style.markers, style.discrete_colors)
+    span = style.maximum - style.minimum
+    if span > 0:
+        positions = (values.astype(np.float64) - style.minimum) / span
+    else:
+        positions = np.where(values >= style.minimum, 1.0, 0.0)
+    indexes = np.clip(np.nan_to_num(positions) * (LUT_SIZE - 1), 0, LUT_SIZE - 1)
+    colors = lut[np.round(indexes).astype(np.intp)]
+    if not style.clamp:
+        colors[(positions < 0) | (positions > 1)] = 0
+    colors[np.isnan(positions)] = 0
+    return colors
+
+
+@functools.lru_cache(maxsize=64)
+def get_value_lut(style: BandStyle, dtype: str) -> np.ndarray:
+    """Return the RGBA colors of every value of an integer data type, of at most 16 bits."""
+    info = np.iinfo(dtype)
+    return _lookup(style, np.arange(info.min, info.max + 1))
+
+
+def apply_band_style(data: np.ma.MaskedArray, style: BandStyle) -> np.ndarray:
+    """
+    Color a band by a colormap, returning an RGBA array.
+
+    Integer data of at most 16 bits is colored by indexing a table of the colors of every
+    value; other data by the position of values in the range of the colormap, quantized to
+    `LUT_SIZE` positions. Masked pixels are transparent.
+    """
+    data = np.ma.masked_invalid(data) if data.dtype.kind == "f" else data
+    if data.dtype.kind in "ui" and data.dtype.itemsize * 8 <= LUT_MAX_VALUE_BITS:
+        offset = int(np.iinfo(data.dtype).min)
+        values = data.filled(offset).astype(np.intp) - offset
+        colors = get_value_lut(style, data.dtype.str)[values]
+    else:
+        colors = _lookup(style, data.filled(style.minimum))
+    colors[np.ma.getmaskarray(data)] = 0
+    return colors
+
+
+def get_colormap_markers(colormap: Colormap | None) -> tuple[tuple[float, str], ...]:
+    """Return the markers of a colormap in order of position, as a `BandStyle` expects."""
+    if colormap is None or not colormap.markers:
+        return GRAYSCALE_MARKERS
+    return tuple(sorted((float(m["value"]), m["color"]) for m in colormap.markers))
+
+
+def parse_band_style(
+    params: dict,
+    markers: tuple[tuple[float, str], ...],
+    get_range: Callable[[], tuple[float, float]],
+    band: int = 1,
+) -> BandStyle:
+    """
+    Parse the `min`, `max`, `n_colors` and `clamp` query parameters styling a band by markers.
+
+    A range not given by `min` and `max` is completed by `get_range`, which is only called
+    when needed. A colormap is discrete when `n_colors` is given.
+    """
+    try:
+        minimum = float(params["min"]) if params.get("min") else None
+        maximum = float(params["max"]) if params.get("max") else None
+        discrete_colors = int(params["n_colors"]) if params.get("n_colors") else None
+    except ValueError:
+        raise RasterStyleError("Invalid min, max or n_colors.") from None
+    if any(v is not None and not math.isfinite(v) for v in (minimum, maximum)):
+        raise RasterStyleError("The range must be finite.")
+    if discrete_colors is not None and not 2 <= discrete_colors <= 256:
+        raise RasterStyleError("n_colors must be between 2 and 256.")
+    if minimum is None or maximum is None:
+        default_minimum, default_maximum = get_range()
+        minimum = default_minimum if minimum is None else minimum
+        maximum = default_maximum if maximum is None else maximum
+    return BandStyle(
+        band=band,
+        markers=markers,
+        minimum=minimum,
+        maximum=maximum,
+        discrete_colors=discrete_colors,
+        clamp=params.get("clamp", "false").lower() in {"1", "true"},
+    )
+
+
+def get_band_range(raster_data: RasterData, band: int, frame: int) -> tuple[float, float]:
+    """Return the minimum and maximum of a band of a frame, from the raster statistics."""
+    for stats in get_raster_stats(raster_data):
+        if stats["band"] == band and stats["frame"] == frame:
+            if not stats["count"]:
+                break
+            return stats["min"], stats["max"]
+    raise RasterStyleError(f"Band {band} of frame {frame} has no data to style.")
+
+
+def get_band_styles(
+    layer_style: LayerStyle, raster_data: RasterData, frame: int = 0
+) -> list[BandStyle]:
+    """
+    Return the colormaps applied to the bands of a raster by the visible colors of a style.
+
+    As in the web client, colors named "all" apply to the first band, single colors are
+    colormaps from black, and colormaps without a range span the values of their band.
+    """
+    band_styles = []
+    color_configs = layer_style.color_configs.filter(visible=True).order_by("id")
+    for color_config in color_configs.select_related("colormap__colormap"):
+        if color_config.name == "all":
+            band = 1
+        else:
+            try:
+                band = int(color_config.name.removeprefix("Band "))
+            except ValueError:
+                raise RasterStyleError(f'Invalid band "{color_config.name}".') from None
+
+        # The reverse relation raises an AttributeError if the color has no colormap
+        colormap_config = getattr(color_config, "colormap", None)
+        if colormap_config is not None and colormap_config.colormap is not None:
+            markers = get_colormap_markers(colormap_config.colormap)
+            discrete_colors = None
+            if colormap_config.discrete:
+                discrete_colors = colormap_config.n_colors or len(markers)
+            clamp = colormap_config.clamp
+            value_range = (colormap_config.range_minimum, colormap_config.range_maximum)
+        elif color_config.single_color and color_config.single_color != "transparent":
+            markers = ((0.0, "#000000"), (1.0, color_config.single_color))
+            discrete_colors = None
+            clamp = True
+            value_range = (None, None)
+        else:
+            continue
+
+        # Each bound not set by the style is the bound of the values of the band
+        minimum, maximum = value_range
+        if minimum is None or maximum is None:
+            band_minimum, band_maximum = get_band_range(raster_data, band, frame)
+            minimum = band_minimum if minimum is None else minimum
+            maximum = band_maximum if maximum is None else maximum
+        band_styles.append(
+            BandStyle(
+                band=band,
+                markers=markers,
+                minimum=float(minimum),
+                maximum=float(maximum),
+                discrete_colors=discrete_colors,
+                clamp=clamp,
+            )
+        )
+    return band_styles
+
+
+def hash_band_styles(band_styles: list[BandStyle]) -> str:
+    """Return a stable hash of band styles, which stamps the tiles rendered with them."""
+    return hashlib.sha256(json.dumps(band_styles).encode()).hexdigest()[:16]
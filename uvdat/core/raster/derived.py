@@ -0,0 +1,342 @@
+from __future__ import annotations
+
+import ast
+import hashlib
+import json
+import operator
+from typing import TYPE_CHECKING, NamedTuple
+
+import numpy as np
+from rasterio.warp import transform_bounds
+from rasterio.windows import Window
+
+from .colormap import RasterStyleError, apply_band_style
+from .frames import open_raster_frames
+from .render import TILE_CRS, TILE_SIZE, encode_tile_image, get_tile_bounds, warp_band
+from .window import (
+    DEFAULT_TARGET_SIZE,
+    RasterWindow,
+    RasterWindowError,
+    get_bbox_window,
+    get_frame_band,
+    get_frame_count,
+)
+
+if TYPE_CHECKING:
+    from uvdat.core.models import DerivedRasterData, RasterData
+
+    from .colormap import BandStyle
+
+MAX_EXPRESSION_LENGTH = 1000
+MAX_DERIVED_INPUTS = 16
+
+# Size of the window from which the range of a derived raster is computed
+RANGE_SAMPLE_SIZE = 256
+
+BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Pow: operator.pow,
+    ast.Mod: operator.mod,
+    # Combine conditions, such as `(b1 > 0) & (b2 < 1)`
+    ast.BitAnd: operator.and_,
+    ast.BitOr: operator.or_,
+}
+UNARY_OPERATORS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+    ast.Invert: operator.invert,
+}
+COMPARISON_OPERATORS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+# Functions of expressions, by name, with their number of arguments
+DERIVED_FUNCTIONS = {
+    "abs": (np.ma.abs, 1),
+    "clip": (np.ma.clip, 3),
+    "exp": (np.ma.exp, 1),
+    "log": (np.ma.log, 1),
+    "maximum": (np.ma.maximum, 2),
+    "minimum": (np.ma.minimum, 2),
+    "sqrt": (np.ma.sqrt, 1),
+    "where": (np.ma.where, 3),
+}
+
+
+class DerivedRasterError(ValueError):
+    pass
+
+
+class DerivedInput(NamedTuple):
+    raster: int
+    band: int = 1
+    frame: int = 0
+
+
+def parse_inputs(inputs: dict) -> dict[str, DerivedInput]:
+    """
+    Parse the inputs of an expression, mapping variable names to bands of frames of rasters.
+
+    Inputs are given as `{"name": {"raster": id, "band": 1, "frame": 0}}`, where the band and
+    frame are optional.
+    """
+    if not isinstance(inputs, dict) or not inputs:
+        raise DerivedRasterError("At least one input is required.")
+    if len(inputs) > MAX_DERIVED_INPUTS:
+        raise DerivedRasterError(f"At most {MAX_DERIVED_INPUTS} inputs are allowed.")
+    parsed = {}
+    for name, value in inputs.items():
+        if not name.isidentifier() or name in DERIVED_FUNCTIONS:
+            raise DerivedRasterError(f'Invalid input name "{name}".')
+        if not isinstance(value, dict) or "raster" not in value:
+            raise DerivedRasterError(f'Input "{name}" must give a raster.')
+        fields = {key: value[key] for key in DerivedInput._fields if key in value}
+        if any(type(v) is not int for v in fields.values()):
+            raise DerivedRasterError(f'The raster, band and frame of "{name}" must be integers.')
+        derived_input = DerivedInput(**fields)
+        if derived_input.band < 1 or derived_input.frame < 0:
+            raise DerivedRasterError(f'Invalid band or frame of "{name}".')
+        parsed[name] = derived_input
+    return parsed
+
+
+def _check_call(node: ast.Call):
+    if (
+        not isinstance(node.func, ast.Name)
+        or node.func.id not in DERIVED_FUNCTIONS
+        or node.keywords
+    ):
+        raise DerivedRasterError(f"Unknown function, of {', '.join(DERIVED_FUNCTIONS)}.")
+    arity = DERIVED_FUNCTIONS[node.func.id][1]
+    if len(node.args) != arity:
+        raise DerivedRasterError(f"{node.func.id} takes {arity} arguments.")
+
+
+def _check_node(node: ast.AST, variables: set[str]):
+    if isinstance(node, ast.Call):
+        _check_call(node)
+        nodes = node.args
+    elif isinstance(node, ast.Name):
+        if node.id not in variables:
+            raise DerivedRasterError(f'Unknown input "{node.id}".')
+        nodes = []
+    elif isinstance(node, ast.Constant):
+        if type(node.value) not in {int, float}:
+            raise DerivedRasterError(f"Invalid constant {node.value!r}.")
+        nodes = []
+    elif isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATORS:
+        nodes = [node.left, node.right]
+    elif isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPERATORS:
+        nodes = [node.operand]
+    elif isinstance(node, ast.Compare) and all(type(op) in COMPARISON_OPERATORS for op in node.ops):
+        nodes = [node.left, *node.comparators]
+    else:
+        raise DerivedRasterError(f"Unsupported expression {ast.unparse(node)!r}.")
+    for child in nodes:
+        _check_node(child, variables)
+
+
+def parse_expression(expression: str, variables: set[str]) -> ast.Expression:
+    """
+    Parse an arithmetic expression over variables, such as `(nir - red) / (nir + red)`.
+
+    Expressions combine variables and numbers with arithmetic, comparison and `&`/`|`
+    operators, and the functions of `DERIVED_FUNCTIONS`. Nothing else is evaluated.
+    """
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise DerivedRasterError(f"Expressions are limited to {MAX_EXPRESSION_LENGTH} characters.")
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+        _check_node(tree.body, variables)
+    except (SyntaxError, RecursionError):
+        raise DerivedRasterError(f'Invalid expression "{expression}".') from None
+    return tree
+
+
+def _evaluate(node: ast.AST, values: dict[str, np.ma.MaskedArray]):
+    if isinstance(node, ast.Name):
+        return values[node.id]
+    if isinstance(node, ast.Constant):
+        # Numbers are floats, so that operations on them overflow rather than grow unbounded
+        return np.float64(node.value)
+    if isinstance(node, ast.BinOp):
+        return BINARY_OPERATORS[type(node.op)](
+            _evaluate(node.left, values), _evaluate(node.right, values)
+        )
+    if isinstance(node, ast.UnaryOp):
+        return UNARY_OPERATORS[type(node.op)](_evaluate(node.operand, values))
+    if isinstance(node, ast.Compare):
+        left = _evaluate(node.left, values)
+        result = True
+        for op, comparator in zip(node.ops, node.comparators, strict=True):
+            right = _evaluate(comparator, values)
+            result = result & COMPARISON_OPERATORS[type(op)](left, right)
+            left = right
+        return result
+    function = DERIVED_FUNCTIONS[node.func.id][0]
+    return function(*(_evaluate(arg, values) for arg in node.args))
+
+
+def evaluate_expression(expression: str, values: dict[str, np.ma.MaskedArray]) -> np.ma.MaskedArray:
+    """
+    Evaluate an expression over arrays of the same shape, returning a float32 array.
+
+    Values are computed in float32, so integer bands don't overflow or divide by integer
+    division. Pixels masked in any input used, or of invalid results such as divisions by
+    zero, are masked. Conditions evaluate to 1 where true and 0 elsewhere.
+    """
+    tree = parse_expression(expression, set(values))
+    values = {name: np.ma.asarray(value, dtype=np.float32) for name, value in values.items()}
+    shape = next(iter(values.values())).shape
+    with np.errstate(all="ignore"):
+        try:
+            result = _evaluate(tree.body, values)
+        except (TypeError, ValueError) as e:
+            raise DerivedRasterError(f'Can\'t evaluate "{expression}": {e}') from None
+        result = np.ma.masked_invalid(np.ma.asarray(result, dtype=np.float32))
+    if result.shape != shape:
+        try:
+            result = np.ma.MaskedArray(
+                np.broadcast_to(result.data, shape).copy(),
+                mask=np.broadcast_to(np.ma.getmaskarray(result), shape).copy(),
+            )
+        except ValueError:
+            raise DerivedRasterError(f'"{expression}" does not evaluate to a raster.') from None
+    return result
+
+
+def get_input_rasters(derived: DerivedRasterData) -> dict[int, RasterData]:
+    """
+    Return the rasters of the inputs of a derived raster, by ID.
+
+    Inputs are rasters of the dataset of the derived raster, so that it is shared with the
+    same projects as the data it is computed from.
+    """
+    inputs = parse_inputs(derived.inputs)
+    raster_ids = {derived_input.raster for derived_input in inputs.values()}
+    rasters = derived.dataset.rasters.in_bulk(raster_ids)
+    missing = raster_ids - set(rasters)
+    if missing:
+        raise DerivedRasterError(
+            f"Rasters {', '.join(str(i) for i in sorted(missing))} aren't in the dataset."
+        )
+    return rasters
+
+
+def get_derived_key(derived: DerivedRasterData, rasters: dict[int, RasterData]) -> str:
+    """Return a key of the expression of a derived raster and the data versions of its inputs."""
+    identity = [
+        derived.id,
+        derived.data_version,
+        sorted((raster_data.id, raster_data.data_version) for raster_data in rasters.values()),
+    ]
+    return hashlib.sha256(json.dumps(identity).encode()).hexdigest()[:16]
+
+
+def read_derived_grid(
+    derived: DerivedRasterData,
+    rasters: dict[int, RasterData],
+    bounds: tuple[float, float, float, float],
+    crs: str,
+    shape: tuple[int, int],
+) -> np.ma.MaskedArray:
+    """
+    Evaluate a derived raster on a grid, of a shape within bounds in a CRS.
+
+    Each input band is read from the overviews of its COG and warped to the grid, so inputs
+    of different resolutions or CRSs are aligned before the expression is evaluated.
+    """
+    inputs = parse_inputs(derived.inputs)
+    values = {}
+    for raster_id, raster_data in rasters.items():
+        if not raster_data.cloud_optimized_geotiff:
+            raise DerivedRasterError(f"Raster {raster_id} hasn't been converted yet.")
+        with open_raster_frames(
+            raster_data.cloud_optimized_geotiff, get_frame_count(raster_data)
+        ) as frames:
+            for name, derived_input in inputs.items():
+                if derived_input.raster == raster_id:
+                    dataset, band_index = get_frame_band(
+                        frames, raster_data, derived_input.band, derived_input.frame
+                    )
+                    values[name] = warp_band(dataset, band_index, bounds, crs, shape)
+    return evaluate_expression(derived.expression, values)
+
+
+def read_derived_window(
+    derived: DerivedRasterData,
+    *,
+    bbox: tuple[float, float, float, float] | None = None,
+    bbox_srs: str = "EPSG:4326",
+    size: int = DEFAULT_TARGET_SIZE,
+) -> RasterWindow:
+    """
+    Evaluate a derived raster within a bounding box, at most `size` pixels wide.
+
+    The window is on the grid of the raster of the first input, like a window read by
+    `read_raster_window`. It is served by the `raster-data` action of derived rasters;
+    analyses don't take derived rasters as inputs yet.
+    """
+    rasters = get_input_rasters(derived)
+    first_input = next(iter(parse_inputs(derived.inputs).values()))
+    first = rasters[first_input.raster]
+    if not first.cloud_optimized_geotiff:
+        raise DerivedRasterError(f"Raster {first.id} hasn't been converted yet.")
+    with open_raster_frames(first.cloud_optimized_geotiff, get_frame_count(first)) as frames:
+        dataset, _ = get_frame_band(frames, first, first_input.band, first_input.frame)
+        if dataset.crs is None:
+            raise RasterWindowError("The raster is not georeferenced.")
+        window = Window(0, 0, dataset.width, dataset.height)
+        if bbox is not None:
+            window = get_bbox_window(dataset, bbox, bbox_srs)
+        scale = min(1.0, size / max(window.width, window.height))
+        shape = (max(1, round(window.height * scale)), max(1, round(window.width * scale)))
+        bounds = dataset.window_bounds(window)
+        crs = dataset.crs
+    data = read_derived_grid(derived, rasters, bounds, crs, shape)
+    return RasterWindow(data, transform_bounds(crs, bbox_srs, *bounds))
+
+
+def get_derived_range(derived: DerivedRasterData) -> tuple[float, float]:
+    """
+    Return the minimum and maximum of a derived raster, from a window of the whole raster.
+
+    The range is stored in the metadata of the derived raster, by the data versions of its
+    inputs, so it is computed again once they change.
+    """
+    key = get_derived_key(derived, get_input_rasters(derived))
+    stored = (derived.metadata or {}).get("range")
+    if stored and stored["key"] == key:
+        return stored["min"], stored["max"]
+
+    data = read_derived_window(derived, size=RANGE_SAMPLE_SIZE).data
+    if not data.count():
+        raise RasterStyleError("The derived raster has no data to style.")
+    value_range = {"key": key, "min": float(data.min()), "max": float(data.max())}
+    derived.metadata = {**(derived.metadata or {}), "range": value_range}
+    derived.save(update_fields=["metadata"])
+    return value_range["min"], value_range["max"]
+
+
+def render_derived_tile(  # noqa: PLR0913
+    derived: DerivedRasterData,
+    rasters: dict[int, RasterData],
+    z: int,
+    x: int,
+    y: int,
+    *,
+    band_style: BandStyle,
+    fmt: str = "png",
+) -> bytes:
+    """Evaluate a derived raster within a web mercator tile, colored by a colormap."""
+    data = read_derived_grid(
+        derived, rasters, get_tile_bounds(z, x, y), TILE_CRS, (TILE_SIZE, TILE_SIZE)
+    )
+    return encode_tile_image(apply_band_style(data, band_style), fmt)
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import contextlib
+from typing import TYPE_CHECKING, NamedTuple
+
+import rasterio
+
+from .vsi import open_raster
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+    from django.db.models.fields.files import FieldFile
+    from rasterio.io import DatasetReader
+
+
+class RasterFrame(NamedTuple):
+    dataset: DatasetReader
+    # Indexes of the bands of the frame among the bands of its dataset
+    band_indexes: list[int]
+
+
+def open_frame_pages(dataset: DatasetReader, stack: contextlib.ExitStack) -> list[DatasetReader]:
+    """
+    Open the pages of a multi-page raster, which large_image serves as frames.
+
+    Like large_image, only the subdatasets of the same size and bands as the raster are pages.
+    """
+    pages = []
+    for path in dataset.subdatasets:
+        page = stack.enter_context(rasterio.open(path))
+        if (page.width, page.height, page.count) == (dataset.width, dataset.height, dataset.count):
+            pages.append(page)
+    return pages
+
+
+def get_raster_frames(
+    dataset: DatasetReader, frame_count: int, stack: contextlib.ExitStack
+) -> list[RasterFrame]:
+    """
+    Return the frames of a raster dataset, opening those of other pages within a stack.
+
+    Frames are either the pages of a multi-page raster, or consecutive groups of bands with
+    the same number of bands. Frames stored otherwise can't be read, so only the first frame
+    is returned.
+    """
+    if frame_count > 1 and dataset.subdatasets:
+        pages = open_frame_pages(dataset, stack)
+        if len(pages) >= frame_count:
+            band_indexes = list(range(1, dataset.count + 1))
+            return [RasterFrame(page, band_indexes) for page in pages[:frame_count]]
+    if dataset.count < frame_count:
+        frame_count = 1
+    bands_per_frame = dataset.count // frame_count
+    return [
+        RasterFrame(
+            dataset,
+            list(range(frame * bands_per_frame + 1, (frame + 1) * bands_per_frame + 1)),
+        )
+        for frame in range(frame_count)
+    ]
+
+
+@contextlib.contextmanager
+def open_raster_frames(field_file: FieldFile, frame_count: int) -> Iterator[list[RasterFrame]]:
+    """Open the frames of a stored raster, as configured by `UVDAT_RASTER_READ_MODE`."""
+    with open_raster(field_file) as dataset, contextlib.ExitStack() as stack:
+        yield get_raster_frames(dataset, frame_count, stack)
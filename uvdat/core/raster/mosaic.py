@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from pathlib import Path
+import shutil
+import tempfile
+import time
+from typing import TYPE_CHECKING, NamedTuple
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from osgeo import gdal
+
+from .vsi import get_storage_vsi_path, get_vsi_options, get_vsi_path
+from .window import get_frame_count
+
+if TYPE_CHECKING:
+    from uvdat.core.models import Dataset, RasterData
+
+# Mosaics read with /vsicurl/ reference presigned URLs, which expire, so they are rewritten
+# with new URLs after this many seconds
+MOSAIC_URL_MAX_AGE = 30 * 60
+
+# Overviews of a mosaic are referenced by path from each of its VRTs, since directories
+# aren't listed when opening files with `COG_READ_OPTIONS`
+MOSAIC_OVERVIEW_FILE = "overviews.ovr"
+MOSAIC_OVERVIEW_RESAMPLING = "NEAREST"
+MOSAIC_OVERVIEW_MIN_SIZE = 256
+MOSAIC_OVERVIEW_OPTIONS = {
+    "COMPRESS_OVERVIEW": "DEFLATE",
+    "BIGTIFF_OVERVIEW": "IF_SAFER",
+    "GDAL_NUM_THREADS": "ALL_CPUS",
+}
+
+
+class MosaicError(ValueError):
+    pass
+
+
+class Mosaic(NamedTuple):
+    path: Path
+    # GDAL options to read the rasters of the mosaic
+    options: dict[str, str]
+    # Identifies the rasters of the mosaic and their data versions
+    key: str
+
+
+def get_mosaic_rasters(dataset: Dataset) -> list[RasterData]:
+    """Return the rasters of a dataset which are mosaicked: all converted single-frame rasters."""
+    return [
+        raster_data
+        for raster_data in dataset.rasters.order_by("id")
+        if raster_data.cloud_optimized_geotiff and get_frame_count(raster_data) == 1
+    ]
+
+
+def get_mosaic_key(rasters: list[RasterData]) -> str:
+    identity = [(raster_data.id, raster_data.data_version) for raster_data in rasters]
+    return hashlib.sha256(json.dumps(identity).encode()).hexdigest()[:16]
+
+
+def get_mosaic_read_mode() -> str:
+    # VRTs reference rasters by path, so rasters read locally are mosaicked with presigned URLs
+    return "vsis3" if settings.UVDAT_RASTER_READ_MODE == "vsis3" else "vsicurl"
+
+
+def get_mosaic_directory(dataset: Dataset) -> Path:
+    return Path(settings.UVDAT_MOSAIC_DIR) / f"dataset-{dataset.id}"
+
+
+def get_overview_name(dataset: Dataset, key: str) -> str | None:
+    """Return the name in storage of the overviews of a mosaic, if they were built."""
+    overviews = (dataset.metadata or {}).get("mosaic_overviews") or {}
+    return overviews.get("name") if overviews.get("key") == key else None
+
+
+def write_mosaic_vrt(sources: list[str], vrt_path: Path, overview_file: str | None = None):
+    """
+    Write a VRT mosaic of rasters, at the resolution of the finest raster.
+
+    Rasters in another CRS than the first are warped to it by VRTs of their own, written
+    beside the mosaic. Overviews are read from `overview_file`, if given. The VRT is written
+    to a temporary file, then moved, so that it is never read partially written.
+    """
+    stem = vrt_path.stem
+    paths = []
+    crs = None
+    for i, source in enumerate(sources):
+        dataset = gdal.Open(source)
+        if dataset is None:
+            raise MosaicError(f"Can't read raster {source}.")
+        source_crs = dataset.GetSpatialRef()
+        if crs is None:
+            crs = source_crs
+        if source_crs is not None and not source_crs.IsSame(crs):
+            warped_path = vrt_path.with_name(f"{stem}-{i}.vrt")
+            gdal.Warp(str(warped_path), dataset, format="VRT", dstSRS=crs.ExportToWkt())
+            paths.append(str(warped_path))
+        else:
+            paths.append(source)
+        dataset = None
+
+    fd, temp_path = tempfile.mkstemp(dir=vrt_path.parent, prefix=f"{stem}-", suffix=".vrt")
+    os.close(fd)
+    mosaic = gdal.BuildVRT(temp_path, paths, resolution="highest")
+    if mosaic is None:
+        Path(temp_path).unlink()
+        raise MosaicError("Rasters can't be mosaicked, as they have different bands.")
+    if overview_file is not None:
+        mosaic.SetMetadataItem("OVERVIEW_FILE", overview_file, "OVERVIEWS")
+    # The VRT is written when the dataset is closed
+    mosaic = None
+    Path(temp_path).replace(vrt_path)
+
+
+def remove_stale_mosaics(dataset: Dataset, key: str):
+    """
+    Remove the mosaics of previous data, and VRTs whose presigned URLs have expired.
+
+    Only mosaics in the `UVDAT_MOSAIC_DIR` of this process are removed; overviews in storage
+    are replaced by those of the current data as they are built.
+    """
+    directory = get_mosaic_directory(dataset)
+    if not directory.exists():
+        return
+    key_directory = directory / key
+    for entry in directory.iterdir():
+        if entry.is_dir() and entry != key_directory:
+            shutil.rmtree(entry, ignore_errors=True)
+    for entry in key_directory.glob("mosaic-*.vrt"):
+        try:
+            if entry.stat().st_mtime < time.time() - 2 * MOSAIC_URL_MAX_AGE:
+                entry.unlink()
+        except FileNotFoundError:
+            continue
+
+
+def get_mosaic_options(rasters: list[RasterData]) -> dict[str, str]:
+    """Return the GDAL options to read the rasters of a mosaic."""
+    mode = get_mosaic_read_mode()
+    options = {}
+    for raster_data in rasters:
+        options.update(get_vsi_options(raster_data.cloud_optimized_geotiff.storage, mode))
+    return options
+
+
+def get_mosaic_sources(rasters: list[RasterData]) -> list[str]:
+    """Return the GDAL paths of the rasters of a mosaic."""
+    mode = get_mosaic_read_mode()
+    return [get_vsi_path(raster_data.cloud_optimized_geotiff, mode)[0] for raster_data in rasters]
+
+
+def get_mosaic(dataset: Dataset) -> Mosaic:
+    """
+    Return the VRT mosaic of the single-frame rasters of a dataset, writing it if needed.
+
+    VRTs are written to `UVDAT_MOSAIC_DIR` by the processes serving them, by the rasters and
+    data versions they include, so a mosaic is never served for previous data. VRTs with
+    presigned URLs are named after the period in which they were written, and rewritten in
+    each period. Tile sources are cached by path, so VRTs are also renamed once overviews
+    are built.
+    """
+    rasters = get_mosaic_rasters(dataset)
+    if not rasters:
+        raise MosaicError("The dataset has no rasters to mosaic.")
+    key = get_mosaic_key(rasters)
+    directory = get_mosaic_directory(dataset) / key
+    overview_name = get_overview_name(dataset, key)
+
+    stamp = (
+        "s3" if get_mosaic_read_mode() == "vsis3" else str(int(time.time() // MOSAIC_URL_MAX_AGE))
+    )
+    if overview_name is not None:
+        stamp = f"{stamp}-overviews"
+    vrt_path = directory / f"mosaic-{stamp}.vrt"
+
+    options = get_mosaic_options(rasters)
+    if not vrt_path.exists():
+        overview_file = None
+        if overview_name is not None:
+            overview_file = get_storage_vsi_path(
+                default_storage, overview_name, get_mosaic_read_mode()
+            )[0]
+        directory.mkdir(parents=True, exist_ok=True)
+        with gdal.config_options(options):
+            write_mosaic_vrt(get_mosaic_sources(rasters), vrt_path, overview_file)
+    return Mosaic(vrt_path, options, key)
+
+
+def build_mosaic_overviews(dataset: Dataset) -> str | None:
+    """
+    Build the overviews of the mosaic of a dataset, unless they exist or it is small.
+
+    Without overviews, GDAL reads the overviews of each raster to render zoomed out tiles,
+    which takes requests for every raster in view. Overviews are built in a temporary
+    directory, then saved to the default storage, so that they can be read by every process
+    serving the mosaic, and recorded in the metadata of the dataset. Returns their name in
+    storage.
+    """
+    rasters = get_mosaic_rasters(dataset)
+    if not rasters:
+        raise MosaicError("The dataset has no rasters to mosaic.")
+    key = get_mosaic_key(rasters)
+    remove_stale_mosaics(dataset, key)
+    dataset.refresh_from_db(fields=["metadata"])
+    overview_name = get_overview_name(dataset, key)
+    if overview_name is not None:
+        return overview_name
+
+    with (
+        tempfile.TemporaryDirectory() as build_dir,
+        gdal.config_options({**get_mosaic_options(rasters), **MOSAIC_OVERVIEW_OPTIONS}),
+    ):
+        build_path = Path(build_dir) / "mosaic.vrt"
+        write_mosaic_vrt(
+            get_mosaic_sources(rasters), build_path, f":::BASE:::{MOSAIC_OVERVIEW_FILE}"
+        )
+        vrt = gdal.Open(str(build_path), gdal.GA_Update)
+        factors = []
+        factor = 2
+        while max(vrt.RasterXSize, vrt.RasterYSize) / factor >= MOSAIC_OVERVIEW_MIN_SIZE:
+            factors.append(factor)
+            factor *= 2
+        if not factors:
+            return None
+        vrt.BuildOverviews(MOSAIC_OVERVIEW_RESAMPLING, factors)
+        # The overviews are written when the dataset is closed
+        vrt = None
+        with (Path(build_dir) / MOSAIC_OVERVIEW_FILE).open("rb") as f:
+            overview_name = default_storage.save(
+                f"mosaics/dataset-{dataset.id}/{key}/{MOSAIC_OVERVIEW_FILE}", File(f)
+            )
+
+    # Overviews of previous data are replaced
+    previous_name = ((dataset.metadata or {}).get("mosaic_overviews") or {}).get("name")
+    dataset.metadata = {
+        **(dataset.metadata or {}),
+        "mosaic_overviews": {"key": key, "name": overview_name},
+    }
+    dataset.save(update_fields=["metadata"])
+    if previous_name is not None:
+        default_storage.delete(previous_name)
+    return overview_name
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import io
+from typing import TYPE_CHECKING
+
+import numpy as np
+from rasterio.enums import Resampling
+from rasterio.transform import Affine, from_bounds
+from rasterio.warp import reproject
+
+from uvdat.core.tiles.mercator import WEB_MERCATOR_WIDTH
+
+from .colormap import apply_band_style
+from .frames import open_raster_frames
+from .window import RasterWindowError, get_bbox_window, get_frame_band, get_frame_count
+
+if TYPE_CHECKING:
+    from rasterio.io import DatasetReader
+
+    from uvdat.core.models import RasterData
+
+    from .colormap import BandStyle
+
+TILE_SIZE = 256
+TILE_CRS = "EPSG:3857"
+
+# Image formats of styled tiles, which have an alpha channel
+STYLED_TILE_FORMATS = {"png": ("PNG", "image/png"), "webp": ("WEBP", "image/webp")}
+
+
+def get_tile_bounds(z: int, x: int, y: int) -> tuple[float, float, float, float]:
+    """Return the web mercator bounds of a tile."""
+    tile_width = WEB_MERCATOR_WIDTH / 2**z
+    origin = WEB_MERCATOR_WIDTH / 2
+    return (
+        x * tile_width - origin,
+        origin - (y + 1) * tile_width,
+        (x + 1) * tile_width - origin,
+        origin - y * tile_width,
+    )
+
+
+def warp_band(
+    dataset: DatasetReader,
+    band_index: int,
+    bounds: tuple[float, float, float, float],
+    crs: str,
+    shape: tuple[int, int],
+) -> np.ma.MaskedArray:
+    """
+    Read a band of a dataset warped to a grid, of a shape within bounds in a CRS.
+
+    Pixels out of the dataset, or without data, are masked.
+    """
+    if dataset.crs is None:
+        raise RasterWindowError("The raster is not georeferenced.")
+    grid = np.ma.masked_all(shape, dtype=dataset.dtypes[band_index - 1])
+    try:
+        window = get_bbox_window(dataset, bounds, crs)
+    except RasterWindowError:
+        return grid
+
+    # The window is read from the closest overview at twice the resolution of the grid, and
+    # warped in memory, so that coarse grids don't read the raster at full resolution
+    scale = min(1.0, 2 * max(shape) / max(window.width, window.height))
+    out_shape = (max(1, round(window.height * scale)), max(1, round(window.width * scale)))
+    data = dataset.read(
+        band_index,
+        window=window,
+        out_shape=out_shape,
+        resampling=Resampling.nearest,
+        masked=True,
+    )
+    warp_options = {
+        "src_transform": dataset.window_transform(window)
+        * Affine.scale(window.width / out_shape[1], window.height / out_shape[0]),
+        "src_crs": dataset.crs,
+        "dst_transform": from_bounds(*bounds, shape[1], shape[0]),
+        "dst_crs": crs,
+        "resampling": Resampling.nearest,
+    }
+    reproject(data.filled(0), grid.data, **warp_options)
+    valid = np.zeros(shape, dtype=np.uint8)
+    reproject((~np.ma.getmaskarray(data)).astype(np.uint8), valid, **warp_options)
+    grid.mask = valid == 0
+    return grid
+
+
+def encode_tile_image(rgba: np.ndarray, fmt: str) -> bytes:
+    """Encode an RGBA tile in one of `STYLED_TILE_FORMATS`."""
+    # Installed with large-image
+    from PIL import Image  # noqa: PLC0415
+
+    output = io.BytesIO()
+    Image.fromarray(rgba, "RGBA").save(output, format=STYLED_TILE_FORMATS[fmt][0])
+    return output.getvalue()
+
+
+def read_raster_tile(  # noqa: PLR0913
+    raster_data: RasterData,
+    z: int,
+    x: int,
+    y: int,
+    *,
+    bands: list[int],
+    frame: int = 0,
+) -> list[np.ma.MaskedArray]:
+    """
+    Read bands of a RasterData within a web mercator tile, warped to the pixels of the tile.
+
+    Pixels out of the raster, or without data, are masked.
+    """
+    bounds = get_tile_bounds(z, x, y)
+    with open_raster_frames(
+        raster_data.cloud_optimized_geotiff, get_frame_count(raster_data)
+    ) as frames:
+        tiles = []
+        for band in bands:
+            dataset, band_index = get_frame_band(frames, raster_data, band, frame)
+            tiles.append(warp_band(dataset, band_index, bounds, TILE_CRS, (TILE_SIZE, TILE_SIZE)))
+    return tiles
+
+
+def render_raster_tile(  # noqa: PLR0913
+    raster_data: RasterData,
+    z: int,
+    x: int,
+    y: int,
+    *,
+    band_styles: list[BandStyle],
+    frame: int = 0,
+    fmt: str = "png",
+) -> bytes:
+    """
+    Render a web mercator tile of a RasterData, coloring bands by colormaps.
+
+    Bands are colored through the lookup tables of their colormaps, and composited by
+    keeping the lightest value of each channel.
+    """
+    rgba = np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8)
+    tiles = read_raster_tile(
+        raster_data, z, x, y, bands=[style.band for style in band_styles], frame=frame
+    )
+    for tile, style in zip(tiles, band_styles, strict=True):
+        np.maximum(rgba, apply_band_style(tile, style), out=rgba)
+    return encode_tile_image(rgba, fmt)
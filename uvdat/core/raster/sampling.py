@@ -0,0 +1,286 @@
+from __future__ import annotations
+
+from collections import defaultdict
+import itertools
+import json
+import math
+from operator import itemgetter
+from typing import TYPE_CHECKING
+
+from django.contrib.gis.gdal import GDALException
+from django.contrib.gis.geos import GEOSException, GEOSGeometry, Point
+import numpy as np
+from rasterio.features import bounds as geometry_bounds
+from rasterio.features import geometry_mask
+from rasterio.warp import transform, transform_geom
+from rasterio.windows import Window
+
+from .frames import open_raster_frames
+from .window import RasterWindowError, get_frame_band, get_frame_count
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+
+    from rasterio.io import DatasetReader
+
+    from uvdat.core.models import RasterData
+
+# Rasters are read in chunks of whole blocks, at least this many pixels wide and high
+SAMPLE_CHUNK_SIZE = 512
+
+MAX_SAMPLE_POINTS = 100_000
+MAX_SAMPLE_ZONES = 1000
+
+
+class _ZoneStats:
+    """Statistics of a zone in each frame, accumulated over the chunks it covers."""
+
+    def __init__(self, frame_count: int):
+        self.count = np.zeros(frame_count, dtype=np.int64)
+        self.count_above = np.zeros(frame_count, dtype=np.int64)
+        self.sum = np.zeros(frame_count)
+        self.min = np.full(frame_count, math.inf)
+        self.max = np.full(frame_count, -math.inf)
+
+    def add(self, values: np.ma.MaskedArray, threshold: float | None):
+        # Values are of shape (frames, pixels)
+        self.count += values.count(axis=1)
+        self.sum += values.sum(axis=1).filled(0)
+        self.min = np.minimum(self.min, values.min(axis=1).filled(math.inf))
+        self.max = np.maximum(self.max, values.max(axis=1).filled(-math.inf))
+        if threshold is not None:
+            self.count_above += (values > threshold).sum(axis=1).filled(0)
+
+    def as_list(self, threshold: float | None) -> list[dict]:
+        stats = []
+        for i, count in enumerate(self.count.tolist()):
+            frame_stats = {
+                "count": count,
+                "sum": float(self.sum[i]),
+                "min": float(self.min[i]) if count else None,
+                "max": float(self.max[i]) if count else None,
+                "mean": float(self.sum[i] / count) if count else None,
+            }
+            if threshold is not None:
+                frame_stats["count_above"] = int(self.count_above[i])
+            stats.append(frame_stats)
+        return stats
+
+
+def _parse_list(data: dict, name: str) -> list:
+    value = data.get(name) or []
+    if not isinstance(value, list):
+        raise RasterWindowError(f"{name} must be a list.")
+    return value
+
+
+def parse_sample_options(data: dict) -> dict:
+    """
+    Parse the body of a sampling request into the options of `sample_raster`.
+
+    Points are `[x, y]` pairs and zones are GeoJSON geometries, both in the spatial reference
+    of the `srid` (4326 by default).
+    """
+    try:
+        srid = int(data.get("srid", 4326))
+        points = [Point(float(x), float(y), srid=srid) for x, y in _parse_list(data, "points")]
+        zones = []
+        for geometry in _parse_list(data, "geometries"):
+            zone = GEOSGeometry(json.dumps(geometry))
+            zone.srid = srid
+            zones.append(zone)
+        frames = data.get("frames")
+        threshold = data.get("threshold")
+        return {
+            "points": points,
+            "zones": zones,
+            "band": int(data.get("band", 1)),
+            "frames": None if frames is None else [int(f) for f in frames],
+            "threshold": None if threshold is None else float(threshold),
+        }
+    except (GEOSException, GDALException, TypeError, ValueError) as e:
+        raise RasterWindowError(f"Invalid sampling request: {e}") from None
+
+
+def _get_chunk_shape(dataset: DatasetReader) -> tuple[int, int]:
+    block_height, block_width = dataset.block_shapes[0]
+    return (
+        math.ceil(SAMPLE_CHUNK_SIZE / block_height) * block_height,
+        math.ceil(SAMPLE_CHUNK_SIZE / block_width) * block_width,
+    )
+
+
+def _to_dataset_crs(dataset: DatasetReader, geometry: GEOSGeometry) -> dict:
+    geojson = json.loads(geometry.json)
+    if dataset.crs is None:
+        return geojson
+    return transform_geom(f"EPSG:{geometry.srid or 4326}", dataset.crs, geojson)
+
+
+def _locate_points(dataset: DatasetReader, points: Sequence[Point]) -> tuple[np.ndarray, ...]:
+    """Return the rows and columns of points in a dataset, with a mask of those within it."""
+    xs = np.empty(len(points))
+    ys = np.empty(len(points))
+    by_srid = defaultdict(list)
+    for i, point in enumerate(points):
+        by_srid[point.srid or 4326].append(i)
+        xs[i], ys[i] = point.coords[:2]
+    if dataset.crs is not None:
+        # Points are transformed in bulk, for each of their spatial references
+        for srid, indexes in by_srid.items():
+            xs[indexes], ys[indexes] = transform(
+                f"EPSG:{srid}", dataset.crs, xs[indexes], ys[indexes]
+            )
+    cols, rows = ~dataset.transform * (xs, ys)
+    rows = np.floor(rows)
+    cols = np.floor(cols)
+    inside = (
+        np.isfinite(rows)
+        & np.isfinite(cols)
+        & (rows >= 0)
+        & (rows < dataset.height)
+        & (cols >= 0)
+        & (cols < dataset.width)
+    )
+    rows = np.where(inside, rows, 0).astype(np.int64)
+    cols = np.where(inside, cols, 0).astype(np.int64)
+    return rows, cols, inside
+
+
+def _zone_chunks(
+    dataset: DatasetReader, geojson: dict, chunk_shape: tuple[int, int]
+) -> list[tuple[int, int]]:
+    """Return the chunks intersecting the bounds of a zone."""
+    left, bottom, right, top = geometry_bounds(geojson)
+    inverse = ~dataset.transform
+    corners = [inverse * (x, y) for x in (left, right) for y in (bottom, top)]
+    cols = [c for c, _r in corners]
+    rows = [r for _c, r in corners]
+    row_start = max(math.floor(min(rows)), 0)
+    row_stop = min(math.ceil(max(rows)), dataset.height)
+    col_start = max(math.floor(min(cols)), 0)
+    col_stop = min(math.ceil(max(cols)), dataset.width)
+    if row_start >= row_stop or col_start >= col_stop:
+        return []
+    chunk_height, chunk_width = chunk_shape
+    return [
+        (chunk_row, chunk_col)
+        for chunk_row in range(row_start // chunk_height, (row_stop - 1) // chunk_height + 1)
+        for chunk_col in range(col_start // chunk_width, (col_stop - 1) // chunk_width + 1)
+    ]
+
+
+def _group_points(
+    dataset: DatasetReader, points: Sequence[Point], chunk_shape: tuple[int, int]
+) -> tuple[np.ndarray, np.ndarray, dict[tuple[int, int], list[int]]]:
+    """Locate points in a dataset, and group the indexes of those within it by chunk."""
+    chunk_points = defaultdict(list)
+    if not points:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), chunk_points
+    rows, cols, inside = _locate_points(dataset, points)
+    chunk_height, chunk_width = chunk_shape
+    for i in np.flatnonzero(inside).tolist():
+        chunk_points[rows[i] // chunk_height, cols[i] // chunk_width].append(i)
+    return rows, cols, chunk_points
+
+
+def _read_chunk(
+    frame_bands: list[tuple[DatasetReader, int]],
+    chunk: tuple[int, int],
+    chunk_shape: tuple[int, int],
+) -> tuple[np.ma.MaskedArray, Window]:
+    """
+    Read a chunk of a band in each frame, masking pixels without data or which aren't finite.
+
+    Bands of frames stored in the same dataset are read together.
+    """
+    dataset = frame_bands[0][0]
+    chunk_height, chunk_width = chunk_shape
+    row_off, col_off = chunk[0] * chunk_height, chunk[1] * chunk_width
+    window = Window(
+        col_off,
+        row_off,
+        min(chunk_width, dataset.width - col_off),
+        min(chunk_height, dataset.height - row_off),
+    )
+    reads = []
+    for frame_dataset, band_indexes in itertools.groupby(frame_bands, key=itemgetter(0)):
+        indexes = [band_index for _dataset, band_index in band_indexes]
+        reads.append(frame_dataset.read(indexes, window=window, masked=True))
+    return np.ma.masked_invalid(np.ma.concatenate(reads)), window
+
+
+def sample_raster(  # noqa: PLR0913
+    raster_data: RasterData,
+    *,
+    points: Sequence[Point] = (),
+    zones: Sequence[GEOSGeometry] = (),
+    band: int = 1,
+    frames: Sequence[int] | None = None,
+    threshold: float | None = None,
+) -> dict:
+    """
+    Sample a band of a RasterData at points, and compute its statistics within zones.
+
+    Points and zones are grouped by the chunks of whole raster blocks they cover, and each
+    chunk is read once, for all frames. Frames default to all the frames of the raster.
+
+    Returns the sampled `frames`, the values of each point in each frame (None outside the
+    raster or without data), and the statistics of each zone in each frame: the `count` of
+    pixels with data whose centers are within the zone, their `sum`, `min`, `max` and `mean`,
+    and if a `threshold` is given, the number of pixels above it as `count_above`.
+    """
+    if len(points) > MAX_SAMPLE_POINTS:
+        raise RasterWindowError(f"At most {MAX_SAMPLE_POINTS} points may be sampled.")
+    if len(zones) > MAX_SAMPLE_ZONES:
+        raise RasterWindowError(f"At most {MAX_SAMPLE_ZONES} zones may be sampled.")
+
+    frame_count = get_frame_count(raster_data)
+    with open_raster_frames(raster_data.cloud_optimized_geotiff, frame_count) as raster_frames:
+        # Frames default to those which can be read
+        frames = list(range(len(raster_frames)) if frames is None else frames)
+        if not frames:
+            raise RasterWindowError("At least one frame is required.")
+        frame_bands = [get_frame_band(raster_frames, raster_data, band, f) for f in frames]
+        dataset = raster_frames[0].dataset
+        chunk_shape = _get_chunk_shape(dataset)
+
+        rows, cols, chunk_points = _group_points(dataset, points, chunk_shape)
+        point_values = np.full((len(points), len(frames)), np.nan)
+        point_valid = np.zeros((len(points), len(frames)), dtype=bool)
+
+        zone_geometries = [_to_dataset_crs(dataset, zone) for zone in zones]
+        zone_stats = [_ZoneStats(len(frames)) for _zone in zones]
+        chunk_zones = defaultdict(list)
+        for i, geojson in enumerate(zone_geometries):
+            for chunk in _zone_chunks(dataset, geojson, chunk_shape):
+                chunk_zones[chunk].append(i)
+
+        for chunk in sorted(chunk_points.keys() | chunk_zones.keys()):
+            data, window = _read_chunk(frame_bands, chunk, chunk_shape)
+
+            indexes = chunk_points.get(chunk)
+            if indexes:
+                values = data[:, rows[indexes] - window.row_off, cols[indexes] - window.col_off]
+                point_values[indexes] = values.filled(np.nan).T
+                point_valid[indexes] = ~np.ma.getmaskarray(values).T
+
+            window_transform = dataset.window_transform(window)
+            for i in chunk_zones.get(chunk, []):
+                mask = geometry_mask(
+                    [zone_geometries[i]],
+                    out_shape=data.shape[1:],
+                    transform=window_transform,
+                    invert=True,
+                )
+                if mask.any():
+                    zone_stats[i].add(data[:, mask], threshold)
+
+    return {
+        "frames": frames,
+        "points": [
+            [float(v) if valid else None for v, valid in zip(values, valid_row, strict=True)]
+            for values, valid_row in zip(point_values.tolist(), point_valid.tolist(), strict=True)
+        ],
+        "zones": [stats.as_list(threshold) for stats in zone_stats],
+    }
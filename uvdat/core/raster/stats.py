@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import contextlib
+import math
+from typing import TYPE_CHECKING
+
+from django.db import transaction
+import numpy as np
+from rasterio.enums import Resampling
+from rasterio.windows import Window
+
+from .frames import get_raster_frames
+from .vsi import open_raster
+from .window import get_frame_count
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+    from rasterio.io import DatasetReader
+
+    from uvdat.core.models import RasterData
+
+# Statistics are computed from the overview closest to this number of pixels
+STATS_MAX_PIXELS = 4096 * 4096
+
+# Rows of the overview read at a time
+STATS_STRIP_ROWS = 256
+
+STATS_HISTOGRAM_BINS = 256
+STATS_PERCENTILES = (2, 25, 50, 75, 98)
+
+
+def get_stats_decimation(dataset: DatasetReader) -> int:
+    """Return the decimation factor of the overview to compute statistics from."""
+    needed = math.ceil(math.sqrt(dataset.width * dataset.height / STATS_MAX_PIXELS))
+    if needed <= 1:
+        return 1
+    # The smallest overview with few enough pixels, if there's one
+    for factor in sorted(dataset.overviews(1)):
+        if factor >= needed:
+            return factor
+    return needed
+
+
+def _iter_values(dataset: DatasetReader, band_index: int, decimation: int) -> Iterator[np.ndarray]:
+    """Iterate over the valid values of a band at a decimation, a strip of rows at a time."""
+    out_width = math.ceil(dataset.width / decimation)
+    strip_height = STATS_STRIP_ROWS * decimation
+    for row in range(0, dataset.height, strip_height):
+        height = min(strip_height, dataset.height - row)
+        data = dataset.read(
+            band_index,
+            window=Window(0, row, dataset.width, height),
+            out_shape=(math.ceil(height / decimation), out_width),
+            resampling=Resampling.nearest,
+            masked=True,
+        )
+        values = data.compressed().astype(np.float64)
+        yield values[np.isfinite(values)]
+
+
+def _percentiles(histogram: np.ndarray, edges: np.ndarray, count: int) -> dict[str, float]:
+    """Estimate percentiles from a histogram, interpolating within bins."""
+    cumulative = np.cumsum(histogram)
+    percentiles = {}
+    for percentile in STATS_PERCENTILES:
+        target = count * percentile / 100
+        i = min(int(np.searchsorted(cumulative, target)), len(histogram) - 1)
+        below = cumulative[i - 1] if i else 0
+        fraction = (target - below) / histogram[i] if histogram[i] else 0
+        percentiles[str(percentile)] = float(edges[i] + fraction * (edges[i + 1] - edges[i]))
+    return percentiles
+
+
+def compute_band_stats(dataset: DatasetReader, band_index: int, decimation: int) -> dict:
+    """
+    Compute the statistics of a band in two streaming passes over an overview.
+
+    The first pass finds the count, extrema, mean and standard deviation of valid values; the
+    second fills a histogram between the extrema, from which percentiles are estimated.
+    """
+    count, total, total_squares = 0, 0.0, 0.0
+    minimum, maximum = math.inf, -math.inf
+    for values in _iter_values(dataset, band_index, decimation):
+        if values.size:
+            count += values.size
+            total += values.sum()
+            total_squares += np.square(values).sum()
+            minimum = min(minimum, values.min())
+            maximum = max(maximum, values.max())
+    if not count:
+        return {"count": 0}
+
+    edges = np.linspace(
+        minimum, maximum if maximum > minimum else minimum + 1, STATS_HISTOGRAM_BINS + 1
+    )
+    histogram = np.zeros(STATS_HISTOGRAM_BINS, dtype=np.int64)
+    for values in _iter_values(dataset, band_index, decimation):
+        histogram += np.histogram(values, bins=edges)[0]
+
+    mean = total / count
+    return {
+        "count": count,
+        "min": float(minimum),
+        "max": float(maximum),
+        "mean": float(mean),
+        "std": math.sqrt(max(total_squares / count - mean**2, 0)),
+        "percentiles": _percentiles(histogram, edges, count),
+        "histogram": {
+            "min": float(edges[0]),
+            "max": float(edges[-1]),
+            "counts": histogram.tolist(),
+        },
+    }
+
+
+def compute_raster_stats(dataset: DatasetReader, frame_count: int = 1) -> list[dict]:
+    """Compute the statistics of each band of each frame of a raster dataset."""
+    with contextlib.ExitStack() as stack:
+        frames = get_raster_frames(dataset, frame_count, stack)
+        decimation = get_stats_decimation(dataset)
+        return [
+            {
+                "frame": frame,
+                "band": band,
+                "decimation": decimation,
+                **compute_band_stats(frame_dataset, band_index, decimation),
+            }
+            for frame, (frame_dataset, band_indexes) in enumerate(frames)
+            for band, band_index in enumerate(band_indexes, start=1)
+        ]
+
+
+def get_raster_stats(raster_data: RasterData) -> list[dict]:
+    """
+    Return the statistics of a RasterData, stored in its metadata at conversion.
+
+    Statistics of rasters converted before they were computed are computed and stored now.
+    They are stored into the current metadata under a row lock, so that concurrent requests
+    don't overwrite each other's changes to the metadata.
+    """
+    stats = (raster_data.metadata or {}).get("stats")
+    if stats is not None:
+        return stats
+
+    with open_raster(raster_data.cloud_optimized_geotiff) as dataset:
+        stats = compute_raster_stats(dataset, get_frame_count(raster_data))
+    with transaction.atomic():
+        locked = (
+            type(raster_data).objects.select_for_update().only("metadata").get(pk=raster_data.pk)
+        )
+        metadata = locked.metadata or {}
+        # Statistics stored by a concurrent request are kept
+        if "stats" not in metadata:
+            metadata["stats"] = stats
+            locked.metadata = metadata
+            locked.save(update_fields=["metadata"])
+    raster_data.metadata = metadata
+    return metadata["stats"]
+
+
+def get_value_range(raster_data: RasterData, band: int = 1) -> list[float] | None:
+    """
+    Return the range of a band over all frames, between its 2nd and 98th percentiles.
+
+    Returns None if there are no statistics of every frame.
+    """
+    stats = (raster_data.metadata or {}).get("stats") or []
+    band_stats = [s for s in stats if s["band"] == band and s["count"]]
+    if len({s["frame"] for s in band_stats}) < get_frame_count(raster_data):
+        return None
+    return [
+        min(s["percentiles"]["2"] for s in band_stats),
+        max(s["percentiles"]["98"] for s in band_stats),
+    ]
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import contextlib
+from typing import TYPE_CHECKING
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import default_storage
+from osgeo import gdal
+import rasterio
+
+from uvdat.core.file_cache import cached_local_path
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+    from django.core.files.storage import Storage
+    from django.db.models.fields.files import FieldFile
+    from rasterio.io import DatasetReader
+
+# Ways of reading stored rasters: through GDAL's S3 or HTTP virtual file systems, with range
+# requests, or from a local copy in the shared file cache
+RASTER_READ_MODES = {"vsis3", "vsicurl", "local"}
+
+# GDAL options tuned for reading COGs with range requests: the header is read with the first
+# request, sibling files aren't listed, consecutive blocks are merged into one request, and
+# blocks are cached per file and across files.
+COG_READ_OPTIONS = {
+    "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",
+    "GDAL_INGESTED_BYTES_AT_OPEN": "32768",
+    "GDAL_HTTP_MERGE_CONSECUTIVE_RANGES": "YES",
+    "GDAL_HTTP_MULTIPLEX": "YES",
+    "VSI_CACHE": "TRUE",
+    "VSI_CACHE_SIZE": str(32 * 1024**2),
+    "CPL_VSIL_CURL_CACHE_SIZE": str(256 * 1024**2),
+}
+
+
+def get_s3_options(storage: Storage) -> tuple[str, str, dict[str, str]]:
+    """Return the bucket, key prefix and GDAL options to read the objects of a storage."""
+    if hasattr(storage, "endpoint_url"):
+        # django-storages S3 storage
+        options = {"AWS_REGION": storage.region_name or "us-east-1"}
+        if storage.access_key and storage.secret_key:
+            options["AWS_ACCESS_KEY_ID"] = storage.access_key
+            options["AWS_SECRET_ACCESS_KEY"] = storage.secret_key
+        if storage.endpoint_url:
+            endpoint = urlsplit(storage.endpoint_url)
+            options["AWS_S3_ENDPOINT"] = endpoint.netloc
+            options["AWS_HTTPS"] = "YES" if endpoint.scheme == "https" else "NO"
+        return storage.bucket_name, storage.location, options
+    if hasattr(settings, "MINIO_STORAGE_ENDPOINT"):
+        # MinIO storage, in development and testing
+        return (
+            storage.bucket_name,
+            "",
+            {
+                "AWS_S3_ENDPOINT": settings.MINIO_STORAGE_ENDPOINT,
+                "AWS_HTTPS": "YES" if settings.MINIO_STORAGE_USE_HTTPS else "NO",
+                "AWS_VIRTUAL_HOSTING": "FALSE",
+                "AWS_ACCESS_KEY_ID": settings.MINIO_STORAGE_ACCESS_KEY,
+                "AWS_SECRET_ACCESS_KEY": settings.MINIO_STORAGE_SECRET_KEY,
+                "AWS_REGION": "us-east-1",
+            },
+        )
+    raise ImproperlyConfigured(f"Rasters can't be read with /vsis3/ from {storage}.")
+
+
+def get_vsi_options(storage: Storage, mode: str | None = None) -> dict[str, str]:
+    """Return the GDAL options to read the files of a storage with range requests."""
+    mode = mode or settings.UVDAT_RASTER_READ_MODE
+    if mode == "vsis3":
+        return {**COG_READ_OPTIONS, **get_s3_options(storage)[2]}
+    if mode == "vsicurl":
+        return COG_READ_OPTIONS
+    raise ImproperlyConfigured(f'Rasters can\'t be read with range requests in "{mode}" mode.')
+
+
+def get_storage_vsi_path(
+    storage: Storage, name: str, mode: str | None = None
+) -> tuple[str, dict[str, str]]:
+    """Return a GDAL path reading a file of a storage with range requests, and its options."""
+    mode = mode or settings.UVDAT_RASTER_READ_MODE
+    options = get_vsi_options(storage, mode)
+    if mode == "vsis3":
+        bucket, prefix, _ = get_s3_options(storage)
+        key = f"{prefix.strip('/')}/{name}".lstrip("/")
+        return f"/vsis3/{bucket}/{key}", options
+    return f"/vsicurl/{storage.url(name)}", options
+
+
+def get_vsi_path(field_file: FieldFile, mode: str | None = None) -> tuple[str, dict[str, str]]:
+    """
+    Return a GDAL path reading a stored file with range requests, and its GDAL options.
+
+    Depending on `mode`, `UVDAT_RASTER_READ_MODE` by default, files are read with `/vsis3/`
+    and the storage credentials, or with `/vsicurl/` and a presigned URL.
+    """
+    return get_storage_vsi_path(field_file.storage, field_file.name, mode)
+
+
+def configure_gdal():
+    """
+    Set the GDAL options to read stored rasters with range requests, for the process.
+
+    Readers such as django-large-image don't take options per dataset, so they are set once at
+    startup rather than on each request; in "vsis3" mode, they include the storage credentials.
+    """
+    options = dict(COG_READ_OPTIONS)
+    if settings.UVDAT_RASTER_READ_MODE == "vsis3":
+        options.update(get_s3_options(default_storage)[2])
+    for key, value in options.items():
+        gdal.SetConfigOption(key, value)
+
+
+@contextlib.contextmanager
+def open_raster(field_file: FieldFile) -> Iterator[DatasetReader]:
+    """Open a stored raster with rasterio, as configured by `UVDAT_RASTER_READ_MODE`."""
+    mode = settings.UVDAT_RASTER_READ_MODE
+    if mode not in RASTER_READ_MODES:
+        raise ImproperlyConfigured(f'Invalid raster read mode "{mode}".')
+    if mode == "local":
+        with cached_local_path(field_file) as path, rasterio.open(path) as dataset:
+            yield dataset
+    else:
+        path, options = get_vsi_path(field_file)
+        with rasterio.Env(**options), rasterio.open(path) as dataset:
+            yield dataset
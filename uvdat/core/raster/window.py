@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import math
+from typing import TYPE_CHECKING, NamedTuple
+
+import numpy as np
+from rasterio.crs import CRS
+from rasterio.enums import Resampling
+from rasterio.errors import CRSError, WindowError
+from rasterio.warp import transform_bounds
+from rasterio.windows import Window, from_bounds
+
+from .frames import open_raster_frames
+
+if TYPE_CHECKING:
+    from rasterio.io import DatasetReader
+
+    from uvdat.core.models import RasterData
+
+    from .frames import RasterFrame
+
+# Data types of encoded windows, which are always little-endian
+RASTER_DTYPES = {"float32": "<f4", "uint16": "<u2"}
+
+# Windows are resampled so that their largest dimension is at most this size
+DEFAULT_TARGET_SIZE = 512
+MAX_TARGET_SIZE = 4096
+
+
+class RasterWindowError(ValueError):
+    pass
+
+
+class RasterWindow(NamedTuple):
+    data: np.ma.MaskedArray
+    # Bounds of the window, in the CRS of the requested bbox
+    bounds: tuple[float, float, float, float]
+
+
+def _parse_int(params: dict, name: str, default: int) -> int:
+    value = params.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise RasterWindowError(f'Invalid {name} "{value}".') from None
+
+
+def parse_bbox(value: str) -> tuple[float, float, float, float]:
+    """Parse a `xmin,ymin,xmax,ymax` bounding box."""
+    try:
+        bbox = tuple(float(v) for v in value.split(","))
+    except ValueError:
+        bbox = ()
+    if len(bbox) != 4 or not all(math.isfinite(v) for v in bbox):
+        raise RasterWindowError(f'Invalid bbox "{value}".')
+    if bbox[0] >= bbox[2] or bbox[1] >= bbox[3]:
+        raise RasterWindowError(f'Empty bbox "{value}".')
+    return bbox
+
+
+def parse_crs(value: str) -> str:
+    """Check that a spatial reference, such as an EPSG code or a WKT string, is known."""
+    try:
+        CRS.from_user_input(value)
+    except CRSError:
+        raise RasterWindowError(f'Invalid bbox_srs "{value}".') from None
+    return value
+
+
+def parse_window_options(params: dict) -> tuple[dict, str]:
+    """
+    Parse the query parameters of a raster data request.
+
+    Returns the options of `read_raster_window`, and the data type to encode the window with.
+    """
+    dtype = params.get("dtype", "float32")
+    if dtype not in RASTER_DTYPES:
+        raise RasterWindowError(f'Invalid dtype "{dtype}".')
+    size = _parse_int(params, "size", DEFAULT_TARGET_SIZE)
+    if not 0 < size <= MAX_TARGET_SIZE:
+        raise RasterWindowError(f"Size must be between 1 and {MAX_TARGET_SIZE}.")
+    options = {
+        "bbox": parse_bbox(params["bbox"]) if params.get("bbox") else None,
+        "bbox_srs": parse_crs(params.get("bbox_srs") or "EPSG:4326"),
+        "band": _parse_int(params, "band", 1),
+        "frame": _parse_int(params, "frame", 0),
+        "size": size,
+    }
+    return options, dtype
+
+
+def get_frame_count(raster_data: RasterData) -> int:
+    return len((raster_data.metadata or {}).get("frames") or []) or 1
+
+
+def get_frame_band(
+    frames: list[RasterFrame], raster_data: RasterData, band: int, frame: int
+) -> tuple[DatasetReader, int]:
+    """Return the dataset of a frame, and the index of one of its bands in that dataset."""
+    frame_count = get_frame_count(raster_data)
+    if not 0 <= frame < frame_count:
+        raise RasterWindowError(f"Frame must be between 0 and {frame_count - 1}.")
+    if frame >= len(frames):
+        raise RasterWindowError(f"Frame {frame} can't be read from the raster.")
+    dataset, band_indexes = frames[frame]
+    if not 1 <= band <= len(band_indexes):
+        raise RasterWindowError(f"Band must be between 1 and {len(band_indexes)}.")
+    return dataset, band_indexes[band - 1]
+
+
+def get_bbox_window(
+    dataset: DatasetReader, bbox: tuple[float, float, float, float], bbox_srs: str
+) -> Window:
+    """Return the window of whole pixels of a dataset covering a bounding box."""
+    if dataset.crs is not None:
+        try:
+            bbox = transform_bounds(bbox_srs, dataset.crs, *bbox)
+        except CRSError:
+            raise RasterWindowError(f'Invalid bbox_srs "{bbox_srs}".') from None
+    window = from_bounds(*bbox, transform=dataset.transform)
+    try:
+        return (
+            window.round_offsets(op="floor")
+            .round_lengths(op="ceil")
+            .intersection(Window(0, 0, dataset.width, dataset.height))
+        )
+    except WindowError:
+        raise RasterWindowError("The bbox does not intersect the raster.") from None
+
+
+def read_raster_window(  # noqa: PLR0913
+    raster_data: RasterData,
+    *,
+    bbox: tuple[float, float, float, float] | None = None,
+    bbox_srs: str = "EPSG:4326",
+    band: int = 1,
+    frame: int = 0,
+    size: int | None = DEFAULT_TARGET_SIZE,
+) -> RasterWindow:
+    """
+    Read a band of a RasterData within a bounding box, resampled to at most `size` pixels wide.
+
+    Unless rasters are read from local copies, only the blocks of the window are read,
+    with range requests. When the window is
+    resampled, GDAL reads it from the closest overview of the COG rather than from its full
+    resolution. A `size` of None reads the window at full resolution. Pixels without data
+    are masked.
+    """
+    with open_raster_frames(
+        raster_data.cloud_optimized_geotiff, get_frame_count(raster_data)
+    ) as frames:
+        dataset, band_index = get_frame_band(frames, raster_data, band, frame)
+        window = Window(0, 0, dataset.width, dataset.height)
+        if bbox is not None:
+            window = get_bbox_window(dataset, bbox, bbox_srs)
+
+        scale = 1.0
+        if size is not None:
+            scale = min(1.0, size / max(window.width, window.height))
+        out_shape = (
+            max(1, round(window.height * scale)),
+            max(1, round(window.width * scale)),
+        )
+        data = dataset.read(
+            band_index,
+            window=window,
+            out_shape=out_shape,
+            resampling=Resampling.nearest,
+            masked=True,
+        )
+        bounds = dataset.window_bounds(window)
+        if dataset.crs is not None:
+            bounds = transform_bounds(dataset.crs, bbox_srs, *bounds)
+    return RasterWindow(data, bounds)
+
+
+def encode_raster_window(window: RasterWindow, dtype: str) -> bytes:
+    """
+    Encode the data of a window as a row-major, little-endian array.
+
+    Masked pixels are NaN in float32 arrays, and 0 in uint16 arrays, where values are
+    rounded and clipped to the range of the type.
+    """
+    data = window.data
+    if dtype == "uint16":
+        limits = np.iinfo(np.uint16)
+        data = np.ma.clip(np.ma.round(data), limits.min, limits.max)
+        values = data.astype(RASTER_DTYPES[dtype]).filled(0)
+    else:
+        values = data.astype(RASTER_DTYPES[dtype]).filled(np.nan)
+    return values.tobytes()
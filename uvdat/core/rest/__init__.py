@@ -4,7 +4,7 @@ from .analytics import AnalyticsViewSet
 from .basemap import BasemapViewSet
 from .chart import ChartViewSet
 from .colormap import ColormapViewSet
-from .data import RasterDataViewSet, VectorDataViewSet
+from .data import DerivedRasterDataViewSet, MosaicViewSet, RasterDataViewSet, VectorDataViewSet
 from .dataset import DatasetViewSet
 from .file_item import FileItemViewSet
 from .layer import LayerFrameViewSet, LayerStyleViewSet, LayerViewSet
@@ -20,10 +20,12 @@ __all__ = [
     "ChartViewSet",
     "ColormapViewSet",
     "DatasetViewSet",
+    "DerivedRasterDataViewSet",
     "FileItemViewSet",
     "LayerFrameViewSet",
     "LayerStyleViewSet",
     "LayerViewSet",
+    "MosaicViewSet",
     "NetworkViewSet",
     "ProjectViewSet",
     "RasterDataViewSet",
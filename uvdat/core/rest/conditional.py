@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import hashlib
+from typing import TYPE_CHECKING
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+    import datetime
+
+    from django.http import HttpResponseBase
+
+# Responses for URLs naming the current data version never change
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def make_etag(*parts) -> str:
+    """Return a strong ETag identifying a response by the parts it is derived from."""
+    digest = hashlib.sha256(":".join(str(part) for part in parts).encode()).hexdigest()
+    return quote_etag(digest[:32])
+
+
+def is_current_version(request, *data) -> bool:
+    """Whether the `v` query parameter names the current version of the requested data."""
+    version = ",".join(str(d.data_version) for d in data)
+    return request.GET.get("v") == version
+
+
+def conditional_response(
+    request,
+    etag: str,
+    last_modified: datetime.datetime,
+    get_response: Callable[[], HttpResponseBase],
+    *,
+    immutable: bool = False,
+) -> HttpResponseBase:
+    """
+    Return a 304 response if the client's copy is current, or the response otherwise.
+
+    Successful responses carry validators, and are cacheable for long if `immutable`;
+    otherwise clients must revalidate them before reuse. Only responses determined by the
+    data version and the URL may be `immutable`.
+
+    Responses are private: all data is only accessible to the members of its projects, so
+    shared caches must not serve it to other users.
+    """
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(last_modified.timestamp())
+    )
+    if response is None:
+        response = get_response()
+    if response.status_code not in {200, 204, 304}:
+        return response
+
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified.timestamp())
+    if immutable:
+        patch_cache_control(response, private=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
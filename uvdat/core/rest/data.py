@@ -1,85 +1,198 @@
 from __future__ import annotations
 
+from functools import partial, wraps
 import json
+from typing import TYPE_CHECKING
 
+from django.conf import settings
 from django.contrib.gis.db.models import Extent
-from django.db import connection
-from django.http import HttpResponse
+from django.core.cache import caches
+from django.http import Http404, HttpResponse
+from django.shortcuts import get_object_or_404
 from django_large_image.rest import LargeImageFileDetailMixin
+from guardian.shortcuts import get_objects_for_user
 from rest_framework import mixins
 from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
-from uvdat.core.models import RasterData, VectorData, VectorFeature
+from uvdat.core.access_control import DatasetGuardianPermission, GuardianFilter
+from uvdat.core.models import (
+    Chart,
+    Colormap,
+    Dataset,
+    DerivedRasterData,
+    LayerStyle,
+    Project,
+    RasterData,
+    Region,
+    VectorData,
+    VectorFeature,
+)
+from uvdat.core.models.styles import get_default_colormap
+from uvdat.core.raster import (
+    RasterWindow,
+    RasterWindowError,
+    encode_raster_window,
+    parse_window_options,
+    read_raster_window,
+)
+from uvdat.core.raster.colormap import (
+    RasterStyleError,
+    get_band_styles,
+    get_colormap_markers,
+    hash_band_styles,
+    parse_band_style,
+)
+from uvdat.core.raster.derived import (
+    DerivedRasterError,
+    get_derived_key,
+    get_derived_range,
+    get_input_rasters,
+    read_derived_window,
+    render_derived_tile,
+)
+from uvdat.core.raster.mosaic import (
+    MosaicError,
+    get_mosaic,
+    get_mosaic_key,
+    get_mosaic_rasters,
+)
+from uvdat.core.raster.render import STYLED_TILE_FORMATS, render_raster_tile
+from uvdat.core.raster.sampling import parse_sample_options, sample_raster
+from uvdat.core.raster.stats import get_raster_stats
+from uvdat.core.raster.vsi import get_vsi_path
+from uvdat.core.rest.conditional import conditional_response, is_current_version, make_etag
 from uvdat.core.rest.explorer import IPyLeafletTokenAuth
-from uvdat.core.rest.serializers import RasterDataSerializer, VectorDataSerializer
-
-VECTOR_TILE_SQL = """
-WITH
-tilenv as (
-    SELECT ST_TRANSFORM(ST_TileEnvelope(%(z)s, %(x)s, %(y)s), %(srid)s) as te
-),
-tilenvbounds as (
-    SELECT
-        ST_XMin(te) as xmin,
-        ST_YMin(te) as ymin,
-        ST_XMax(te) as xmax,
-        ST_YMax(te) as ymax,
-        (ST_XMax(te) - ST_XMin(te)) / 4 as segsize
-    FROM tilenv
-),
-env as (
-    SELECT ST_Segmentize(
-        ST_MakeEnvelope(
-            xmin,
-            ymin,
-            xmax,
-            ymax,
-            %(srid)s
-        ),
-        segsize
-    ) as seg
-    FROM tilenvbounds
-),
-bounds as (
-    SELECT
-        seg as geom,
-        seg::box2d as b2d
-    FROM env
-),
-mvtgeom as (
-    SELECT
-        ST_AsMVTGeom(
-            ST_Transform(t.geometry, %(srid)s),
-            bounds.b2d
-        ) AS geom,
-    t.properties as properties
-    FROM
-        core_vectorfeature t,
-        bounds
-    WHERE
-        t.vector_data_id = %(vector_data_id)s
-        AND ST_Intersects(
-            ST_Transform(t.geometry, %(srid)s),
-            ST_Transform(bounds.geom, %(srid)s)
-        )
-        REPLACE_WITH_FILTERS
+from uvdat.core.rest.serializers import (
+    DatasetSerializer,
+    DerivedRasterDataSerializer,
+    RasterDataSerializer,
+    VectorDataSerializer,
 )
-SELECT ST_AsMVT(mvtgeom.*) FROM mvtgeom
-;
-"""
+from uvdat.core.tasks.chart import create_time_series_chart
+from uvdat.core.tiles import encode_tile_batch, get_vector_tile_key
+from uvdat.core.tiles import get_vector_tile as get_cached_vector_tile
+from uvdat.core.tiles.budget import TileBudget, parse_tile_budget
+from uvdat.core.tiles.cache import (
+    TILE_CACHE_ALIAS,
+    derived_tile_cache_key,
+    mosaic_tile_cache_key,
+    raster_tile_cache_key,
+)
+from uvdat.core.tiles.cluster import ClusterOptions, parse_cluster_options
+from uvdat.core.tiles.diagnostics import diagnose_vector_tile
+from uvdat.core.tiles.properties import STYLE_PROPERTIES, parse_properties
+from uvdat.core.tiles.singleflight import coalesce
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
 
+MAX_BATCH_TILES = 256
+
+
+def tile_response(tile: bytes, dropped_features: int | None = None) -> HttpResponse:
+    response = HttpResponse(
+        tile,
+        content_type="application/octet-stream",
+        status=200 if tile else 204,
+    )
+    if dropped_features is not None:
+        response["X-Tile-Dropped-Features"] = str(dropped_features)
+    return response
+
+
+def get_tile_options(
+    params: dict,
+) -> tuple[dict, list[str] | str | None, ClusterOptions | None, TileBudget | None]:
+    """
+    Split tile query parameters into feature filters, properties, clustering and budget.
+
+    Options found from layers, such as `style` properties, are only looked up to render tiles.
+    """
+    filters = dict(params)
+    # By default, tiles carry all properties. Clients may request only some, or the `style`
+    # properties used by layer styles, as the web client does; it fetches the other
+    # properties of a feature from the `features` endpoint, by the id of the tile feature.
+    properties = None
+    if "properties" in filters:
+        value = filters.pop("properties")
+        properties = STYLE_PROPERTIES if value == STYLE_PROPERTIES else parse_properties(value)
+    cluster = parse_cluster_options(
+        filters.pop("cluster", None),
+        filters.pop("cluster_property", None),
+        filters.pop("cluster_max_zoom", None),
+    )
+    budget = parse_tile_budget(
+        filters.pop("max_features", None),
+        filters.pop("max_bytes", None),
+        filters.pop("priority", None),
+    )
+    return filters, properties, cluster, budget
 
-def get_filter_string(filters: dict | None = None):
-    if filters is None:
-        return ""
 
-    return_str = ""
-    for key, value in filters.items():
-        key_path = key.replace(".", ",")
-        return_str += f" AND t.properties #>> '{{{key_path}}}' = '{value}'"
-    return return_str
+def get_tile_query(request) -> str:
+    """Return the query of a raster tile request, without parameters which don't affect it."""
+    query = request.GET.copy()
+    query.pop("token", None)
+    query.pop("v", None)
+    return query.urlencode()
+
+
+def cached_tile_response(key: str, render_tile: Callable[[], HttpResponse]) -> HttpResponse:
+    """Return a raster tile from the tile cache, or render it once for concurrent requests."""
+    cache = caches[TILE_CACHE_ALIAS]
+
+    def load_tile() -> tuple[int, bytes, str]:
+        response = render_tile()
+        tile = (response.status_code, response.content, response["Content-Type"])
+        if response.status_code == 200:
+            cache.set(key, tile)
+        return tile
+
+    tile = cache.get(key)
+    if tile is None:
+        tile = coalesce(key, load_tile)
+    status, content, content_type = tile
+    return HttpResponse(content, content_type=content_type, status=status)
+
+
+def raster_window_response(window: RasterWindow, dtype: str) -> HttpResponse:
+    """Return a raster window as a binary array, described by response headers."""
+    response = HttpResponse(
+        encode_raster_window(window, dtype), content_type="application/octet-stream"
+    )
+    response["X-Raster-Shape"] = ",".join(str(n) for n in window.data.shape)
+    response["X-Raster-Dtype"] = dtype
+    response["X-Raster-Bounds"] = ",".join(str(b) for b in window.bounds)
+    response["X-Raster-Nodata"] = "0" if dtype == "uint16" else "nan"
+    return response
+
+
+def parse_chart_options(data: dict, points: list) -> dict | None:
+    """
+    Parse the `chart` object and `labels` of a time series request, if a chart is requested.
+
+    Returns the `project` ID, the chart `name`, which may be empty, and one label per point.
+    """
+    chart_options = data.get("chart")
+    if not chart_options:
+        return None
+    if not isinstance(chart_options, dict):
+        raise RasterWindowError("The chart must be an object.")
+    try:
+        project_id = int(chart_options.get("project"))
+    except (TypeError, ValueError):
+        raise RasterWindowError("The chart must name a project by ID.") from None
+    name = chart_options.get("name") or ""
+    if not isinstance(name, str):
+        raise RasterWindowError("The chart name must be a string.")
+    labels = data.get("labels") or [f"{point.x}, {point.y}" for point in points]
+    if not isinstance(labels, list) or len(labels) != len(points):
+        raise RasterWindowError("There must be one label per point.")
+    return {"project": project_id, "name": name, "labels": [str(label) for label in labels]}
 
 
 class GenericDataViewSet(GenericViewSet, mixins.RetrieveModelMixin):
@@ -99,6 +212,112 @@ class RasterDataViewSet(GenericDataViewSet, LargeImageFileDetailMixin):
     serializer_class = RasterDataSerializer
     FILE_FIELD_NAME = "cloud_optimized_geotiff"
 
+    def get_path(self, request, pk=None):
+        # django-large-image reads rasters with range requests, unless they're read locally
+        if settings.UVDAT_RASTER_READ_MODE == "local":
+            return super().get_path(request, pk)
+        raster_data = self.get_object()
+        return get_vsi_path(raster_data.cloud_optimized_geotiff)[0]
+
+    @wraps(LargeImageFileDetailMixin.tile)
+    def tile(self, request, *args, **kwargs):
+        # The tile action of django-large-image is wrapped, keeping its routing, so that
+        # concurrent requests for the same tile share one rendering, and clients with a
+        # current copy of the tile are answered before it is rendered
+        raster_data = self.get_object()
+        if "style_id" in request.query_params:
+            return self.styled_tile(request, raster_data, **kwargs)
+        key = raster_tile_cache_key(raster_data, request.path, get_tile_query(request))
+        render_tile = partial(super().tile, request, *args, **kwargs)
+        return conditional_response(
+            request,
+            make_etag("raster-tile", raster_data.id, raster_data.data_version, key),
+            raster_data.data_modified,
+            lambda: cached_tile_response(key, render_tile),
+            immutable=is_current_version(request, raster_data),
+        )
+
+    def styled_tile(self, request, raster_data, *, x, y, z, fmt="png", **kwargs):  # noqa: PLR0913
+        """
+        Render a tile colored by the colormaps of the layer style given by `style_id`.
+
+        Colormaps are applied through their lookup tables, for the `frame` of the request or
+        the default frame of the style. Tiles are PNG or WebP images, cached by the contents
+        of the style, so that they are rendered again once it changes.
+        """
+        style_id = request.query_params["style_id"]
+        if not style_id.isdigit():
+            return HttpResponse(f'Invalid style_id "{style_id}".', status=400)
+        layer_style = get_object_or_404(
+            GuardianFilter().filter_queryset(request, LayerStyle.objects.all(), self),
+            pk=int(style_id),
+        )
+        frame = request.query_params.get("frame", str(layer_style.default_frame))
+        if not frame.isdigit():
+            return HttpResponse(f'Invalid frame "{frame}".', status=400)
+        if fmt not in STYLED_TILE_FORMATS:
+            return HttpResponse(f'Styled tiles can\'t be rendered as "{fmt}".', status=400)
+        try:
+            band_styles = get_band_styles(layer_style, raster_data, int(frame))
+        except RasterStyleError as e:
+            return HttpResponse(str(e), status=400)
+
+        query = f"{get_tile_query(request)}&styles={hash_band_styles(band_styles)}"
+        key = raster_tile_cache_key(raster_data, request.path, query)
+
+        def render_tile() -> HttpResponse:
+            try:
+                content = render_raster_tile(
+                    raster_data,
+                    int(z),
+                    int(x),
+                    int(y),
+                    band_styles=band_styles,
+                    frame=int(frame),
+                    fmt=fmt,
+                )
+            except RasterWindowError as e:
+                return HttpResponse(str(e), status=400)
+            return HttpResponse(content, content_type=STYLED_TILE_FORMATS[fmt][1])
+
+        return conditional_response(
+            request,
+            make_etag("raster-tile", raster_data.id, raster_data.data_version, key),
+            raster_data.data_modified,
+            lambda: cached_tile_response(key, render_tile),
+        )
+
+    @action(detail=True, methods=["get"])
+    def stats(self, request, **kwargs):
+        """
+        Return the statistics and histograms of each band of each frame, computed at conversion.
+
+        Statistics may be limited to a `frame` and a `band`.
+        """
+        raster_data = self.get_object()
+
+        def get_response():
+            stats = get_raster_stats(raster_data)
+            for name in ("frame", "band"):
+                value = request.query_params.get(name)
+                if value is not None:
+                    stats = [s for s in stats if str(s[name]) == value]
+            return Response(stats)
+
+        return conditional_response(
+            request,
+            make_etag(
+                "raster-stats",
+                raster_data.id,
+                raster_data.data_version,
+                request.query_params.get("frame"),
+                request.query_params.get("band"),
+            ),
+            raster_data.data_modified,
+            get_response,
+            immutable=is_current_version(request, raster_data),
+        )
+
     @action(
         detail=True,
         methods=["get"],
@@ -110,6 +329,258 @@ class RasterDataViewSet(GenericDataViewSet, LargeImageFileDetailMixin):
         data = raster_data.get_image_data(float(resolution))
         return HttpResponse(json.dumps(data), status=200)
 
+    @action(detail=True, methods=["get"], url_path="raster-data", url_name="raster_window")
+    def get_raster_window(self, request, **kwargs):
+        """
+        Return a window of a band as a binary array.
+
+        The window is given by `bbox` (`xmin,ymin,xmax,ymax` in `bbox_srs`, EPSG:4326 by
+        default), `band`, `frame` and a target `size` of its largest dimension. The array is
+        row-major and little-endian, of the `dtype` float32 (default) or uint16; its shape,
+        type, bounds and the value of masked pixels are given in response headers.
+        """
+        raster_data = self.get_object()
+        try:
+            options, dtype = parse_window_options(request.query_params.dict())
+            window = read_raster_window(raster_data, **options)
+        except RasterWindowError as e:
+            return HttpResponse(str(e), status=400)
+        return raster_window_response(window, dtype)
+
+    @action(detail=True, methods=["post"], url_path="sample", url_name="sample")
+    def sample(self, request, pk: str):
+        """
+        Sample a band at points, and compute its statistics within zones, in every frame.
+
+        The request body lists `points` as `[x, y]` pairs, and zones as GeoJSON `geometries`,
+        both in the spatial reference of the `srid` (4326 by default), or as the ids of
+        `regions`. It may select a `band`, `frames` and a `threshold` to count pixels above.
+        Zone statistics are in the order of the geometries, followed by the regions.
+        """
+        # Sampling doesn't modify the raster, so it's permitted to anyone with access to it
+        raster_data = get_object_or_404(self.filter_queryset(self.get_queryset()), pk=pk)
+        try:
+            options = parse_sample_options(request.data)
+            region_ids = [int(i) for i in request.data.get("regions") or []]
+        except (RasterWindowError, TypeError, ValueError) as e:
+            return HttpResponse(str(e), status=400)
+        regions = {
+            region.id: region
+            for region in GuardianFilter().filter_queryset(
+                request, Region.objects.filter(id__in=region_ids), self
+            )
+        }
+        if set(regions) != set(region_ids):
+            raise Http404
+        options["zones"] += [regions[region_id].boundary for region_id in region_ids]
+
+        try:
+            return Response(sample_raster(raster_data, **options))
+        except RasterWindowError as e:
+            return HttpResponse(str(e), status=400)
+
+    @action(detail=True, methods=["post"], url_path="time-series", url_name="time_series")
+    def time_series(self, request, pk: str):
+        """
+        Return the values of a band at points across all frames, one array per point.
+
+        The request body lists `points` as `[x, y]` pairs in the spatial reference of the
+        `srid` (4326 by default), and may select a `band`. Given a `chart` object with a
+        `name` and a `project`, a chart of the series is also created in that project,
+        with the optional `labels` of points. Chart names are unique within a project.
+        """
+        raster_data = get_object_or_404(self.filter_queryset(self.get_queryset()), pk=pk)
+        try:
+            options = parse_sample_options(request.data)
+        except RasterWindowError as e:
+            return HttpResponse(str(e), status=400)
+        points = options["points"]
+        if not points:
+            return HttpResponse("At least one point is required.", status=400)
+
+        try:
+            chart_options = parse_chart_options(request.data, points)
+        except RasterWindowError as e:
+            return HttpResponse(str(e), status=400)
+        if chart_options:
+            project = get_object_or_404(
+                get_objects_for_user(
+                    request.user, ["collaborator", "owner"], klass=Project, any_perm=True
+                ).filter(datasets=raster_data.dataset_id),
+                pk=chart_options["project"],
+            )
+            chart_name = chart_options["name"] or f"{raster_data.name} Time Series"
+            if Chart.objects.filter(project=project, name=chart_name).exists():
+                return HttpResponse(f'A chart named "{chart_name}" already exists.', status=400)
+
+        try:
+            result = sample_raster(raster_data, points=points, band=options["band"])
+        except RasterWindowError as e:
+            return HttpResponse(str(e), status=400)
+        data = {"frames": result["frames"], "series": result["points"]}
+        if chart_options:
+            chart = create_time_series_chart(
+                raster_data,
+                project,
+                chart_name,
+                data["frames"],
+                data["series"],
+                chart_options["labels"],
+            )
+            data["chart"] = chart.id
+        return Response(data)
+
+
+class MosaicViewSet(GenericDataViewSet, LargeImageFileDetailMixin):
+    """
+    Serve the single-frame rasters of a dataset as one tile source, by dataset ID.
+
+    Rasters are mosaicked by a VRT, with overviews built after conversion, so that a map of
+    the dataset makes one set of tile requests rather than one per raster.
+    """
+
+    queryset = Dataset.objects.all()
+    serializer_class = DatasetSerializer
+    permission_classes = [DatasetGuardianPermission]
+
+    def get_path(self, request, pk=None):
+        try:
+            mosaic = get_mosaic(self.get_object())
+        except MosaicError as e:
+            raise Http404(str(e)) from e
+        return str(mosaic.path)
+
+    @wraps(LargeImageFileDetailMixin.tile)
+    def tile(self, request, *args, **kwargs):
+        dataset = self.get_object()
+        try:
+            mosaic_key = get_mosaic_key(get_mosaic_rasters(dataset))
+        except MosaicError as e:
+            raise Http404(str(e)) from e
+        key = mosaic_tile_cache_key(dataset, mosaic_key, request.path, get_tile_query(request))
+        return cached_tile_response(key, partial(super().tile, request, *args, **kwargs))
+
+
+class DerivedRasterDataViewSet(
+    GenericDataViewSet,
+    mixins.ListModelMixin,
+    mixins.CreateModelMixin,
+    mixins.UpdateModelMixin,
+    mixins.DestroyModelMixin,
+):
+    """
+    Rasters computed from bands of the rasters of a dataset by an expression, such as NDVI.
+
+    Expressions are evaluated with numpy on each tile or window read, from the overviews of
+    the input COGs, so derived rasters are never written.
+    """
+
+    queryset = DerivedRasterData.objects.select_related("dataset").all()
+    serializer_class = DerivedRasterDataSerializer
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        dataset_id = self.request.query_params.get("dataset")
+        if dataset_id is not None and dataset_id.isdigit():
+            qs = qs.filter(dataset=int(dataset_id))
+        return qs
+
+    def check_dataset_permission(self, dataset: Dataset):
+        # Derived rasters are added to datasets by collaborators of a project including them
+        if not self.request.user.is_superuser and not (
+            get_objects_for_user(
+                self.request.user, ["collaborator", "owner"], klass=Project, any_perm=True
+            )
+            .filter(datasets=dataset)
+            .exists()
+        ):
+            raise PermissionDenied
+
+    def perform_create(self, serializer):
+        self.check_dataset_permission(serializer.validated_data["dataset"])
+        serializer.save()
+
+    def perform_update(self, serializer):
+        if "dataset" in serializer.validated_data:
+            self.check_dataset_permission(serializer.validated_data["dataset"])
+        # Tiles and the stored range are of the previous expression
+        derived = serializer.save(metadata=None)
+        derived.bump_data_version()
+
+    @action(
+        detail=True,
+        methods=["get"],
+        url_path=r"tiles/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.(?P<fmt>png|webp)",
+        url_name="tiles",
+    )
+    def tile(self, request, z: str, x: str, y: str, fmt: str, **kwargs):
+        """
+        Render a tile of the derived raster, colored by a colormap.
+
+        The colormap is given by the `colormap` ID, or is the default colormap. It spans the
+        range of `min` to `max`, which default to the range of the derived raster, and may be
+        discrete with `n_colors` or `clamp` values out of range. Tiles are cached by the data
+        versions of the derived raster and of its inputs.
+        """
+        derived = self.get_object()
+        colormap_id = request.query_params.get("colormap")
+        if colormap_id is None:
+            colormap = get_default_colormap()
+        elif colormap_id.isdigit():
+            colormap = get_object_or_404(
+                GuardianFilter().filter_queryset(request, Colormap.objects.all(), self),
+                pk=int(colormap_id),
+            )
+        else:
+            return HttpResponse(f'Invalid colormap "{colormap_id}".', status=400)
+        try:
+            rasters = get_input_rasters(derived)
+            band_style = parse_band_style(
+                request.query_params,
+                get_colormap_markers(colormap),
+                partial(get_derived_range, derived),
+            )
+        except (DerivedRasterError, RasterStyleError, RasterWindowError) as e:
+            return HttpResponse(str(e), status=400)
+
+        derived_key = get_derived_key(derived, rasters)
+        query = f"{get_tile_query(request)}&styles={hash_band_styles([band_style])}"
+        key = derived_tile_cache_key(derived, derived_key, request.path, query)
+
+        def render_tile() -> HttpResponse:
+            try:
+                content = render_derived_tile(
+                    derived, rasters, int(z), int(x), int(y), band_style=band_style, fmt=fmt
+                )
+            except (DerivedRasterError, RasterWindowError) as e:
+                return HttpResponse(str(e), status=400)
+            return HttpResponse(content, content_type=STYLED_TILE_FORMATS[fmt][1])
+
+        return conditional_response(
+            request,
+            make_etag("derived-tile", derived.id, derived_key, key),
+            max(data.data_modified for data in [derived, *rasters.values()]),
+            lambda: cached_tile_response(key, render_tile),
+        )
+
+    @action(detail=True, methods=["get"], url_path="raster-data", url_name="raster_window")
+    def get_raster_window(self, request, **kwargs):
+        """
+        Return a window of the derived raster as a binary array, as for rasters.
+
+        The window is on the grid of the raster of the first input, and is given by `bbox`,
+        `bbox_srs`, `size` and `dtype`.
+        """
+        derived = self.get_object()
+        try:
+            options, dtype = parse_window_options(request.query_params.dict())
+            window = read_derived_window(
+                derived, bbox=options["bbox"], bbox_srs=options["bbox_srs"], size=options["size"]
+            )
+        except (DerivedRasterError, RasterWindowError) as e:
+            return HttpResponse(str(e), status=400)
+        return raster_window_response(window, dtype)
+
 
 class VectorDataViewSet(GenericDataViewSet):
     queryset = VectorData.objects.select_related("dataset").all()
@@ -123,14 +594,50 @@ class VectorDataViewSet(GenericDataViewSet):
     @action(detail=True, methods=["get"])
     def bounds(self, request, **kwargs):
         instance = self.get_object()
-        features = VectorFeature.objects.filter(vector_data=instance)
-        extent = features.aggregate(Extent("geometry")).get("geometry__extent")
-        return Response(extent, status=200)
+
+        def get_response():
+            features = VectorFeature.objects.filter(vector_data=instance)
+            extent = features.aggregate(Extent("geometry")).get("geometry__extent")
+            return Response(extent, status=200)
+
+        return conditional_response(
+            request,
+            make_etag("bounds", instance.id, instance.data_version),
+            instance.data_modified,
+            get_response,
+            immutable=is_current_version(request, instance),
+        )
 
     @action(detail=True, methods=["get"])
     def summary(self, request, **kwargs):
         instance = self.get_object()
-        return Response(instance.get_summary(), status=200)
+        return conditional_response(
+            request,
+            make_etag("summary", instance.id, instance.data_version),
+            instance.data_modified,
+            lambda: Response(instance.get_summary(), status=200),
+            immutable=is_current_version(request, instance),
+        )
+
+    @action(
+        detail=True,
+        methods=["get"],
+        url_path=r"features/(?P<feature_id>\d+)",
+        url_name="feature",
+    )
+    def feature(self, request, feature_id: str, **kwargs):
+        """Return all properties of a VectorFeature, identified as in vector tiles."""
+        instance = self.get_object()
+        feature = get_object_or_404(
+            VectorFeature.objects.only("id", "properties"), vector_data=instance, pk=feature_id
+        )
+        return conditional_response(
+            request,
+            make_etag("feature", feature.id, instance.data_version),
+            instance.data_modified,
+            lambda: Response({"id": feature.id, "properties": feature.properties}, status=200),
+            immutable=is_current_version(request, instance),
+        )
 
     @action(
         detail=True,
@@ -139,25 +646,158 @@ class VectorDataViewSet(GenericDataViewSet):
         url_name="tiles",
     )
     def get_vector_tile(self, request, pk: str, x: str, y: str, z: str):
-        filters = request.query_params.copy()
-        filters.pop("token", None)
-        filters_string = get_filter_string(filters)
-        with connection.cursor() as cursor:
-            cursor.execute(
-                VECTOR_TILE_SQL.replace("REPLACE_WITH_FILTERS", filters_string),
-                {
-                    "z": z,
-                    "x": x,
-                    "y": y,
-                    "srid": 3857,
-                    "vector_data_id": pk,
-                },
+        vector_data = get_object_or_404(self.get_tile_queryset(), pk=pk)
+        params = request.query_params.dict()
+        params.pop("token", None)
+        params.pop("v", None)
+        try:
+            tile_args = (vector_data, int(z), int(x), int(y), *get_tile_options(params))
+            etag = make_etag(get_vector_tile_key(*tile_args))
+            return conditional_response(
+                request,
+                etag,
+                vector_data.data_modified,
+                # Tiles also depend on the layer style and metadata, which are not versioned
+                lambda: tile_response(*get_cached_vector_tile(*tile_args)),
+            )
+        except ValueError as e:
+            return HttpResponse(str(e), status=400)
+
+    @action(
+        detail=True,
+        methods=["get"],
+        url_path=r"tiles/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)/diagnostics",
+        url_name="tile_diagnostics",
+        permission_classes=[IsAdminUser],
+    )
+    def get_vector_tile_diagnostics(self, request, pk: str, x: str, y: str, z: str):
+        """Render a tile uncached, and report its query plan, size and timing, for staff."""
+        vector_data = get_object_or_404(self.get_tile_queryset(), pk=pk)
+        params = request.query_params.dict()
+        params.pop("token", None)
+        params.pop("v", None)
+        try:
+            report = diagnose_vector_tile(
+                vector_data.id, int(z), int(x), int(y), *get_tile_options(params)
             )
-            row = cursor.fetchone()
+        except ValueError as e:
+            return HttpResponse(str(e), status=400)
+        return Response(report)
 
-        tile = row[0]
-        return HttpResponse(
-            tile,
-            content_type="application/octet-stream",
-            status=200 if tile else 204,
+    def get_combined_vector_tile(
+        self, vectors: list[VectorData], z: int, x: int, y: int, options: tuple
+    ):
+        """Return one tile combining the tiles of several VectorData, as layers named by id."""
+        return b"".join(
+            get_cached_vector_tile(
+                vector_data, z, x, y, *options, layer_name=str(vector_data.id)
+            ).data
+            for vector_data in vectors
         )
+
+    def get_tile_queryset(self):
+        """Return the VectorData accessible to the user, with only the fields tiles depend on."""
+        return (
+            self.filter_queryset(self.get_queryset())
+            .select_related(None)
+            .only("id", "data_version", "data_modified")
+        )
+
+    def get_accessible_vectors(self, vector_ids: list[int]) -> list[VectorData]:
+        """Return the VectorData with the given ids, if the user may access all of them."""
+        vectors = {
+            vector_data.id: vector_data
+            for vector_data in self.get_tile_queryset().filter(id__in=vector_ids)
+        }
+        if set(vectors) != set(vector_ids):
+            raise Http404
+        return [vectors[vector_id] for vector_id in vector_ids]
+
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path=r"tiles/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)",
+        url_name="combined_tiles",
+    )
+    def get_combined_vector_tiles(self, request, x: str, y: str, z: str):
+        """
+        Return a tile combining several VectorData, listed by a `vectors` query parameter.
+
+        Each VectorData is a layer named by its id. Filters and properties apply to all layers.
+        """
+        params = request.query_params.dict()
+        params.pop("token", None)
+        params.pop("project", None)
+        params.pop("v", None)
+        try:
+            vector_ids = [int(i) for i in params.pop("vectors", "").split(",") if i]
+            vectors = self.get_accessible_vectors(vector_ids)
+            options = get_tile_options(params)
+            etag = make_etag(
+                *(
+                    get_vector_tile_key(
+                        vector_data,
+                        int(z),
+                        int(x),
+                        int(y),
+                        *options,
+                        layer_name=str(vector_data.id),
+                    )
+                    for vector_data in vectors
+                )
+            )
+            return conditional_response(
+                request,
+                etag,
+                max(vector_data.data_modified for vector_data in vectors),
+                lambda: tile_response(
+                    self.get_combined_vector_tile(vectors, int(z), int(x), int(y), options)
+                ),
+            )
+        except ValueError as e:
+            return HttpResponse(str(e), status=400)
+
+    @action(detail=False, methods=["post"], url_path="tiles/batch", url_name="batch_tiles")
+    def get_batch_vector_tiles(self, request):
+        """
+        Return several tiles in one response.
+
+        The request body lists tiles as `{"vectors": [...], "z", "x", "y"}` objects, with
+        optional `filters` and `properties`. The tile of several vectors combines them as
+        layers named by id; the tile of a single vector has a `default` layer, like the
+        tiles endpoint. Tiles are returned in order, each prefixed by its length in bytes as
+        a 4 byte big-endian integer.
+        """
+        tile_specs = request.data.get("tiles")
+        if not isinstance(tile_specs, list) or not tile_specs:
+            return HttpResponse("A list of tiles is required.", status=400)
+        if len(tile_specs) > MAX_BATCH_TILES:
+            return HttpResponse(f"At most {MAX_BATCH_TILES} tiles may be requested.", status=400)
+
+        try:
+            vectors = {
+                vector_data.id: vector_data
+                for vector_data in self.get_accessible_vectors(
+                    list({int(i) for spec in tile_specs for i in spec["vectors"]})
+                )
+            }
+            tiles = []
+            for spec in tile_specs:
+                tile_vectors = [vectors[int(i)] for i in spec["vectors"]]
+                z, x, y = int(spec["z"]), int(spec["x"]), int(spec["y"])
+                params = {**spec.get("filters", {})}
+                if "properties" in spec:
+                    properties = spec["properties"]
+                    params["properties"] = (
+                        properties if isinstance(properties, str) else ",".join(properties)
+                    )
+                options = get_tile_options(params)
+                if len(tile_vectors) == 1:
+                    tile = get_cached_vector_tile(tile_vectors[0], z, x, y, *options).data
+                else:
+                    tile = self.get_combined_vector_tile(tile_vectors, z, x, y, options)
+                tiles.append(tile)
+        except (KeyError, TypeError, ValueError) as e:
+            return HttpResponse(f"Invalid tile request: {e}", status=400)
+
+        return HttpResponse(encode_tile_batch(tiles), content_type="application/octet-stream")
@@ -11,6 +11,7 @@ from uvdat.core.models import (
     Colormap,
     Dataset,
     DatasetTag,
+    DerivedRasterData,
     FileItem,
     Layer,
     LayerFrame,
@@ -25,6 +26,12 @@ from uvdat.core.models import (
     VectorData,
     ViewState,
 )
+from uvdat.core.raster.derived import (
+    DerivedRasterError,
+    get_input_rasters,
+    parse_expression,
+    parse_inputs,
+)
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -196,7 +203,7 @@ class VectorDataSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = VectorData
-        fields = "__all__"
+        exclude = ["tile_archive"]
 
 
 class RasterDataSerializer(serializers.ModelSerializer):
@@ -212,6 +219,25 @@ class RasterDataSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+class DerivedRasterDataSerializer(serializers.ModelSerializer):
+    def validate(self, attrs):
+        # Partial updates are validated with the current values of the fields not given
+        dataset = attrs.get("dataset", getattr(self.instance, "dataset", None))
+        expression = attrs.get("expression", getattr(self.instance, "expression", ""))
+        inputs = attrs.get("inputs", getattr(self.instance, "inputs", {}))
+        try:
+            get_input_rasters(DerivedRasterData(dataset=dataset, inputs=inputs))
+            parse_expression(expression, set(parse_inputs(inputs)))
+        except DerivedRasterError as e:
+            raise serializers.ValidationError(str(e)) from None
+        return attrs
+
+    class Meta:
+        model = DerivedRasterData
+        fields = "__all__"
+        read_only_fields = ["data_version", "data_modified", "metadata"]
+
+
 class LayerFrameSerializer(serializers.ModelSerializer):
     vector = VectorDataSerializer()
     raster = RasterDataSerializer()
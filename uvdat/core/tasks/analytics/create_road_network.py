@@ -16,7 +16,7 @@ from uvdat.core.models import (
     TaskResult,
     VectorData,
 )
-from uvdat.core.tasks.data import create_vector_features
+from uvdat.core.tasks.data import create_simplified_geometries, create_vector_features
 from uvdat.core.tasks.networks import geojson_from_network
 
 from .analysis_type import AnalysisTask, AnalysisType
@@ -145,6 +145,7 @@ def create_road_network(result_id):
 
     vector_data.write_geojson_data(geojson_from_network(dataset))
     create_vector_features(vector_data)
+    create_simplified_geometries(vector_data)
     vector_data.get_summary()
 
     result.write_outputs({"roads": dataset.id})
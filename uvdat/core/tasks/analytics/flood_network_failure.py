@@ -5,12 +5,13 @@ from typing import TYPE_CHECKING, Any
 
 from celery import shared_task
 from django.conf import settings
-from django_large_image import tilesource, utilities
+from django_large_image import tilesource
 import numpy as np
 
 if TYPE_CHECKING:
     from django.contrib.gis.geos import Point
 
+from uvdat.core.file_cache import cached_local_path
 from uvdat.core.models import Layer, Network, TaskResult
 
 from .analysis_type import AnalysisInputError, AnalysisTask, AnalysisType
@@ -116,24 +117,24 @@ def flood_network_failure(result_id):
 
     # Assume that all frames in flood_layer refer to frames of the same RasterData
     raster = flood_layer.frames.first().raster
-    raster_path = utilities.field_file_to_local_path(raster.cloud_optimized_geotiff)
-    source = tilesource.get_tilesource_from_path(raster_path)
-    metadata = source.getMetadata()
-
-    animation_results = {}
-    node_failures = []
-    for frame in metadata.get("frames", []):
-        frame_index = frame.get("Index")
-        result.write_status(
-            f"Evaluating flood levels at {n_nodes} nodes for frame {frame_index}..."
-        )
-        for node_id, node_region in node_regions.items():
-            region_data, _ = source.getRegion(
-                region=node_region,
-                frame=frame_index,
-                format="numpy",
+    with cached_local_path(raster.cloud_optimized_geotiff) as raster_path:
+        source = tilesource.get_tilesource_from_path(raster_path)
+        metadata = source.getMetadata()
+
+        animation_results = {}
+        node_failures = []
+        for frame in metadata.get("frames", []):
+            frame_index = frame.get("Index")
+            result.write_status(
+                f"Evaluating flood levels at {n_nodes} nodes for frame {frame_index}..."
             )
-            if node_id not in node_failures and np.any(np.where(region_data > tolerance)):
-                node_failures.append(node_id)
-        animation_results[frame_index] = node_failures.copy()
+            for node_id, node_region in node_regions.items():
+                region_data, _ = source.getRegion(
+                    region=node_region,
+                    frame=frame_index,
+                    format="numpy",
+                )
+                if node_id not in node_failures and np.any(np.where(region_data > tolerance)):
+                    node_failures.append(node_id)
+            animation_results[frame_index] = node_failures.copy()
     result.write_outputs({"failures": animation_results})
@@ -9,9 +9,13 @@ from django.conf import settings
 from django.core.files import File
 
 from uvdat.core.models import Chart, Colormap, Dataset, FileItem, LayerStyle, TaskResult
+from uvdat.core.raster.stats import get_value_range
 
 from .analysis_type import AnalysisTask, AnalysisType
 
+# Upper bound of the default style of flood depths, in meters, without a range of depths
+DEFAULT_MAX_DEPTH = 2
+
 
 class FloodSimulation(AnalysisType):
     def __init__(self):
@@ -178,8 +182,12 @@ def flood_simulation(result_id):
             asynchronous=False,
         )
 
-        # Create a default style for new layer
+        # Create a default style for new layer, colored by the range of flood depths.
+        # The upper percentile of mostly dry floods is 0, so they are given a default range.
         layer = dataset.layers.first()
+        raster = dataset.rasters.first()
+        depth_range = get_value_range(raster) if raster else None
+        max_depth = depth_range[1] if depth_range else 0
         style = LayerStyle.objects.create(
             name="Flood Depth",
             layer=layer,
@@ -206,7 +214,7 @@ def flood_simulation(result_id):
                             "clamp": True,
                             "color_by": "value",
                             "null_color": "transparent",
-                            "range": [0, 2],
+                            "range": [0, max_depth if max_depth > 0 else DEFAULT_MAX_DEPTH],
                         },
                     }
                 ],
@@ -52,7 +52,7 @@ def convert_chart(chart_id, conversion_options):
 def get_gcc_chart(dataset, project_id):
     chart_name = f"{dataset.name} Greatest Connected Component Sizes"
     try:
-        return Chart.objects.get(name=chart_name)
+        return Chart.objects.get(name=chart_name, project_id=project_id)
     except Chart.DoesNotExist:
         chart = Chart.objects.create(
             name=chart_name,
@@ -122,3 +122,41 @@ def add_gcc_chart_datum(dataset, project_id, excluded_node_names, gcc_size):
     # Append to metadata
     chart.metadata.append(new_entry)
     chart.save()
+
+
+TIME_SERIES_COLORS = ["blue", "red", "green", "orange", "purple", "brown", "magenta", "teal"]
+
+
+def create_time_series_chart(  # noqa: PLR0913
+    raster_data, project, name, frames, series, labels
+):
+    """Create a chart of the values of a raster at points across its frames."""
+    colors = [
+        name_to_hex(TIME_SERIES_COLORS[i % len(TIME_SERIES_COLORS)]) for i in range(len(series))
+    ]
+    chart = Chart.objects.create(
+        name=name,
+        description=f"Values of {raster_data.name} at {len(series)} point(s) across frames",
+        project=project,
+        editable=False,
+        metadata={"raster_data": raster_data.id},
+        chart_data={
+            "labels": frames,
+            "datasets": [
+                {
+                    "label": label,
+                    "backgroundColor": color,
+                    "borderColor": color,
+                    "data": values,
+                }
+                for label, values, color in zip(labels, series, colors, strict=True)
+            ],
+        },
+        chart_options={
+            "chart_title": name,
+            "x_title": "Frame",
+            "y_title": raster_data.name,
+        },
+    )
+    logger.info("Chart %s created.", chart.name)
+    return chart
@@ -1,19 +1,33 @@
 from __future__ import annotations
 
+import contextlib
+import itertools
 import json
 import logging
 from pathlib import Path
+import shutil
 import tempfile
+from typing import TYPE_CHECKING
 import zipfile
 
 from django.core.files import File
-from django_large_image import utilities
 import geopandas
-import numpy as np
 import rasterio
 import shapefile
 
+from uvdat.core.file_cache import cached_local_path
+from uvdat.core.geojson import (
+    FEATURE_CHUNK_SIZE,
+    get_geojson_crs,
+    iter_geojson_features,
+    write_feature_collection,
+)
 from uvdat.core.models import RasterData, VectorData
+from uvdat.core.raster.cog import parse_cog_profile, write_cog, write_multiframe_cog
+from uvdat.core.raster.stats import compute_raster_stats
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
 
 logger = logging.getLogger(__name__)
 
@@ -21,12 +35,34 @@ RASTER_FILETYPES = ["tif", "tiff", "nc", "jp2"]
 IGNORE_FILETYPES = ["dbf", "sbn", "sbx", "cpg", "shp.xml", "shx", "vrt", "hdf", "lyr"]
 
 
-def get_cog_path(file):
+def get_cog_profile(file_item, layer_options=None) -> dict | None:
+    """
+    Return the COG conversion profile of the rasters of a FileItem, if one is configured.
+
+    A `cog_profile`, given by name or as options, may be set in the metadata of the FileItem,
+    or in the metadata of a layer in `layer_options`, either for the layer showing this
+    FileItem in its `source_files` or for all layers without specific source files.
+    """
+    value = (file_item.metadata or {}).get("cog_profile")
+    if value is None:
+        for layer_info in layer_options or []:
+            metadata = layer_info.get("metadata") or {}
+            source_files = layer_info.get("source_files")
+            if "cog_profile" in metadata and (
+                source_files is None or file_item.name in source_files
+            ):
+                value = metadata["cog_profile"]
+                break
+    return None if value is None else parse_cog_profile(value)
+
+
+def get_cog_path(file, cog_profile=None):
     # Slow import, so do it lazily
     import large_image  # noqa: PLC0415
     import large_image_converter  # noqa: PLC0415
 
     raster_path = None
+    cog_path = file.parent / file.name.replace(file.suffix, "tiff")
     try:
         # if large_image can open file and geospatial is True, rasterio is not needed.
         source = large_image.open(file)
@@ -34,44 +70,83 @@ def get_cog_path(file):
             raster_path = file
             metadata = source.getMetadata()
             if len(metadata.get("frames", [])) > 1:
-                # If multiframe, return early;
-                # large_image_converter is not multiframe-compatible yet
-                return raster_path
+                # large_image_converter is not multiframe-compatible yet, so frames are
+                # converted with rasterio, or left as they are if they can't be
+                return write_multiframe_cog(file, cog_path, cog_profile) or raster_path
     except large_image.exceptions.TileSourceError:
         pass
 
-    if raster_path is None:
-        # if original data cannot be interpreted by large_image, use rasterio
-        raster_path = file.parent / "rasterio.tiff"
-        with file.open("rb") as f:
-            input_data = rasterio.open(f)
-            output_data = rasterio.open(
-                raster_path,
-                "w",
-                driver="GTiff",
-                height=input_data.height,
-                width=input_data.width,
-                count=1,
-                dtype=np.float32,
-                crs=input_data.crs,
-                transform=input_data.transform,
-            )
-            band = input_data.read(1)
-            output_data.write(band, 1)
-            output_data.close()
+    if raster_path is None or cog_profile is not None:
+        # if original data cannot be interpreted by large_image, or must be converted with
+        # a specific profile, convert it with rasterio
+        return write_cog(file, cog_path, cog_profile)
 
-    cog_path = file.parent / file.name.replace(file.suffix, "tiff")
     # use large_image to convert new raster data to COG
     large_image_converter.convert(str(raster_path), str(cog_path), overwrite=True)
     return cog_path
 
 
-def convert_files(*files, file_item=None, combine=False):  # noqa: C901, PLR0912
+def iter_vector_features(file: Path, source_projection: str | None) -> Iterator[dict]:
+    """
+    Yield the features of a shapefile or GeoJSON file, reprojected to EPSG:4326.
+
+    Features are read one at a time, and reprojected in chunks of `FEATURE_CHUNK_SIZE`, so
+    memory use doesn't grow with the size of the file. Shapefiles are in `source_projection`,
+    and GeoJSON files in the CRS named by their `crs` member, if any.
+    """
+    with contextlib.ExitStack() as stack:
+        if file.name.endswith(".shp"):
+            reader = stack.enter_context(shapefile.Reader(file))
+            features = (record.__geo_interface__ for record in reader.iterShapeRecords())
+        else:
+            with file.open(encoding="utf-8") as f:
+                source_projection = get_geojson_crs(f)
+            features = iter_geojson_features(stack.enter_context(file.open(encoding="utf-8")))
+
+        for chunk in itertools.batched(features, FEATURE_CHUNK_SIZE):
+            gdf = geopandas.GeoDataFrame.from_features(chunk)
+            if source_projection is not None:
+                gdf = gdf.set_crs(source_projection, allow_override=True)
+                gdf = gdf.to_crs(4326)
+            yield from json.loads(gdf.to_json())["features"]
+
+
+def create_vector_data(
+    name: str, files: list[Path], file_item, metadata: dict, source_projection: str | None
+) -> VectorData:
+    """Create a VectorData of the features of vector files, combined in one GeoJSON file."""
+    # Features are streamed to a GeoJSON file in a directory of its own, rather than loaded,
+    # so that it can't overwrite an input file
+    with tempfile.TemporaryDirectory() as temp_dir:
+        geojson_path = Path(temp_dir, "vectordata.geojson")
+        with geojson_path.open("w", encoding="utf-8") as f:
+            feature_count = write_feature_collection(
+                f,
+                (
+                    feature
+                    for file in files
+                    for feature in iter_vector_features(file, source_projection)
+                ),
+            )
+        vector_data = VectorData.objects.create(
+            name=name,
+            dataset=file_item.dataset,
+            source_file=file_item,
+            metadata=metadata,
+        )
+        with geojson_path.open("rb") as f:
+            vector_data.geojson_data.save(geojson_path.name, File(f))
+    vector_data.bump_data_version()
+    logger.info("%s created for %s with %d features", vector_data, name, feature_count)
+    return vector_data
+
+
+def convert_files(*files, file_item=None, combine=False, cog_profile=None):  # noqa: C901
     # Slow import, so do it lazily
     import large_image  # noqa: PLC0415
 
     source_projection = "epsg:4326"
-    geodata_set = []
+    vector_files = []
     cog_set = []
     metadata = {"source_filenames": []}
     for file in files:
@@ -83,77 +158,66 @@ def convert_files(*files, file_item=None, combine=False):  # noqa: C901, PLR0912
                 contents = f.read()
                 source_projection = contents.decode()
                 continue
-        elif file.name.endswith(".shp"):
-            reader = shapefile.Reader(file)
-            geodata_set.append(
-                {"name": file.name, "features": reader.__geo_interface__["features"]}
-            )
-        elif any(file.name.endswith(suffix) for suffix in [".json", ".geojson"]):
-            with file.open("rb") as f:
-                data = json.load(f)
-                geodata_set.append({"name": file.name, "features": data.get("features")})
-                source_projection = data.get("crs", {}).get("properties", {}).get("name")
+        elif any(file.name.endswith(suffix) for suffix in [".shp", ".json", ".geojson"]):
+            vector_files.append(file)
         elif any(file.name.endswith(suffix) for suffix in RASTER_FILETYPES):
-            cog_path = get_cog_path(file)
+            cog_path = get_cog_path(file, cog_profile)
             if cog_path:
                 cog_set.append({"name": file.name, "path": cog_path})
         elif not any(file.name.endswith(suffix) for suffix in IGNORE_FILETYPES):
             logger.info("Unable to convert %s", file.name)
 
-    if combine:
-        # combine only works for vector data currently, assumes consistent projection
-        all_features = []
-        for geodata in geodata_set:
-            all_features += geodata.get("features")
-        geodata_set = [{"name": file_item.name, "features": all_features}]
-
-    for geodata in geodata_set:
-        data, features = geodata.get("data"), geodata.get("features")
-        if data is None and len(features):
-            gdf = geopandas.GeoDataFrame.from_features(features)
-            if source_projection is not None:
-                gdf = gdf.set_crs(source_projection, allow_override=True)
-                gdf = gdf.to_crs(4326)
-            data = json.loads(gdf.to_json())
-        vector_data = VectorData.objects.create(
-            name=geodata.get("name"),
-            dataset=file_item.dataset,
-            source_file=file_item,
-            metadata=metadata,
+    vector_sets = [{"name": file.name, "files": [file]} for file in vector_files]
+    if combine and vector_files:
+        # combine only works for vector data currently
+        vector_sets = [{"name": file_item.name, "files": vector_files}]
+
+    for vector_set in vector_sets:
+        create_vector_data(
+            vector_set["name"], vector_set["files"], file_item, metadata, source_projection
         )
-        vector_data.write_geojson_data(data)
-        logger.info("%s created for %s", vector_data, geodata.get("name"))
 
     for cog in cog_set:
         cog_path = cog.get("path")
         source = large_image.open(cog_path)
         metadata.update(source.getMetadata())
+        with rasterio.open(cog_path) as dataset:
+            stats = compute_raster_stats(dataset, len(metadata.get("frames") or []) or 1)
         raster_data = RasterData.objects.create(
             name=cog.get("name"),
             dataset=file_item.dataset,
             source_file=file_item,
-            metadata=metadata,
+            metadata={**metadata, "stats": stats},
         )
         with cog_path.open("rb") as f:
             raster_data.cloud_optimized_geotiff.save(cog_path.name, File(f))
+        raster_data.bump_data_version()
         logger.info("%s created for %s", raster_data, cog.get("name"))
 
 
-def convert_file_item(file_item):
-    path = utilities.field_file_to_local_path(file_item.file)
-    if file_item.file_type == "zip":
-        # write contents to temporary directory for conversion
-        with tempfile.TemporaryDirectory() as temp_dir, zipfile.ZipFile(path) as zip_archive:
-            files = []
-            for file in zip_archive.infolist():
-                if not file.is_dir():
-                    filepath = Path(temp_dir, Path(file.filename).name)
-                    with filepath.open("wb") as f:
-                        f.write(zip_archive.open(file).read())
-                    files.append(filepath)
+def convert_file_item(file_item, layer_options=None):
+    cog_profile = get_cog_profile(file_item, layer_options)
+    # Conversion writes beside its input files, so they're placed in a temporary directory
+    # rather than in the shared file cache
+    with (
+        cached_local_path(file_item.file) as path,
+        tempfile.TemporaryDirectory() as temp_dir,
+    ):
+        if file_item.file_type == "zip":
+            # write contents to temporary directory for conversion
+            with zipfile.ZipFile(path) as zip_archive:
+                files = []
+                for file in zip_archive.infolist():
+                    if not file.is_dir():
+                        filepath = Path(temp_dir, Path(file.filename).name)
+                        with zip_archive.open(file) as member, filepath.open("wb") as f:
+                            shutil.copyfileobj(member, f)
+                        files.append(filepath)
             combine = False
             if file_item.metadata:
                 combine = file_item.metadata.get("combine_contents", combine)
-            convert_files(*files, file_item=file_item, combine=combine)
-    else:
-        convert_files(path, file_item=file_item)
+            convert_files(*files, file_item=file_item, combine=combine, cog_profile=cog_profile)
+        else:
+            link_path = Path(temp_dir, path.name)
+            link_path.symlink_to(path)
+            convert_files(link_path, file_item=file_item, cog_profile=cog_profile)
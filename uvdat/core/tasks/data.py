@@ -1,27 +1,111 @@
 from __future__ import annotations
 
+import codecs
+import itertools
 import json
 import logging
 
 from django.contrib.gis.geos import GEOSGeometry
+from django.db import connection, transaction
 
-from uvdat.core.models import VectorData, VectorFeature
+from uvdat.core.geojson import FEATURE_CHUNK_SIZE, iter_geojson_features
+from uvdat.core.models import SimplifiedGeometry, VectorData, VectorFeature
+from uvdat.core.tiles.mercator import WEB_MERCATOR_WIDTH
 
 logger = logging.getLogger(__name__)
 
+# Simplified geometries are generated for zooms 0-4, 5-8 and 9-12;
+# features are served at full resolution beyond the last band
+DEFAULT_ZOOM_BANDS = [4, 8, 12]
 
-def create_vector_features(vector_data: VectorData):
-    features = vector_data.read_geojson_data()["features"]
-    vector_features = [
-        VectorFeature(
-            vector_data=vector_data,
-            geometry=GEOSGeometry(json.dumps(feature["geometry"])),
-            properties=feature["properties"],
-        )
-        for feature in features
-    ]
+# Geometries are simplified to the size of one pixel of a 256px tile at the band's maximum zoom
+SIMPLIFIED_GEOMETRY_SQL = """
+INSERT INTO core_simplifiedgeometry (feature_id, min_zoom, max_zoom, geometry)
+SELECT feature_id, %(min_zoom)s, %(max_zoom)s, geometry
+FROM (
+    SELECT
+        t.id AS feature_id,
+        t.web_mercator_geometry AS original,
+        ST_Simplify(t.web_mercator_geometry, %(tolerance)s, true) AS geometry
+    FROM core_vectorfeature t
+    WHERE
+        t.vector_data_id = %(vector_data_id)s
+        AND ST_Dimension(t.web_mercator_geometry) > 0
+) simplified
+WHERE ST_NPoints(geometry) < ST_NPoints(original)
+;
+"""
 
-    created = VectorFeature.objects.bulk_create(vector_features)
-    logger.info("%d vector features created.", len(created))
 
-    return created
+def create_vector_features(vector_data: VectorData) -> int:
+    """
+    Create the VectorFeatures of the GeoJSON data of a VectorData, returning their count.
+
+    Features are read from the file one at a time and saved in chunks, so memory use doesn't
+    grow with the size of the file.
+    """
+    count = 0
+    with transaction.atomic(), vector_data.geojson_data.open("rb") as f:
+        features = iter_geojson_features(codecs.getreader("utf-8")(f))
+        for chunk in itertools.batched(features, FEATURE_CHUNK_SIZE):
+            vector_features = [
+                VectorFeature(
+                    vector_data=vector_data,
+                    geometry=GEOSGeometry(json.dumps(feature["geometry"])),
+                    properties=feature["properties"],
+                )
+                for feature in chunk
+            ]
+            count += len(VectorFeature.objects.bulk_create(vector_features))
+    logger.info("%d vector features created.", count)
+    vector_data.bump_data_version()
+
+    return count
+
+
+def get_zoom_bands(vector_data: VectorData, layer_options: list[dict] | None = None) -> list[int]:
+    """
+    Return the maximum zoom of each generalization band of a VectorData.
+
+    Bands may be configured with a `zoom_bands` list in the metadata of a layer in
+    `layer_options`, either for the layer showing this VectorData or for all layers without
+    a specific `data` name. An empty list disables simplification.
+    """
+    for layer_info in layer_options or []:
+        metadata = layer_info.get("metadata") or {}
+        data_name = layer_info.get("data")
+        if "zoom_bands" in metadata and data_name in (None, vector_data.name):
+            return sorted(int(zoom) for zoom in metadata["zoom_bands"])
+    return DEFAULT_ZOOM_BANDS
+
+
+def create_simplified_geometries(vector_data: VectorData, zoom_bands: list[int] | None = None):
+    """
+    Create a pyramid of simplified geometries for rendering low zoom vector tiles.
+
+    It must be rebuilt whenever the features of the VectorData are recreated; until then,
+    features without simplified geometries are rendered from their full geometry.
+    """
+    if zoom_bands is None:
+        zoom_bands = DEFAULT_ZOOM_BANDS
+
+    with transaction.atomic():
+        SimplifiedGeometry.objects.filter(feature__vector_data=vector_data).delete()
+        min_zoom = 0
+        with connection.cursor() as cursor:
+            for max_zoom in sorted(zoom_bands):
+                cursor.execute(
+                    SIMPLIFIED_GEOMETRY_SQL,
+                    {
+                        "min_zoom": min_zoom,
+                        "max_zoom": max_zoom,
+                        "tolerance": WEB_MERCATOR_WIDTH / (256 * 2**max_zoom),
+                        "vector_data_id": vector_data.id,
+                    },
+                )
+                logger.info(
+                    "%d geometries simplified for zooms %d-%d.", cursor.rowcount, min_zoom, max_zoom
+                )
+                min_zoom = max_zoom + 1
+
+    vector_data.bump_data_version()
@@ -13,9 +13,10 @@ from uvdat.core.models import (
     TaskResult,
     VectorData,
 )
+from uvdat.core.raster.mosaic import build_mosaic_overviews, get_mosaic_rasters
 
 from .conversion import convert_file_item
-from .data import create_vector_features
+from .data import create_simplified_geometries, create_vector_features, get_zoom_bands
 from .networks import create_network
 from .regions import create_source_regions
 
@@ -163,7 +164,7 @@ def convert_dataset(
     for file_to_convert in FileItem.objects.filter(dataset=dataset):
         if result is not None:
             result.write_status(f"Converting file {file_to_convert.name}...")
-        convert_file_item(file_to_convert)
+        convert_file_item(file_to_convert, layer_options)
 
     vectors = VectorData.objects.filter(dataset=dataset)
     for vector_data in vectors.all():
@@ -177,12 +178,22 @@ def convert_dataset(
         else:
             create_vector_features(vector_data)
 
+        create_simplified_geometries(vector_data, get_zoom_bands(vector_data, layer_options))
         vector_data.get_summary()
 
     create_layers_and_frames(dataset, layer_options)
 
+    # Datasets of several rasters are also served as one mosaic, which needs overviews
+    if len(get_mosaic_rasters(dataset)) > 1:
+        build_dataset_mosaic.delay(dataset.id)
+
     dataset.processing = False
     dataset.save()
 
     if result is not None:
         result.complete()
+
+
+@shared_task
+def build_dataset_mosaic(dataset_id):
+    build_mosaic_overviews(Dataset.objects.get(id=dataset_id))
@@ -13,6 +13,8 @@ if TYPE_CHECKING:
 
 from uvdat.core.models import Network, NetworkEdge, NetworkNode, VectorData, VectorFeature
 
+from .data import create_simplified_geometries
+
 logger = logging.getLogger(__name__)
 
 
@@ -190,7 +192,7 @@ def create_network(vector_data, network_options):
         VectorFeature.objects.filter(vector_data=vector_data).count(),
     )
 
-    # rewrite vector_data geojson_data with updated features
+    # rewrite vector_data geojson_data with updated features, which bumps its data version
     vector_data.write_geojson_data(geojson_from_network(vector_data.dataset))
     vector_data.metadata["network"] = True
     vector_data.save()
@@ -258,3 +260,5 @@ def create_vector_features_from_network(network):
             for edge in network.edges.all()
         ]
     )
+    # Recreated features have no simplified geometries, and simplifying bumps the data version
+    create_simplified_geometries(vector_data)
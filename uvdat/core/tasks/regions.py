@@ -71,3 +71,4 @@ def create_source_regions(vector_data, region_options):
 
     all_features = VectorFeature.objects.filter(vector_data=vector_data)
     logger.info("%d vector features created.", all_features.count())
+    vector_data.bump_data_version()
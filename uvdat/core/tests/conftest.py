@@ -88,6 +88,13 @@ def authenticated_api_client(user) -> APIClient:
     return client
 
 
+@pytest.fixture
+def superuser_api_client(superuser) -> APIClient:
+    client = APIClient()
+    client.force_authenticate(user=superuser)
+    return client
+
+
 @pytest.fixture
 def token(user) -> str:
     token, _ = Token.objects.get_or_create(user=user)
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import os
+
+import pytest
+
+from uvdat.core.file_cache import LocalFileCache, cached_local_path
+
+
+@pytest.mark.django_db
+def test_cached_local_path(settings, tmp_path, raster_data):
+    settings.UVDAT_FILE_CACHE_DIR = str(tmp_path)
+    field_file = raster_data.cloud_optimized_geotiff
+
+    with cached_local_path(field_file) as path:
+        assert path.is_relative_to(tmp_path)
+        assert path.stat().st_size == field_file.size
+    with cached_local_path(field_file) as cached_path:
+        assert cached_path == path
+
+    assert LocalFileCache(tmp_path, 0).stats() == {"hits": 1, "misses": 1}
+
+
+@pytest.mark.django_db
+def test_file_cache_evicts_least_recently_used(tmp_path, raster_data_factory):
+    first, second, third = (raster_data_factory().cloud_optimized_geotiff for _ in range(3))
+    cache = LocalFileCache(tmp_path, max_size=first.size * 2)
+
+    with cache.local_path(first) as first_path:
+        pass
+    with cache.local_path(second) as second_path:
+        pass
+    # Make the first entry the least recently used
+    os.utime(first_path, (0, 0))
+
+    with cache.local_path(third) as third_path:
+        assert third_path.exists()
+    assert not first_path.exists()
+    assert second_path.exists()
+
+    # Entries in use are not evicted
+    with cache.local_path(second) as second_path:
+        os.utime(second_path, (0, 0))
+        with cache.local_path(first) as first_path:
+            assert second_path.exists()
+            assert first_path.exists()
+
+
+@pytest.mark.django_db
+def test_file_cache_versioned_entries(tmp_path, raster_data, mocker):
+    field_file = raster_data.cloud_optimized_geotiff
+    cache = LocalFileCache(tmp_path, max_size=field_file.size * 3)
+    with cache.local_path(field_file) as path:
+        pass
+
+    # Files of a new data version are new entries
+    raster_data.bump_data_version()
+    with cache.local_path(field_file) as new_path:
+        assert new_path != path
+
+    # Failed downloads leave no partial files
+    raster_data.bump_data_version()
+    mocker.patch("uvdat.core.file_cache.shutil.copyfileobj", side_effect=OSError("failed"))
+    with pytest.raises(OSError, match="failed"), cache.local_path(field_file):
+        pass
+    assert sorted(tmp_path.glob("*/*")) == sorted([path, new_path])
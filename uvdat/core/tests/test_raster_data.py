@@ -0,0 +1,645 @@
+from __future__ import annotations
+
+import io
+import json
+
+from django.contrib.gis.geos import MultiPolygon, Point, Polygon
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.http import HttpResponse
+from django_large_image.rest import LargeImageFileDetailMixin
+import numpy as np
+from PIL import Image
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+from rest_framework.test import APIClient
+import tifftools
+
+from uvdat.core.models import (
+    Chart,
+    ColorConfig,
+    Colormap,
+    ColormapConfig,
+    DerivedRasterData,
+    Region,
+)
+from uvdat.core.raster import (
+    RasterWindow,
+    RasterWindowError,
+    parse_window_options,
+    read_raster_window,
+)
+from uvdat.core.raster.cog import (
+    CogProfileError,
+    get_cog_creation_options,
+    parse_cog_profile,
+    write_cog,
+    write_multiframe_cog,
+)
+from uvdat.core.raster.colormap import BandStyle, apply_band_style, get_band_styles
+from uvdat.core.raster.derived import (
+    DerivedRasterError,
+    evaluate_expression,
+    parse_inputs,
+    read_derived_window,
+)
+from uvdat.core.raster.mosaic import build_mosaic_overviews, get_mosaic
+from uvdat.core.raster.sampling import sample_raster
+from uvdat.core.raster.stats import compute_raster_stats, get_raster_stats, get_value_range
+from uvdat.core.raster.vsi import get_vsi_path
+from uvdat.core.tasks.conversion import get_cog_profile
+
+
+def test_parse_window_options():
+    assert parse_window_options({}) == (
+        {"bbox": None, "bbox_srs": "EPSG:4326", "band": 1, "frame": 0, "size": 512},
+        "float32",
+    )
+    options, dtype = parse_window_options(
+        {"bbox": "-72,42,-71,43", "band": "2", "size": "64", "dtype": "uint16"}
+    )
+    assert options["bbox"] == (-72, 42, -71, 43)
+    assert options["band"] == 2
+    assert options["size"] == 64
+    assert dtype == "uint16"
+
+    for params in [
+        {"bbox": "1,2,3"},
+        {"bbox": "3,2,1,4"},
+        {"size": "0"},
+        {"size": "big"},
+        {"dtype": "int8"},
+        {"bbox_srs": "EPSG:nope"},
+    ]:
+        with pytest.raises(RasterWindowError):
+            parse_window_options(params)
+
+
+@pytest.mark.django_db
+def test_rest_raster_window(superuser_api_client, raster_data):
+    url = f"/api/v1/rasters/{raster_data.id}/raster-data/"
+
+    resp = superuser_api_client.get(url, {"size": 64})
+    assert resp.status_code == 200
+    assert resp["X-Raster-Dtype"] == "float32"
+    height, width = (int(n) for n in resp["X-Raster-Shape"].split(","))
+    assert max(height, width) == 64
+    data = np.frombuffer(resp.content, dtype="<f4").reshape(height, width)
+    assert np.isfinite(data).any()
+    xmin, ymin, xmax, ymax = (float(b) for b in resp["X-Raster-Bounds"].split(","))
+    assert xmin < xmax
+    assert ymin < ymax
+
+    # A window of the raster, read as uint16
+    bbox = f"{xmin},{ymin},{(xmin + xmax) / 2},{(ymin + ymax) / 2}"
+    resp = superuser_api_client.get(url, {"bbox": bbox, "size": 16, "dtype": "uint16"})
+    assert resp.status_code == 200
+    height, width = (int(n) for n in resp["X-Raster-Shape"].split(","))
+    assert len(resp.content) == height * width * 2
+
+    assert superuser_api_client.get(url, {"band": 5}).status_code == 400
+    assert (
+        superuser_api_client.get(url, {"bbox": "0,0,1,1", "bbox_srs": "EPSG:3857"}).status_code
+        == 400
+    )
+    # Without a bbox, the spatial reference is still needed for the bounds of the window
+    assert superuser_api_client.get(url, {"bbox_srs": "EPSG:nope"}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_rest_raster_data_resolution(superuser_api_client, raster_data):
+
+    resp = superuser_api_client.get(f"/api/v1/rasters/{raster_data.id}/raster-data/1/")
+    assert resp.status_code == 200
+    data = json.loads(resp.content)
+    assert len(data) > 1
+    assert len(data[0]) > 1
+
+
+@pytest.mark.django_db
+def test_get_image_data_masked(raster_data, mocker):
+    data = np.ma.masked_array([[1.5, np.nan], [3.0, 4.0]], mask=[[False, False], [True, False]])
+    mocker.patch(
+        "uvdat.core.raster.read_raster_window", return_value=RasterWindow(data, (0, 0, 1, 1))
+    )
+    # Masked and NaN values are null rather than fill values
+    assert raster_data.get_image_data() == [[1.5, None], [None, 4.0]]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("mode", ["vsis3", "vsicurl", "local"])
+def test_read_raster_window_modes(settings, tmp_path, raster_data, mode):
+    settings.UVDAT_RASTER_READ_MODE = mode
+    settings.UVDAT_FILE_CACHE_DIR = str(tmp_path)
+
+    window = read_raster_window(raster_data, size=32)
+    assert max(window.data.shape) == 32
+
+
+@pytest.mark.django_db
+def test_get_vsi_path(settings, raster_data):
+    field_file = raster_data.cloud_optimized_geotiff
+
+    settings.UVDAT_RASTER_READ_MODE = "vsis3"
+    path, options = get_vsi_path(field_file)
+    assert path == f"/vsis3/{field_file.storage.bucket_name}/{field_file.name}"
+    assert options["AWS_VIRTUAL_HOSTING"] == "FALSE"
+
+    settings.UVDAT_RASTER_READ_MODE = "vsicurl"
+    path, options = get_vsi_path(field_file)
+    assert path.startswith("/vsicurl/http")
+    assert "AWS_ACCESS_KEY_ID" not in options
+
+
+@pytest.mark.django_db
+def test_dataset_mosaic(settings, tmp_path, raster_data_factory):
+    settings.UVDAT_MOSAIC_DIR = str(tmp_path)
+    settings.UVDAT_RASTER_READ_MODE = "vsis3"
+    rasters = raster_data_factory.create_batch(2)
+    dataset = rasters[0].dataset
+    rasters[1].dataset = dataset
+    rasters[1].save()
+
+    mosaic = get_mosaic(dataset)
+    with rasterio.Env(**mosaic.options), rasterio.open(mosaic.path) as vrt:
+        assert (vrt.width, vrt.count) == (4323, 3)
+        assert vrt.overviews(1) == []
+    assert get_mosaic(dataset) == mosaic
+
+    # Overviews are kept in storage, so that every process serving the mosaic can read them
+    overview_name = build_mosaic_overviews(dataset)
+    assert default_storage.exists(overview_name)
+    dataset.refresh_from_db()
+    mosaic = get_mosaic(dataset)
+    assert mosaic.path.name == "mosaic-s3-overviews.vrt"
+    # Overviews are found although directories aren't listed
+    with rasterio.Env(**mosaic.options), rasterio.open(mosaic.path) as vrt:
+        assert len(vrt.overviews(1)) == 4
+
+    # Mosaics and overviews of previous data are removed when overviews are built
+    rasters[1].bump_data_version()
+    assert get_mosaic(dataset).key != mosaic.key
+    assert build_mosaic_overviews(dataset) != overview_name
+    assert not mosaic.path.exists()
+    assert not default_storage.exists(overview_name)
+
+
+@pytest.mark.django_db
+def test_rest_dataset_mosaic(settings, tmp_path, superuser_api_client, raster_data):
+    settings.UVDAT_MOSAIC_DIR = str(tmp_path)
+
+    resp = superuser_api_client.get(f"/api/v1/mosaics/{raster_data.dataset.id}/info/metadata/")
+    assert resp.status_code == 200
+    assert resp.json()["sizeX"] == 4323
+
+    resp = superuser_api_client.get(f"/api/v1/mosaics/{raster_data.dataset.id}/tiles/0/0/0.png")
+    assert resp.status_code == 200
+    assert resp["Content-Type"] == "image/png"
+
+    raster_data.delete()
+    resp = superuser_api_client.get(f"/api/v1/mosaics/{raster_data.dataset.id}/info/metadata/")
+    assert resp.status_code == 404
+
+
+def test_apply_band_style():
+    markers = ((0.0, "#000000"), (0.5, "#ff0000"), (1.0, "#ffffff"))
+    style = BandStyle(1, markers, 10.0, 20.0, None, clamp=False)
+
+    data = np.ma.masked_array(np.array([5, 10, 15, 20, 25, 30], dtype=np.uint8))
+    data[5] = np.ma.masked
+    colors = apply_band_style(data, style)
+    assert colors.tolist() == [
+        [0, 0, 0, 0],
+        [0, 0, 0, 255],
+        [255, 0, 0, 255],
+        [255, 255, 255, 255],
+        [0, 0, 0, 0],
+        [0, 0, 0, 0],
+    ]
+    # Float data is colored by position in the range, and clamped data by the closest end
+    colors = apply_band_style(data.astype(np.float32), style._replace(clamp=True))
+    assert colors[:5, 0].tolist() == [0, 0, 255, 255, 255]
+    assert colors[5].tolist() == [0, 0, 0, 0]
+
+    discrete = apply_band_style(data, style._replace(discrete_colors=2))
+    assert discrete[1:4, 0].tolist() == [0, 255, 255]
+
+
+@pytest.mark.django_db
+def test_get_band_styles_range(raster_data, layer_style_factory):
+    colormap = Colormap.objects.create(
+        name="red", markers=[{"color": "#000000", "value": 0}, {"color": "#ff0000", "value": 1}]
+    )
+    style = layer_style_factory(default_frame=0)
+    color_config = ColorConfig.objects.create(style=style, name="Band 1")
+    colormap_config = ColormapConfig.objects.create(
+        color_config=color_config, colormap=colormap, color_by="", null_color="", clamp=True
+    )
+    band_style = get_band_styles(style, raster_data)[0]
+
+    # Each bound not set by the style spans the values of the band
+    colormap_config.range_minimum = -5
+    colormap_config.save()
+    styled = get_band_styles(style, raster_data)[0]
+    assert (styled.minimum, styled.maximum) == (-5, band_style.maximum)
+
+
+@pytest.mark.django_db
+def test_rest_raster_tile_conditional(superuser_api_client, raster_data, mocker):
+    render = mocker.patch.object(
+        LargeImageFileDetailMixin, "tile", return_value=HttpResponse(b"tile")
+    )
+    url = f"/api/v1/rasters/{raster_data.id}/tiles/10/163/395.png"
+
+    resp = superuser_api_client.get(url, {"v": raster_data.data_version})
+    assert resp.status_code == 200
+    assert "immutable" in resp["Cache-Control"]
+
+    # Current copies are validated before rendering, whichever version the URL names
+    resp = superuser_api_client.get(url, HTTP_IF_NONE_MATCH=resp["ETag"])
+    assert resp.status_code == 304
+    assert render.call_count == 1
+
+    raster_data.bump_data_version()
+    resp = superuser_api_client.get(url, HTTP_IF_NONE_MATCH=resp["ETag"])
+    assert resp.status_code == 200
+    assert render.call_count == 2
+
+
+@pytest.mark.django_db
+def test_rest_raster_styled_tile(superuser_api_client, raster_data, layer_style_factory):
+    colormap = Colormap.objects.create(
+        name="red", markers=[{"color": "#000000", "value": 0}, {"color": "#ff0000", "value": 1}]
+    )
+    style = layer_style_factory(default_frame=0)
+    color_config = ColorConfig.objects.create(style=style, name="Band 1")
+    ColormapConfig.objects.create(
+        color_config=color_config, colormap=colormap, color_by="", null_color="", clamp=True
+    )
+    assert get_band_styles(style, raster_data)[0].band == 1
+    url = f"/api/v1/rasters/{raster_data.id}/tiles/10/163/395.png"
+
+    resp = superuser_api_client.get(url, {"style_id": style.id})
+    assert resp.status_code == 200
+    assert resp["Content-Type"] == "image/png"
+    with Image.open(io.BytesIO(resp.content)) as image:
+        pixels = np.asarray(image)
+    assert pixels.shape == (256, 256, 4)
+    assert pixels[..., 3].any()
+    assert not pixels[..., 1:3].any()
+
+    resp = superuser_api_client.get(url, {"style_id": style.id}, HTTP_IF_NONE_MATCH=resp["ETag"])
+    assert resp.status_code == 304
+
+    # Tiles are rendered again once the colormap changes
+    colormap.markers = [{"color": "#000000", "value": 0}, {"color": "#00ff00", "value": 1}]
+    colormap.save()
+    resp = superuser_api_client.get(url, {"style_id": style.id})
+    with Image.open(io.BytesIO(resp.content)) as image:
+        pixels = np.asarray(image)
+    assert pixels[..., 1].any()
+
+    assert (
+        superuser_api_client.get(url.replace(".png", ".jpeg"), {"style_id": style.id}).status_code
+        == 400
+    )
+    assert superuser_api_client.get(url, {"style_id": "red"}).status_code == 400
+    assert superuser_api_client.get(url, {"style_id": style.id + 1}).status_code == 404
+
+
+def test_evaluate_expression():
+    nir = np.ma.masked_array(np.array([10, 0, 5], dtype=np.uint8), mask=[False, False, True])
+    red = np.ma.masked_array(np.array([2, 0, 5], dtype=np.uint16))
+
+    ndvi = evaluate_expression("(nir - red) / (nir + red)", {"nir": nir, "red": red})
+    assert ndvi.dtype == np.float32
+    assert ndvi[0] == pytest.approx(2 / 3)
+    # Divisions by zero and masked inputs are masked
+    assert ndvi.mask.tolist() == [False, True, True]
+
+    depth = evaluate_expression("where(nir > 3, nir - 3, 0)", {"nir": nir})
+    assert depth.filled(-1).tolist() == [7, 0, -1]
+    assert evaluate_expression("1", {"nir": nir}).tolist() == [1, 1, 1]
+
+    for expression in ["__import__('os')", "nir.real", "nir[0]", "where(nir)", "swir + 1", "'1'"]:
+        with pytest.raises(DerivedRasterError):
+            evaluate_expression(expression, {"nir": nir})
+    with pytest.raises(DerivedRasterError):
+        parse_inputs({"nir": {"raster": "1"}})
+
+
+@pytest.mark.django_db
+def test_rest_derived_raster(superuser_api_client, raster_data, raster_data_factory):
+    resp = superuser_api_client.post(
+        "/api/v1/derived-rasters/",
+        {
+            "name": "Index",
+            "dataset": raster_data.dataset.id,
+            "expression": "(b1 - b2) / (b1 + b2 + 1)",
+            "inputs": {
+                "b1": {"raster": raster_data.id},
+                "b2": {"raster": raster_data.id, "band": 2},
+            },
+        },
+        format="json",
+    )
+    assert resp.status_code == 201
+    derived = DerivedRasterData.objects.get(id=resp.json()["id"])
+    assert resp.json()["data_version"] == 1
+
+    resp = superuser_api_client.get(
+        f"/api/v1/derived-rasters/{derived.id}/raster-data/", {"size": "64", "dtype": "float32"}
+    )
+    assert resp.status_code == 200
+    shape = tuple(int(n) for n in resp["X-Raster-Shape"].split(","))
+    assert max(shape) == 64
+    values = np.frombuffer(resp.content, dtype="<f4").reshape(shape)
+    assert np.isfinite(values).any()
+    assert read_derived_window(derived, size=64).data.shape == shape
+    resp = superuser_api_client.get(
+        f"/api/v1/derived-rasters/{derived.id}/raster-data/", {"bbox_srs": "EPSG:nope"}
+    )
+    assert resp.status_code == 400
+
+    url = f"/api/v1/derived-rasters/{derived.id}/tiles/10/163/395.png"
+    resp = superuser_api_client.get(url, {"min": "-1", "max": "1"})
+    assert resp.status_code == 200
+    assert resp["Content-Type"] == "image/png"
+    with Image.open(io.BytesIO(resp.content)) as image:
+        assert np.asarray(image)[..., 3].any()
+    assert superuser_api_client.get(url, HTTP_IF_NONE_MATCH=resp["ETag"]).status_code == 304
+    # Without a range, tiles span the range of the derived raster
+    assert superuser_api_client.get(url).status_code == 200
+    assert "range" in DerivedRasterData.objects.get(id=derived.id).metadata
+    assert superuser_api_client.get(url, {"min": "low"}).status_code == 400
+
+    # Tiles of a previous expression aren't served again
+    resp = superuser_api_client.patch(
+        f"/api/v1/derived-rasters/{derived.id}/", {"expression": "b1 > 100"}, format="json"
+    )
+    assert resp.status_code == 200
+    assert resp.json()["data_version"] == 2
+    assert resp.json()["metadata"] is None
+
+    # Inputs are rasters of the dataset of the derived raster
+    other = raster_data_factory()
+    for body in [
+        {"expression": "b1 +"},
+        {"expression": "b3"},
+        {"inputs": {"b1": {"raster": other.id}, "b2": {"raster": other.id}}},
+    ]:
+        resp = superuser_api_client.patch(
+            f"/api/v1/derived-rasters/{derived.id}/", body, format="json"
+        )
+        assert resp.status_code == 400
+
+
+@pytest.mark.django_db
+def test_get_raster_stats(raster_data):
+    raster_data.metadata = {}
+    raster_data.save()
+    # Metadata changed since the raster was read is kept
+    type(raster_data).objects.filter(pk=raster_data.pk).update(metadata={"sizeX": 1})
+
+    stats = get_raster_stats(raster_data)
+    assert stats
+    assert raster_data.metadata == {"sizeX": 1, "stats": stats}
+    raster_data.refresh_from_db()
+    assert raster_data.metadata == {"sizeX": 1, "stats": stats}
+    band = stats[0]
+    assert band["frame"] == 0
+    assert band["band"] == 1
+    assert band["min"] <= band["mean"] <= band["max"]
+    percentiles = [band["percentiles"][p] for p in ["2", "25", "50", "75", "98"]]
+    assert percentiles == sorted(percentiles)
+    assert sum(band["histogram"]["counts"]) == band["count"]
+
+    assert get_value_range(raster_data) == [band["percentiles"]["2"], band["percentiles"]["98"]]
+    assert get_value_range(raster_data, band=len(stats) + 1) is None
+
+
+@pytest.mark.django_db
+def test_rest_raster_stats(superuser_api_client, raster_data):
+    url = f"/api/v1/rasters/{raster_data.id}/stats/"
+
+    resp = superuser_api_client.get(url)
+    assert resp.status_code == 200
+    assert resp.json() == get_raster_stats(raster_data)
+
+    resp = superuser_api_client.get(url, {"band": 1})
+    assert [s["band"] for s in resp.json()] == [1]
+
+    resp = superuser_api_client.get(url, {"band": 1}, HTTP_IF_NONE_MATCH=resp["ETag"])
+    assert resp.status_code == 304
+
+
+@pytest.mark.django_db
+def test_sample_raster(raster_data):
+    xmin, ymin, xmax, ymax = read_raster_window(raster_data, size=8).bounds
+    center = Point((xmin + xmax) / 2, (ymin + ymax) / 2, srid=4326)
+    outside = Point(xmax + 1, ymax + 1, srid=4326)
+    zone = Polygon.from_bbox((xmin, ymin, xmax, ymax))
+    zone.srid = 4326
+
+    result = sample_raster(raster_data, points=[center, outside], zones=[zone], threshold=0)
+    assert result["frames"] == [0]
+    [[center_value], [outside_value]] = result["points"]
+    assert outside_value is None
+    [[zone_stats]] = result["zones"]
+    # The zone may miss pixels at the corners of the raster, once projected
+    full = read_raster_window(raster_data, size=None).data
+    assert 0 < zone_stats["count"] <= full.count()
+    assert zone_stats["min"] >= float(full.min())
+    assert zone_stats["max"] <= float(full.max())
+    assert zone_stats["min"] <= zone_stats["mean"] <= zone_stats["max"]
+    assert zone_stats["count_above"] <= zone_stats["count"]
+    if center_value is not None:
+        assert zone_stats["min"] <= center_value <= zone_stats["max"]
+
+    with pytest.raises(RasterWindowError):
+        sample_raster(raster_data, points=[center], frames=[1])
+
+
+@pytest.mark.django_db
+def test_rest_raster_sample(superuser_api_client, raster_data):
+    url = f"/api/v1/rasters/{raster_data.id}/sample/"
+    xmin, ymin, xmax, ymax = read_raster_window(raster_data, size=8).bounds
+    region = Region.objects.create(
+        name="Region",
+        dataset=raster_data.dataset,
+        boundary=MultiPolygon(Polygon.from_bbox((xmin, ymin, xmax, ymax)), srid=4326),
+    )
+    box = {
+        "type": "Polygon",
+        "coordinates": [[[xmin, ymin], [xmax, ymin], [xmax, ymax], [xmin, ymax], [xmin, ymin]]],
+    }
+
+    resp = superuser_api_client.post(
+        url,
+        {
+            "points": [[(xmin + xmax) / 2, (ymin + ymax) / 2]],
+            "geometries": [box],
+            "regions": [region.id],
+        },
+        format="json",
+    )
+    assert resp.status_code == 200
+    data = resp.json()
+    assert len(data["points"]) == 1
+    # The geometry and the region cover the same pixels
+    assert data["zones"][0] == data["zones"][1]
+
+    assert superuser_api_client.post(url, {"points": [[0]]}, format="json").status_code == 400
+    assert (
+        superuser_api_client.post(url, {"regions": [region.id + 1]}, format="json").status_code
+        == 404
+    )
+
+
+@pytest.mark.django_db
+def test_rest_raster_time_series(project, project_factory, raster_data):
+    project.datasets.add(raster_data.dataset)
+    client = APIClient()
+    client.force_authenticate(user=project.owner())
+    url = f"/api/v1/rasters/{raster_data.id}/time-series/"
+    xmin, ymin, xmax, ymax = read_raster_window(raster_data, size=8).bounds
+    points = [[(xmin + xmax) / 2, (ymin + ymax) / 2], [xmax + 1, ymax + 1]]
+
+    resp = client.post(url, {"points": points}, format="json")
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["frames"] == [0]
+    assert len(data["series"]) == 2
+    assert data["series"][1] == [None]
+    assert "chart" not in data
+
+    resp = client.post(
+        url,
+        {"points": points, "labels": ["Center", "Outside"], "chart": {"project": project.id}},
+        format="json",
+    )
+    assert resp.status_code == 200
+    chart = Chart.objects.get(id=resp.json()["chart"])
+    assert chart.project == project
+    assert [d["label"] for d in chart.chart_data["datasets"]] == ["Center", "Outside"]
+    assert chart.chart_data["datasets"][1]["data"] == [None]
+
+    # Chart names are unique within a project
+    resp = client.post(url, {"points": points, "chart": {"project": project.id}}, format="json")
+    assert resp.status_code == 400
+    Chart.objects.create(name="Depths", project=project_factory(), chart_data={})
+    resp = client.post(
+        url, {"points": points, "chart": {"project": project.id, "name": "Depths"}}, format="json"
+    )
+    assert resp.status_code == 200
+
+    for body in (
+        {"chart": "Depths"},
+        {"chart": {"project": "first"}},
+        {"chart": {"project": project.id}, "labels": "Center"},
+    ):
+        assert client.post(url, {"points": points, **body}, format="json").status_code == 400
+    assert client.post(url, {"points": []}, format="json").status_code == 400
+
+
+def write_geotiff(path, data):
+    with rasterio.open(
+        path,
+        "w",
+        driver="GTiff",
+        height=data.shape[1],
+        width=data.shape[2],
+        count=data.shape[0],
+        dtype=data.dtype,
+        nodata=-1,
+        crs="EPSG:4326",
+        transform=from_origin(-72, 43, 0.001, 0.001),
+    ) as dataset:
+        dataset.write(data)
+    return path
+
+
+def test_write_cog(tmp_path):
+    data = np.arange(3 * 1024 * 1024, dtype=np.int16).reshape(3, 1024, 1024) % 1000
+    source_path = write_geotiff(tmp_path / "source.tif", data)
+
+    cog_path = write_cog(source_path, tmp_path / "cog.tiff")
+    with rasterio.open(cog_path) as cog:
+        assert cog.driver == "GTiff"
+        assert cog.count == 3
+        assert cog.dtypes == ("int16", "int16", "int16")
+        assert cog.nodata == -1
+        assert cog.block_shapes[0] == (512, 512)
+        assert cog.overviews(1)
+        assert (cog.read() == data).all()
+
+
+def test_write_multiframe_cog(tmp_path):
+    frames = [np.full((1, 1024, 1024), i, dtype=np.float32) for i in range(3)]
+    source_path = tmp_path / "source.tif"
+    tifftools.tiff_concat(
+        [str(write_geotiff(tmp_path / f"{i}.tif", data)) for i, data in enumerate(frames)],
+        str(source_path),
+    )
+
+    cog_path = write_multiframe_cog(source_path, tmp_path / "cog.tiff")
+    with rasterio.open(cog_path) as cog:
+        assert len(cog.subdatasets) == 3
+        for i, path in enumerate(cog.subdatasets):
+            with rasterio.open(path) as page:
+                assert page.block_shapes[0] == (512, 512)
+                assert page.overviews(1)
+                assert (page.read(1) == i).all()
+
+        stats = compute_raster_stats(cog, frame_count=3)
+    assert [(s["frame"], s["min"], s["max"]) for s in stats] == [(i, i, i) for i in range(3)]
+
+    assert write_multiframe_cog(write_geotiff(tmp_path / "single.tif", frames[0]), cog_path) is None
+
+
+def test_parse_cog_profile():
+    assert parse_cog_profile(None)["compression"] == "DEFLATE"
+    profile = parse_cog_profile({"profile": "depth", "tile_size": 256})
+    assert profile["compression"] == "LERC_ZSTD"
+    assert profile["resampling"] == "AVERAGE"
+    assert profile["tile_size"] == 256
+    assert get_cog_creation_options(profile)["MAX_Z_ERROR"] == 0.001
+    assert "PREDICTOR" not in get_cog_creation_options(profile)
+    assert get_cog_creation_options(parse_cog_profile("zstd"))["PREDICTOR"] == "YES"
+
+    for value in ["unknown", {"compression": "jpeg2000"}, {"tile_size": 100}, {"level": "high"}]:
+        with pytest.raises(CogProfileError):
+            parse_cog_profile(value)
+
+
+@pytest.mark.django_db
+def test_get_cog_profile(file_item):
+    file_item.metadata = {}
+    assert get_cog_profile(file_item) is None
+    layer_options = [
+        {"name": "Other", "source_files": ["other.tif"], "metadata": {"cog_profile": "zstd"}},
+        {"name": "Depth", "source_files": [file_item.name], "metadata": {"cog_profile": "depth"}},
+    ]
+    assert get_cog_profile(file_item, layer_options)["compression"] == "LERC_ZSTD"
+    file_item.metadata = {"cog_profile": {"profile": "zstd", "level": 3}}
+    assert get_cog_profile(file_item, layer_options)["level"] == 3
+
+
+def test_write_cog_profile(tmp_path):
+    data = np.linspace(0, 3, 512 * 512, dtype=np.float32).reshape(1, 512, 512)
+    source_path = write_geotiff(tmp_path / "source.tif", data)
+
+    cog_path = write_cog(source_path, tmp_path / "cog.tiff", parse_cog_profile("depth"))
+    with rasterio.open(cog_path) as cog:
+        assert cog.profile["compress"] == "lerc_zstd"
+        assert np.abs(cog.read() - data).max() <= 0.001 * 1.001
+
+
+@pytest.mark.django_db
+def test_benchmark_cog_profiles(tmp_path, capsys):
+    data = np.zeros((1, 1024, 1024), dtype=np.float32)
+    source_path = write_geotiff(tmp_path / "source.tif", data)
+
+    call_command("benchmark_cog_profiles", str(source_path), "--profile", "zstd", "--reads", "3")
+    assert "source.tif" in capsys.readouterr().out
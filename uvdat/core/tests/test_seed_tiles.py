@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import json
+
+from django.core.management import call_command
+import pytest
+
+from uvdat.core.file_cache import cached_local_path
+from uvdat.core.tasks.data import create_vector_features
+from uvdat.core.tiles import RenderedTile
+from uvdat.core.tiles.archive import (
+    TileArchive,
+    get_archive_path,
+    get_tile_ranges,
+    read_archived_tile,
+    save_archive,
+)
+from uvdat.core.tiles.budget import parse_tile_budget
+
+
+@pytest.fixture
+def tile_archive_dir(settings, tmp_path):
+    settings.UVDAT_TILE_ARCHIVE_DIR = str(tmp_path / "archives")
+    settings.UVDAT_FILE_CACHE_DIR = str(tmp_path / "file_cache")
+    return tmp_path / "archives"
+
+
+def test_get_tile_ranges():
+    assert get_tile_ranges((-1, -1, 1, 1), 0) == (range(1), range(1))
+    # The extent covers the corners of the four tiles around the origin
+    assert get_tile_ranges((-1, -1, 1, 1), 1) == (range(2), range(2))
+    # Only the north-east tile covers a positive extent
+    assert get_tile_ranges((1, 1, 2, 2), 1) == (range(1, 2), range(1))
+
+
+def test_tile_archive(tmp_path):
+    archive = TileArchive(tmp_path / "test.mbtiles", readonly=False)
+    archive.write_tiles([(1, 0, 0, b"tile")])
+    assert archive.get_seeded_tiles() == {(1, 0, 0)}
+    assert archive.read_tile(1, 0, 0) == b"tile"
+    assert archive.read_tile(1, 1, 1) == b""
+    # Rows are numbered from the south, as the MBTiles specification requires
+    assert archive.connection.execute("SELECT tile_row FROM tiles").fetchone() == (1,)
+    archive.close()
+
+
+@pytest.mark.django_db
+def test_seed_tiles(settings, tile_archive_dir, vector_data):
+    settings.UVDAT_TILE_MAX_FEATURES = 1000
+    create_vector_features(vector_data)
+    call_command("seed_tiles", "--vector", vector_data.id, "--max-zoom", 2, "--processes", 1)
+
+    # Archives are seeded locally, then saved to storage
+    assert not get_archive_path(vector_data).exists()
+    vector_data.refresh_from_db()
+    with cached_local_path(vector_data.tile_archive) as path:
+        archive = TileArchive(path)
+        metadata = archive.metadata
+        assert metadata["complete"] == "true"
+        assert json.loads(metadata["properties"]) is None
+        budget = json.loads(metadata["budget"])
+        assert budget == parse_tile_budget()
+        assert archive.get_seeded_tiles()
+        archive.close()
+
+    assert read_archived_tile(vector_data, 0, 0, 0, None, budget)
+    # Archives are only used for the properties and budget they were seeded with,
+    # and their zoom range
+    assert read_archived_tile(vector_data, 0, 0, 0, ["prop0"], budget) is None
+    assert read_archived_tile(vector_data, 0, 0, 0, None, None) is None
+    assert read_archived_tile(vector_data, 3, 0, 0, None, budget) is None
+    # Archives are not served for newer data
+    vector_data.bump_data_version()
+    assert read_archived_tile(vector_data, 0, 0, 0, None, budget) is None
+
+
+@pytest.mark.django_db
+def test_rest_vector_tile_archived(tile_archive_dir, superuser_api_client, vector_data, mocker):
+    archive = TileArchive(get_archive_path(vector_data), readonly=False)
+    archive.set_metadata(
+        minzoom="0",
+        maxzoom="2",
+        properties="null",
+        budget=json.dumps(parse_tile_budget()),
+        complete="true",
+    )
+    archive.write_tiles([(1, 0, 0, b"archived")])
+    archive.close()
+    save_archive(vector_data, get_archive_path(vector_data))
+    render = mocker.patch(
+        "uvdat.core.tiles.vector.render_vector_tile", return_value=RenderedTile(b"live")
+    )
+    url = f"/api/v1/vectors/{vector_data.id}/tiles/1/0/0/"
+
+    resp = superuser_api_client.get(url)
+    assert resp.content == b"archived"
+    render.assert_not_called()
+
+    # Filtered tiles are rendered live
+    resp = superuser_api_client.get(url, {"prop0": "value0"})
+    assert resp.content == b"live"
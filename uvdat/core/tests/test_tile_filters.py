@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+from django.db import connection
+import pytest
+
+from uvdat.core.tasks.data import create_vector_features
+from uvdat.core.tiles.filters import FilterError, compile_filters
+
+
+def count_features(vector_data, filters):
+    filter_sql, params = compile_filters(filters)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT count(*) FROM core_vectorfeature t "
+            f"WHERE t.vector_data_id = %(vector_data_id)s{filter_sql}",
+            {"vector_data_id": vector_data.id, **params},
+        )
+        return cursor.fetchone()[0]
+
+
+def test_compile_filters_binds_values():
+    sql, params = compile_filters({"name": "x' OR 1=1 --"})
+    assert "OR 1=1" not in sql
+    assert params == {"filter_0": ['{"name": "x\' OR 1=1 --"}']}
+
+
+def test_compile_filters_typed_candidates():
+    _, params = compile_filters({"a.b": "1"})
+    assert params == {"filter_0": ['{"a": {"b": "1"}}', '{"a": {"b": 1}}']}
+
+
+def test_compile_filters_unknown_lookup_is_property_name():
+    _, params = compile_filters({"depth__max": "1"})
+    assert params["filter_0"][0] == '{"depth__max": "1"}'
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        {"depth__gte": "deep"},
+        {"depth__lt": "NaN"},
+        {"depth__isnull": "maybe"},
+    ],
+)
+def test_compile_filters_invalid(filters):
+    with pytest.raises(FilterError):
+        compile_filters(filters)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    ("filters", "expected"),
+    [
+        ({}, 3),
+        ({"prop0": "value0"}, 3),
+        ({"prop0": "other"}, 0),
+        ({"prop1": "0"}, 1),
+        ({"prop1.this": "that"}, 1),
+        ({"prop0__in": "other,value0"}, 3),
+        ({"prop1__gte": "0"}, 1),
+        ({"prop1__lt": "0"}, 0),
+        ({"prop1__isnull": "true"}, 1),
+        ({"prop1__isnull": "false", "prop1__gt": "-1"}, 1),
+    ],
+)
+def test_filter_features(vector_data, filters, expected):
+    create_vector_features(vector_data)
+    assert count_features(vector_data, filters) == expected
+
+
+@pytest.mark.django_db
+def test_rest_vector_tile_invalid_filter(superuser_api_client, vector_data):
+    resp = superuser_api_client.get(
+        f"/api/v1/vectors/{vector_data.id}/tiles/1/0/0/", {"prop1__gte": "deep"}
+    )
+    assert resp.status_code == 400
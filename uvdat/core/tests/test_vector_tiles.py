@@ -0,0 +1,502 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+import io
+import json
+import os
+import threading
+
+from django.core.cache import caches
+import pytest
+from rest_framework.test import APIClient
+
+from uvdat.core.geojson import (
+    GeoJSONStreamError,
+    get_geojson_crs,
+    iter_geojson_features,
+    write_feature_collection,
+)
+from uvdat.core.models import (
+    ColorConfig,
+    ColormapConfig,
+    FilterConfig,
+    SimplifiedGeometry,
+)
+from uvdat.core.tasks.conversion import convert_files
+from uvdat.core.tasks.data import (
+    create_simplified_geometries,
+    create_vector_features,
+    get_zoom_bands,
+)
+from uvdat.core.tiles import RenderedTile, render_vector_tile
+from uvdat.core.tiles.budget import parse_tile_budget
+from uvdat.core.tiles.cache import TILE_CACHE_ALIAS, LRUFileBasedCache
+from uvdat.core.tiles.cluster import get_zoom_cluster, parse_cluster_options
+from uvdat.core.tiles.properties import (
+    ALWAYS_INCLUDED_PROPERTIES,
+    get_style_properties,
+    parse_properties,
+)
+from uvdat.core.tiles.singleflight import coalesce
+
+
+def test_lru_file_based_cache_evicts_least_recently_used(tmp_path):
+    cache = LRUFileBasedCache(str(tmp_path), {"OPTIONS": {"MAX_ENTRIES": 3}})
+    for i, key in enumerate(["a", "b", "c"]):
+        cache.set(key, key)
+        # Backdate entries, so their order doesn't depend on filesystem timestamp resolution
+        os.utime(cache._key_to_file(key), (1000 + i, 1000 + i))
+
+    # Reading "a" makes it the most recently used entry
+    assert cache.get("a") == "a"
+    cache.set("d", "d")
+
+    assert cache.get("a") == "a"
+    assert cache.get("b") is None
+    assert cache.get("d") == "d"
+
+
+@pytest.mark.django_db
+def test_rest_vector_tile_cached(superuser_api_client, vector_data, mocker):
+    render = mocker.patch(
+        "uvdat.core.tiles.vector.render_vector_tile", return_value=RenderedTile(b"tile")
+    )
+    url = f"/api/v1/vectors/{vector_data.id}/tiles/1/0/0/"
+
+    resp = superuser_api_client.get(url, {"a": 1, "b": 2})
+    assert resp.status_code == 200
+    assert resp.content == b"tile"
+
+    # The order of filters does not matter
+    resp = superuser_api_client.get(url, {"b": 2, "a": 1})
+    assert resp.content == b"tile"
+    assert render.call_count == 1
+
+    vector_data.bump_data_version()
+    superuser_api_client.get(url, {"a": 1, "b": 2})
+    assert render.call_count == 2
+
+
+def test_iter_geojson_features():
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [i, -i]},
+            "properties": {"name": f"point {i}", "tags": [{"value": i}]},
+        }
+        for i in range(3)
+    ]
+    text = json.dumps(
+        {
+            "type": "FeatureCollection",
+            "features": features,
+            "crs": {"type": "name", "properties": {"name": "EPSG:3857"}},
+        },
+        indent=2,
+    )
+    assert list(iter_geojson_features(io.StringIO(text))) == features
+    # The CRS is found after the features, without keeping them
+    assert get_geojson_crs(io.StringIO(text)) == "EPSG:3857"
+    assert get_geojson_crs(io.StringIO('{"features": []}')) is None
+
+    output = io.StringIO()
+    assert write_feature_collection(output, iter(features)) == 3
+    assert json.loads(output.getvalue())["features"] == features
+
+    for text in ['{"features": [1,', '{"features": {}}', "[]"]:
+        with pytest.raises(GeoJSONStreamError):
+            list(iter_geojson_features(io.StringIO(text)))
+
+
+@pytest.mark.django_db
+def test_convert_geojson_file(monkeypatch, tmp_path, file_item):
+    # Features are reprojected in several chunks
+    monkeypatch.setattr("uvdat.core.tasks.conversion.FEATURE_CHUNK_SIZE", 2)
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [i * 100000.0, 0.0]},
+            "properties": {"index": i, "tags": {"value": i}},
+        }
+        for i in range(5)
+    ]
+    path = tmp_path / "points.geojson"
+    path.write_text(
+        json.dumps(
+            {
+                "type": "FeatureCollection",
+                "crs": {"type": "name", "properties": {"name": "EPSG:3857"}},
+                "features": features,
+            }
+        )
+    )
+    convert_files(path, file_item=file_item)
+
+    vector_data = file_item.dataset.vectors.get()
+    assert create_vector_features(vector_data) == 5
+    feature = vector_data.features.get(properties__index=4)
+    assert feature.geometry.x == pytest.approx(400000 / 20037508.342789244 * 180)
+    assert feature.properties["tags"] == {"value": 4}
+
+
+@pytest.mark.django_db
+def test_vector_feature_web_mercator_geometry(vector_data):
+    create_vector_features(vector_data)
+
+    feature = next(f for f in vector_data.features.all() if f.geometry.geom_type == "Point")
+    assert feature.web_mercator_geometry.srid == 3857
+    assert feature.web_mercator_geometry.coords == pytest.approx(
+        feature.geometry.transform(3857, clone=True).coords
+    )
+
+
+@pytest.mark.django_db
+def test_get_zoom_bands(vector_data):
+    assert get_zoom_bands(vector_data) == [4, 8, 12]
+    assert get_zoom_bands(vector_data, [{"metadata": {"zoom_bands": [10, 5]}}]) == [5, 10]
+    assert get_zoom_bands(vector_data, [{"data": "other", "metadata": {"zoom_bands": []}}]) == [
+        4,
+        8,
+        12,
+    ]
+    assert (
+        get_zoom_bands(vector_data, [{"data": vector_data.name, "metadata": {"zoom_bands": []}}])
+        == []
+    )
+
+
+@pytest.mark.django_db
+def test_create_simplified_geometries(vector_data):
+    create_vector_features(vector_data)
+    create_simplified_geometries(vector_data, [2, 6])
+
+    simplified = SimplifiedGeometry.objects.filter(feature__vector_data=vector_data)
+    for geometry in simplified:
+        assert geometry.geometry.srid == 3857
+        assert geometry.geometry.num_points < geometry.feature.web_mercator_geometry.num_points
+        assert (geometry.min_zoom, geometry.max_zoom) in [(0, 2), (3, 6)]
+
+    # Regenerating the pyramid replaces previous bands
+    create_simplified_geometries(vector_data, [])
+    assert not simplified.exists()
+
+
+def test_parse_properties():
+    assert parse_properties("b, a,,b") == ["a", "b"]
+    assert parse_properties("*") is None
+
+
+@pytest.mark.django_db
+def test_get_style_properties(vector_data, layer_frame_factory, layer_style_factory):
+    frame = layer_frame_factory(vector=vector_data, raster=None, source_filters={"year": 2020})
+    # Without styles, all properties are kept
+    assert get_style_properties(vector_data.id) is None
+
+    style = layer_style_factory(layer=frame.layer)
+    color_config = ColorConfig.objects.create(style=style, name="all")
+    ColormapConfig.objects.create(color_config=color_config, color_by="depth", null_color="")
+    FilterConfig.objects.create(style=style, filter_by="day", values_list=["sunday"])
+
+    assert get_style_properties(vector_data.id) == sorted(
+        ALWAYS_INCLUDED_PROPERTIES | {"year", "depth", "day"}
+    )
+
+
+@pytest.mark.django_db
+def test_rest_vector_tile_properties(
+    superuser_api_client, vector_data, layer_frame_factory, mocker
+):
+    render = mocker.patch(
+        "uvdat.core.tiles.vector.render_vector_tile", return_value=RenderedTile(b"tile")
+    )
+    url = f"/api/v1/vectors/{vector_data.id}/tiles/1/0/0/"
+
+    superuser_api_client.get(url, {"properties": "b,a", "c": 1})
+    render.assert_called_with(
+        vector_data.id, 1, 0, 0, {"c": "1"}, ["a", "b"], None, mocker.ANY, "default"
+    )
+
+    superuser_api_client.get(url, {"properties": "*"})
+    render.assert_called_with(vector_data.id, 1, 0, 0, {}, None, None, mocker.ANY, "default")
+
+    # All properties are kept by default, and styled properties on request
+    superuser_api_client.get(url)
+    render.assert_called_with(vector_data.id, 1, 0, 0, {}, None, None, mocker.ANY, "default")
+    get_style_properties = mocker.patch(
+        "uvdat.core.tiles.vector.get_style_properties", return_value=["depth"]
+    )
+    superuser_api_client.get(url, {"properties": "style"})
+    render.assert_called_with(vector_data.id, 1, 0, 0, {}, ["depth"], None, mocker.ANY, "default")
+
+    # Style properties are only looked up to render tiles, which are rendered again once
+    # layers change
+    superuser_api_client.get(url, {"properties": "style"})
+    assert get_style_properties.call_count == 1
+    layer_frame_factory(vector=vector_data, raster=None)
+    superuser_api_client.get(url, {"properties": "style"})
+    assert get_style_properties.call_count == 2
+
+
+@pytest.mark.django_db
+def test_rest_vector_feature(
+    superuser_api_client, authenticated_api_client, vector_data, vector_data_factory
+):
+    create_vector_features(vector_data)
+    feature = vector_data.features.first()
+    url = f"/api/v1/vectors/{vector_data.id}/features/{feature.id}/"
+
+    resp = superuser_api_client.get(url)
+    assert resp.status_code == 200
+    assert resp.json() == {"id": feature.id, "properties": feature.properties}
+    assert superuser_api_client.get(url, HTTP_IF_NONE_MATCH=resp["ETag"]).status_code == 304
+
+    # Features are only found within their VectorData
+    other_url = f"/api/v1/vectors/{vector_data_factory().id}/features/{feature.id}/"
+    assert superuser_api_client.get(other_url).status_code == 404
+    assert authenticated_api_client.get(url).status_code == 404
+
+
+@pytest.mark.django_db
+def test_rest_combined_vector_tiles(superuser_api_client, vector_data_factory, mocker):
+    mocker.patch(
+        "uvdat.core.tiles.vector.render_vector_tile",
+        side_effect=lambda *args: RenderedTile(f"[{args[-1]}]".encode()),
+    )
+    vectors = [vector_data_factory(), vector_data_factory()]
+
+    resp = superuser_api_client.get(
+        "/api/v1/vectors/tiles/1/0/0/", {"vectors": ",".join(str(v.id) for v in vectors)}
+    )
+    assert resp.status_code == 200
+    assert resp.content == f"[{vectors[0].id}][{vectors[1].id}]".encode()
+
+
+@pytest.mark.django_db
+def test_rest_vector_tile_forbidden(authenticated_api_client, vector_data):
+    resp = authenticated_api_client.get(f"/api/v1/vectors/{vector_data.id}/tiles/1/0/0/")
+    assert resp.status_code == 404
+
+
+@pytest.mark.django_db
+def test_rest_combined_vector_tiles_forbidden(authenticated_api_client, vector_data):
+    resp = authenticated_api_client.get(
+        "/api/v1/vectors/tiles/1/0/0/", {"vectors": str(vector_data.id)}
+    )
+    assert resp.status_code == 404
+
+
+@pytest.mark.django_db
+def test_rest_batch_vector_tiles(superuser_api_client, vector_data_factory, mocker):
+    mocker.patch(
+        "uvdat.core.tiles.vector.render_vector_tile",
+        side_effect=lambda *args: RenderedTile(f"{args[1]}:{args[-1]}".encode()),
+    )
+    vectors = [vector_data_factory(), vector_data_factory()]
+
+    resp = superuser_api_client.post(
+        "/api/v1/vectors/tiles/batch/",
+        {
+            "tiles": [
+                {"vectors": [vectors[0].id], "z": 1, "x": 0, "y": 0},
+                {"vectors": [v.id for v in vectors], "z": 2, "x": 0, "y": 0, "properties": "*"},
+            ]
+        },
+        format="json",
+    )
+    assert resp.status_code == 200
+    combined = f"2:{vectors[0].id}2:{vectors[1].id}".encode()
+    assert resp.content == (
+        b"\x00\x00\x00\x091:default" + len(combined).to_bytes(4, "big") + combined
+    )
+
+    resp = superuser_api_client.post(
+        "/api/v1/vectors/tiles/batch/", {"tiles": [{"z": 1}]}, format="json"
+    )
+    assert resp.status_code == 400
+
+
+def test_parse_cluster_options():
+    assert parse_cluster_options(None) is None
+    assert parse_cluster_options("grid", "capacity", "8") == {
+        "method": "grid",
+        "property": "capacity",
+        "max_zoom": 8,
+    }
+    with pytest.raises(ValueError, match="Invalid cluster method"):
+        parse_cluster_options("dbscan")
+
+    cluster = parse_cluster_options("grid", max_zoom="8")
+    assert get_zoom_cluster(cluster, 8) == cluster
+    assert get_zoom_cluster(cluster, 9) is None
+
+
+@pytest.mark.django_db
+def test_rest_vector_tile_clustered(superuser_api_client, vector_data, mocker):
+    render = mocker.patch(
+        "uvdat.core.tiles.vector.render_vector_tile", return_value=RenderedTile(b"tile")
+    )
+    params = {"properties": "*", "cluster": "kmeans", "cluster_max_zoom": 4}
+    cluster = {"method": "kmeans", "property": None, "max_zoom": 4}
+
+    superuser_api_client.get(f"/api/v1/vectors/{vector_data.id}/tiles/4/0/0/", params)
+    render.assert_called_with(vector_data.id, 4, 0, 0, {}, None, cluster, mocker.ANY, "default")
+
+    # Points are not clustered beyond the maximum cluster zoom
+    superuser_api_client.get(f"/api/v1/vectors/{vector_data.id}/tiles/5/0/0/", params)
+    render.assert_called_with(vector_data.id, 5, 0, 0, {}, None, None, mocker.ANY, "default")
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("method", ["grid", "kmeans"])
+def test_render_clustered_vector_tile(vector_data, method):
+    create_vector_features(vector_data)
+    cluster = {"method": method, "property": "prop1", "max_zoom": 12}
+    assert render_vector_tile(vector_data.id, 0, 0, 0, cluster=cluster).data
+
+
+@pytest.mark.django_db
+def test_parse_tile_budget(settings):
+    # Budgets are disabled by default
+    assert parse_tile_budget() is None
+
+    settings.UVDAT_TILE_MAX_FEATURES = 100
+    assert parse_tile_budget() == {
+        "max_features": 100,
+        "max_bytes": None,
+        "priority": None,
+    }
+    assert parse_tile_budget("0", "1000", "rank") == {
+        "max_features": None,
+        "max_bytes": 1000,
+        "priority": "rank",
+    }
+    assert parse_tile_budget(max_features="0") is None
+    with pytest.raises(ValueError, match="Invalid tile budget"):
+        parse_tile_budget(max_features="-1")
+
+
+@pytest.mark.django_db
+def test_render_vector_tile_budget(vector_data):
+    create_vector_features(vector_data)
+    tile = render_vector_tile(vector_data.id, 0, 0, 0)
+    assert tile.dropped_features == 0
+
+    budget = {"max_features": 1, "max_bytes": None, "priority": None}
+    limited = render_vector_tile(vector_data.id, 0, 0, 0, budget=budget)
+    assert limited.dropped_features == 2
+    assert 0 < len(limited.data) < len(tile.data)
+
+    # Tiles over the byte budget drop features until they fit
+    budget = {"max_features": None, "max_bytes": len(tile.data) - 1, "priority": None}
+    limited = render_vector_tile(vector_data.id, 0, 0, 0, budget=budget)
+    assert limited.dropped_features
+    assert len(limited.data) < len(tile.data)
+
+
+@pytest.mark.django_db
+def test_rest_vector_tile_dropped_features(superuser_api_client, vector_data, mocker):
+    render = mocker.patch(
+        "uvdat.core.tiles.vector.render_vector_tile", return_value=RenderedTile(b"tile", 5)
+    )
+    resp = superuser_api_client.get(
+        f"/api/v1/vectors/{vector_data.id}/tiles/1/0/0/", {"max_features": 10}
+    )
+    assert resp["X-Tile-Dropped-Features"] == "5"
+    assert render.call_args.args[7] == {
+        "max_features": 10,
+        "max_bytes": mocker.ANY,
+        "priority": None,
+    }
+
+
+@pytest.mark.django_db
+def test_rest_vector_tile_conditional(superuser_api_client, vector_data, mocker):
+    render = mocker.patch(
+        "uvdat.core.tiles.vector.render_vector_tile", return_value=RenderedTile(b"tile")
+    )
+    url = f"/api/v1/vectors/{vector_data.id}/tiles/1/0/0/"
+
+    resp = superuser_api_client.get(url)
+    etag = resp["ETag"]
+    assert "no-cache" in resp["Cache-Control"]
+    assert resp["Last-Modified"]
+
+    resp = superuser_api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert resp.status_code == 304
+    assert render.call_count == 1
+
+    # Tiles depend on the layer style and metadata too, so are revalidated at any version
+    resp = superuser_api_client.get(url, {"v": vector_data.data_version})
+    assert resp["ETag"] == etag
+    assert "immutable" not in resp["Cache-Control"]
+    assert "no-cache" in resp["Cache-Control"]
+
+    vector_data.bump_data_version()
+    resp = superuser_api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert resp.status_code == 200
+    assert resp["ETag"] != etag
+    assert render.call_count == 2
+
+
+@pytest.mark.django_db
+def test_rest_vector_summary_conditional(superuser_api_client, vector_data):
+    vector_data.summary = {"properties": {}, "color_props_coverage": "none"}
+    vector_data.save()
+    url = f"/api/v1/vectors/{vector_data.id}/summary/"
+
+    resp = superuser_api_client.get(url)
+    assert resp.status_code == 200
+    resp = superuser_api_client.get(url, HTTP_IF_NONE_MATCH=resp["ETag"])
+    assert resp.status_code == 304
+
+
+def test_coalesce_concurrent_calls():
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "tile"
+
+    with ThreadPoolExecutor(4) as pool:
+        leader = pool.submit(coalesce, "coalesce-test", compute)
+        started.wait(5)
+        followers = [pool.submit(coalesce, "coalesce-test", compute) for _ in range(3)]
+        release.set()
+        results = [leader.result(), *(f.result() for f in followers)]
+
+    assert results == ["tile"] * 4
+    assert len(calls) == 1
+
+
+def test_coalesce_waits_for_other_process():
+    cache = caches[TILE_CACHE_ALIAS]
+    # Another process holds the lock, and stores the result once it's computed
+    cache.add("single-flight:coalesce-wait-test", 1)
+    threading.Timer(0.2, cache.set, ("coalesce-wait-test", "tile")).start()
+
+    assert coalesce("coalesce-wait-test", lambda: "computed") == "tile"
+
+
+@pytest.mark.django_db
+def test_rest_vector_tile_diagnostics(authenticated_api_client, superuser_factory, vector_data):
+    create_vector_features(vector_data)
+    url = f"/api/v1/vectors/{vector_data.id}/tiles/0/0/0/diagnostics/"
+
+    # Diagnostics are only available to staff
+    assert authenticated_api_client.get(url).status_code == 403
+
+    client = APIClient()
+    client.force_authenticate(user=superuser_factory(is_staff=True))
+    resp = client.get(url, {"properties": "*", "max_features": 1})
+    assert resp.status_code == 200
+    report = resp.json()
+    assert report["feature_count"] == 3
+    assert report["dropped_features"] == 2
+    assert report["bytes"] > 0
+    assert report["queries"] == 1
+    assert report["sql_time_ms"] <= report["total_time_ms"]
+    assert any("Buffers" in line or "Execution Time" in line for line in report["plan"])
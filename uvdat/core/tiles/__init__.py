@@ -0,0 +1,17 @@
+from __future__ import annotations
+
+from .vector import (
+    RenderedTile,
+    encode_tile_batch,
+    get_vector_tile,
+    get_vector_tile_key,
+    render_vector_tile,
+)
+
+__all__ = [
+    "RenderedTile",
+    "encode_tile_batch",
+    "get_vector_tile",
+    "get_vector_tile_key",
+    "render_vector_tile",
+]
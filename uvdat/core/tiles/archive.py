@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import contextlib
+import gzip
+import json
+import math
+from pathlib import Path
+import sqlite3
+from typing import TYPE_CHECKING
+
+from django.conf import settings
+from django.core.files import File
+
+from uvdat.core.file_cache import cached_local_path
+
+from .mercator import WEB_MERCATOR_WIDTH
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+    from uvdat.core.models import VectorData
+
+    from .budget import TileBudget
+
+MBTILES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS tiles (
+    zoom_level INTEGER,
+    tile_column INTEGER,
+    tile_row INTEGER,
+    tile_data BLOB,
+    PRIMARY KEY (zoom_level, tile_column, tile_row)
+);
+"""
+
+
+def get_archive_name(vector_data: VectorData) -> str:
+    """
+    Return the file name of the MBTiles archive of a VectorData.
+
+    Archives are named by data version, so an archive is never served for newer data.
+    """
+    return f"vector-{vector_data.id}-v{vector_data.data_version}.mbtiles"
+
+
+def get_archive_path(vector_data: VectorData) -> Path:
+    """Return the local path where the MBTiles archive of a VectorData is seeded."""
+    return Path(settings.UVDAT_TILE_ARCHIVE_DIR) / get_archive_name(vector_data)
+
+
+def save_archive(vector_data: VectorData, path: Path):
+    """
+    Save a seeded archive as the `tile_archive` of a VectorData, replacing any previous one.
+
+    Archives are kept in storage, so that every process serving tiles can read them, from
+    a local copy in its file cache.
+    """
+    previous = vector_data.tile_archive.name if vector_data.tile_archive else None
+    with path.open("rb") as f:
+        vector_data.tile_archive.save(get_archive_name(vector_data), File(f), save=False)
+    vector_data.save(update_fields=["tile_archive"])
+    if previous:
+        vector_data.tile_archive.storage.delete(previous)
+
+
+def get_tile_ranges(extent: tuple[float, float, float, float], zoom: int) -> tuple[range, range]:
+    """Return the ranges of x and y of the tiles at a zoom covering a web mercator extent."""
+    n = 2**zoom
+    tile_size = WEB_MERCATOR_WIDTH / n
+    xmin, ymin, xmax, ymax = extent
+
+    def clamp(value: float) -> int:
+        return min(max(math.floor(value), 0), n - 1)
+
+    origin = WEB_MERCATOR_WIDTH / 2
+    x_range = range(clamp((xmin + origin) / tile_size), clamp((xmax + origin) / tile_size) + 1)
+    y_range = range(clamp((origin - ymax) / tile_size), clamp((origin - ymin) / tile_size) + 1)
+    return x_range, y_range
+
+
+def iter_tiles(
+    extent: tuple[float, float, float, float], min_zoom: int, max_zoom: int
+) -> Iterator[tuple[int, int, int]]:
+    for z in range(min_zoom, max_zoom + 1):
+        x_range, y_range = get_tile_ranges(extent, z)
+        for x in x_range:
+            for y in y_range:
+                yield z, x, y
+
+
+class TileArchive:
+    """
+    An MBTiles archive of the vector tiles of a VectorData.
+
+    Tiles are stored gzipped, with TMS row numbering, as the MBTiles specification requires.
+    Empty tiles within the seeded extent are stored too, so that an archive can answer for
+    any tile in its zoom range. The archive is only served once seeding is complete.
+    """
+
+    def __init__(self, path: Path, *, readonly: bool = True):
+        self.path = path
+        if readonly:
+            self.connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self.connection = sqlite3.connect(path)
+            self.connection.executescript(MBTILES_SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    @property
+    def metadata(self) -> dict[str, str]:
+        return dict(self.connection.execute("SELECT name, value FROM metadata"))
+
+    def set_metadata(self, **metadata: str):
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)",
+                metadata.items(),
+            )
+
+    def get_seeded_tiles(self) -> set[tuple[int, int, int]]:
+        return {
+            (z, x, 2**z - 1 - row)
+            for z, x, row in self.connection.execute(
+                "SELECT zoom_level, tile_column, tile_row FROM tiles"
+            )
+        }
+
+    def write_tiles(self, tiles: list[tuple[int, int, int, bytes]]):
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)",
+                [(z, x, 2**z - 1 - y, gzip.compress(tile)) for z, x, y, tile in tiles],
+            )
+
+    def read_tile(self, z: int, x: int, y: int) -> bytes:
+        row = self.connection.execute(
+            "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (z, x, 2**z - 1 - y),
+        ).fetchone()
+        # Tiles outside of the seeded extent have no features
+        return gzip.decompress(row[0]) if row else b""
+
+
+def read_archived_tile(  # noqa: PLR0913
+    vector_data: VectorData,
+    z: int,
+    x: int,
+    y: int,
+    properties: list[str] | None,
+    budget: TileBudget | None,
+) -> bytes | None:
+    """
+    Return a tile from the archive of a VectorData, if there is a complete one.
+
+    Returns None if the tile isn't archived, including if the archive was seeded with
+    other properties or another tile budget than requested, or for previous data.
+    """
+    archive_file = vector_data.tile_archive
+    if not archive_file or Path(archive_file.name).name != get_archive_name(vector_data):
+        return None
+
+    with cached_local_path(archive_file) as path:
+        archive = TileArchive(path)
+        try:
+            metadata = archive.metadata
+            if (
+                metadata.get("complete") != "true"
+                or json.loads(metadata.get("properties", "null")) != properties
+                or json.loads(metadata.get("budget", "null")) != budget
+                or not int(metadata["minzoom"]) <= z <= int(metadata["maxzoom"])
+            ):
+                return None
+            return archive.read_tile(z, x, y)
+        except (sqlite3.Error, KeyError, ValueError):
+            return None
+        finally:
+            with contextlib.suppress(sqlite3.Error):
+                archive.close()
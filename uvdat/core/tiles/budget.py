@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+from typing import TypedDict
+
+from django.conf import settings
+
+from uvdat.core.models import Layer
+
+# MVT extent of tiles within their byte budget
+DEFAULT_EXTENT = 4096
+
+# At low zooms, tiles over their byte budget are first re-encoded with this coarser extent
+LOW_ZOOM_EXTENT = 1024
+LOW_ZOOM_MAX = 8
+
+# Features are ranked by a numeric priority property, if any, then by their area or length.
+# Features without priority rank below those with one.
+FEATURE_RANK_SQL = """row_number() OVER (
+            ORDER BY
+                CASE
+                    WHEN jsonb_typeof(t.properties #> %(priority)s::text[]) = 'number'
+                    THEN (t.properties #> %(priority)s::text[])::float8
+                END DESC NULLS LAST,
+                ST_Area(t.web_mercator_geometry) + ST_Length(t.web_mercator_geometry) DESC,
+                t.id
+        )"""
+
+
+class TileBudget(TypedDict):
+    max_features: int | None
+    max_bytes: int | None
+    priority: str | None
+
+
+def get_priority_property(vector_data_id: int) -> str | None:
+    """Return the `priority_property` declared in the metadata of layers showing a VectorData."""
+    for metadata in Layer.objects.filter(frames__vector_id=vector_data_id).values_list(
+        "metadata", flat=True
+    ):
+        if metadata and metadata.get("priority_property"):
+            return metadata["priority_property"]
+    return None
+
+
+def parse_tile_budget(
+    max_features: str | None = None,
+    max_bytes: str | None = None,
+    priority: str | None = None,
+) -> TileBudget | None:
+    """
+    Parse the budget query parameters of a tile request.
+
+    Limits default to the `UVDAT_TILE_MAX_FEATURES` and `UVDAT_TILE_MAX_BYTES` settings,
+    and a limit of 0 disables it. Returns None if there are no limits. Without a `priority`,
+    features are ranked by the priority property of their layers, found when rendering.
+    """
+    try:
+        budget: TileBudget = {
+            "max_features": int(
+                settings.UVDAT_TILE_MAX_FEATURES if max_features is None else max_features
+            )
+            or None,
+            "max_bytes": int(settings.UVDAT_TILE_MAX_BYTES if max_bytes is None else max_bytes)
+            or None,
+            "priority": priority or None,
+        }
+    except ValueError:
+        raise ValueError("Invalid tile budget.") from None
+    if any(
+        limit is not None and limit < 0 for limit in (budget["max_features"], budget["max_bytes"])
+    ):
+        raise ValueError("Invalid tile budget.")
+    if budget["max_features"] is None and budget["max_bytes"] is None:
+        return None
+    return budget
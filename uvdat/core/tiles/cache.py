@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING
+import uuid
+
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.db.models.signals import post_delete, post_save
+
+if TYPE_CHECKING:
+    from uvdat.core.models import Dataset, DerivedRasterData, RasterData, VectorData
+
+TILE_CACHE_ALIAS = "tiles"
+
+# Tiles whose options are found from the layers showing their VectorData, such as the
+# properties of layer styles, are keyed by this version, which is replaced when layers change
+LAYER_OPTIONS_VERSION_KEY = "vector-tile-layer-options"
+LAYER_OPTIONS_MODELS = [
+    "core.Layer",
+    "core.LayerFrame",
+    "core.LayerStyle",
+    "core.ColorConfig",
+    "core.ColormapConfig",
+    "core.SizeConfig",
+    "core.SizeRangeConfig",
+    "core.FilterConfig",
+]
+
+
+class LRUFileBasedCache(FileBasedCache):
+    """
+    File-based cache which evicts the least recently used entries.
+
+    In addition to the standard `MAX_ENTRIES` option, a `MAX_SIZE` option (in bytes) bounds the
+    total size of the cache directory. Entry recency is tracked by file modification time, which
+    is refreshed whenever an entry is read.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(location, params)
+        options = params.get("OPTIONS", {})
+        self._max_size = int(options.get("MAX_SIZE", 1024**3))
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, self._missing_key, version)
+        if value is self._missing_key:
+            return default
+        # The entry may have been culled by another process since it was read
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(self._key_to_file(key, version))
+        return value
+
+    def _cull(self):
+        entries = []
+        total_size = 0
+        for fname in self._list_cache_files():
+            try:
+                stat = Path(fname).stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, fname))
+            total_size += stat.st_size
+
+        if total_size < self._max_size and len(entries) < self._max_entries:
+            return
+
+        # Evict down to 90% of both limits, so that culling isn't needed on every write
+        target_size = self._max_size * 0.9
+        target_entries = self._max_entries * 0.9
+        remaining_entries = len(entries)
+        for _mtime, size, fname in sorted(entries):
+            if total_size <= target_size and remaining_entries <= target_entries:
+                break
+            # If deletion fails, another process has already removed the entry
+            self._delete(fname)
+            total_size -= size
+            remaining_entries -= 1
+
+
+def hash_filters(filters: dict | None) -> str:
+    """Return a stable hash of tile filters, independent of their order."""
+    normalized = sorted((str(k), str(v)) for k, v in (filters or {}).items())
+    return hashlib.sha256(json.dumps(normalized).encode()).hexdigest()[:16]
+
+
+def hash_properties(properties: list[str] | str | None) -> str:
+    """
+    Return a stable hash of the properties kept in a tile.
+
+    All properties hash to `*`, and names of property sets, such as `style`, to themselves.
+    """
+    if properties is None:
+        return "*"
+    if isinstance(properties, str):
+        return properties
+    return hashlib.sha256(json.dumps(sorted(properties)).encode()).hexdigest()[:16]
+
+
+def vector_tile_cache_key(  # noqa: PLR0913
+    vector_data: VectorData,
+    z: int,
+    x: int,
+    y: int,
+    filters: dict | None = None,
+    properties: list[str] | str | None = None,
+    cluster: dict | None = None,
+    budget: dict | None = None,
+    layer_name: str = "default",
+) -> str:
+    """
+    Return the cache key of a vector tile.
+
+    Keys are stamped with the data version of the VectorData, so tiles of previous
+    versions are never read again and are left to be evicted.
+    """
+    key = (
+        f"vector-tile:{vector_data.id}:{vector_data.data_version}:{z}/{x}/{y}:"
+        f"{hash_filters(filters)}:{hash_properties(properties)}"
+    )
+    if cluster is not None:
+        key = f"{key}:cluster-{hash_filters(cluster)}"
+    if budget is not None:
+        key = f"{key}:budget-{hash_filters(budget)}"
+    if layer_name != "default":
+        key = f"{key}:{layer_name}"
+    return key
+
+
+def get_layer_options_version() -> str:
+    """Return the version of the state of layers, for the keys of tiles depending on them."""
+    cache = caches[TILE_CACHE_ALIAS]
+    version = cache.get(LAYER_OPTIONS_VERSION_KEY)
+    if version is None:
+        # If the version was evicted, a new one is set, so that tiles aren't served for old layers
+        cache.add(LAYER_OPTIONS_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        version = cache.get(LAYER_OPTIONS_VERSION_KEY, "")
+    return version
+
+
+def replace_layer_options_version(**kwargs):
+    caches[TILE_CACHE_ALIAS].set(LAYER_OPTIONS_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+for model in LAYER_OPTIONS_MODELS:
+    post_save.connect(replace_layer_options_version, sender=model)
+    post_delete.connect(replace_layer_options_version, sender=model)
+
+
+def raster_tile_cache_key(raster_data: RasterData, path: str, query: str) -> str:
+    """Return the cache key of a raster tile, stamped with the data version of the RasterData."""
+    digest = hashlib.sha256(f"{path}?{query}".encode()).hexdigest()[:32]
+    return f"raster-tile:{raster_data.id}:{raster_data.data_version}:{digest}"
+
+
+def mosaic_tile_cache_key(dataset: Dataset, mosaic_key: str, path: str, query: str) -> str:
+    """Return the cache key of a tile of the mosaic of a dataset, stamped with its rasters."""
+    digest = hashlib.sha256(f"{path}?{query}".encode()).hexdigest()[:32]
+    return f"mosaic-tile:{dataset.id}:{mosaic_key}:{digest}"
+
+
+def derived_tile_cache_key(
+    derived: DerivedRasterData, derived_key: str, path: str, query: str
+) -> str:
+    """Return the cache key of a tile of a derived raster, stamped with its inputs."""
+    digest = hashlib.sha256(f"{path}?{query}".encode()).hexdigest()[:32]
+    return f"derived-tile:{derived.id}:{derived_key}:{digest}"
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+from typing import TypedDict
+
+from .mercator import WEB_MERCATOR_WIDTH
+
+CLUSTER_METHODS = {"grid", "kmeans"}
+
+# Points are clustered at zooms up to this one, unless requested otherwise
+DEFAULT_CLUSTER_MAX_ZOOM = 12
+
+# Grid clusters are cells of a 16x16 grid over each tile
+CLUSTER_GRID_CELLS = 16
+
+# K-means clustering groups the points of each tile into at most this many clusters
+CLUSTER_KMEANS_CLUSTERS = 64
+
+CLUSTER_ID_SQL = {
+    "grid": "ST_SnapToGrid(geom, %(grid_size)s)",
+    "kmeans": (
+        "ST_ClusterKMeans(geom, LEAST(%(clusters)s, (SELECT count(*) FROM points))::int) OVER ()"
+    ),
+}
+
+# Points are aggregated into clusters, with a count and statistics of a numeric property.
+# Other features are rendered, and identified, as in unclustered tiles.
+CLUSTERED_VECTOR_TILE_SQL = """
+WITH
+bounds as (
+    SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) as geom
+),
+features as (
+    SELECT t.*
+    FROM
+        core_vectorfeature t,
+        bounds
+    WHERE
+        t.vector_data_id = %(vector_data_id)s
+        AND ST_Intersects(t.web_mercator_geometry, bounds.geom)
+        REPLACE_WITH_FILTERS
+),
+points as (
+    SELECT
+        t.web_mercator_geometry as geom,
+        CASE
+            WHEN jsonb_typeof(t.properties #> %(cluster_property)s::text[]) = 'number'
+            THEN (t.properties #> %(cluster_property)s::text[])::float8
+        END as value
+    FROM features t
+    WHERE ST_GeometryType(t.web_mercator_geometry) = 'ST_Point'
+),
+clusters as (
+    SELECT REPLACE_WITH_CLUSTER_ID as cluster_id, geom, value
+    FROM points
+),
+mvtgeom as (
+    SELECT
+        ST_AsMVTGeom(
+            ST_Centroid(ST_Collect(c.geom)),
+            ST_TileEnvelope(%(z)s, %(x)s, %(y)s)::box2d
+        ) AS geom,
+        NULL::jsonb as properties,
+        NULL::integer as feature_id,
+        count(*) as point_count,
+        sum(c.value) as value_sum,
+        avg(c.value) as value_mean,
+        min(c.value) as value_min,
+        max(c.value) as value_max
+    FROM clusters c
+    GROUP BY c.cluster_id
+    UNION ALL
+    SELECT
+        ST_AsMVTGeom(
+            COALESCE(s.geometry, t.web_mercator_geometry),
+            bounds.geom::box2d
+        ),
+        REPLACE_WITH_PROPERTIES,
+        t.id,
+        NULL,
+        NULL,
+        NULL,
+        NULL,
+        NULL
+    FROM
+        features t
+        CROSS JOIN bounds
+        LEFT JOIN core_simplifiedgeometry s ON (
+            s.feature_id = t.id
+            AND %(z)s BETWEEN s.min_zoom AND s.max_zoom
+        )
+    WHERE ST_GeometryType(t.web_mercator_geometry) <> 'ST_Point'
+)
+SELECT
+    (SELECT ST_AsMVT(mvtgeom.*, %(layer_name)s, 4096, 'geom', 'feature_id') FROM mvtgeom),
+    (SELECT count(*) FROM features)
+;
+"""
+
+
+class ClusterOptions(TypedDict):
+    method: str
+    property: str | None
+    max_zoom: int
+
+
+def parse_cluster_options(
+    method: str | None, cluster_property: str | None = None, max_zoom: str | None = None
+) -> ClusterOptions | None:
+    """Parse the clustering query parameters of a tile request; None disables clustering."""
+    if not method:
+        return None
+    if method not in CLUSTER_METHODS:
+        raise ValueError(f'Invalid cluster method "{method}".')
+    try:
+        max_zoom = DEFAULT_CLUSTER_MAX_ZOOM if max_zoom is None else int(max_zoom)
+    except ValueError:
+        raise ValueError(f'Invalid cluster max zoom "{max_zoom}".') from None
+    return {"method": method, "property": cluster_property or None, "max_zoom": max_zoom}
+
+
+def get_zoom_cluster(cluster: ClusterOptions | None, z: int) -> ClusterOptions | None:
+    """Return the clustering options of a tile at zoom `z`, None above the max cluster zoom."""
+    if cluster is not None and z > cluster["max_zoom"]:
+        return None
+    return cluster
+
+
+def get_clustered_tile_sql(cluster: ClusterOptions, z: int) -> tuple[str, dict]:
+    """Return the statement rendering a clustered tile at zoom `z`, and its parameters."""
+    sql = CLUSTERED_VECTOR_TILE_SQL.replace(
+        "REPLACE_WITH_CLUSTER_ID", CLUSTER_ID_SQL[cluster["method"]]
+    )
+    return sql, {
+        "cluster_property": cluster["property"].split(".") if cluster["property"] else None,
+        "grid_size": WEB_MERCATOR_WIDTH / (2**z * CLUSTER_GRID_CELLS),
+        "clusters": CLUSTER_KMEANS_CLUSTERS,
+    }
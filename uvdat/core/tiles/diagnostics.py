@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import time
+from typing import TYPE_CHECKING
+
+from django.db import connection
+
+from .vector import execute_tile_sql, get_tile_sql, render_vector_tile, resolve_tile_options
+
+if TYPE_CHECKING:
+    from .budget import TileBudget
+    from .cluster import ClusterOptions
+
+
+class QueryTimer:
+    """Database execute wrapper measuring the number and total duration of queries."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+def diagnose_vector_tile(  # noqa: PLR0913
+    vector_data_id: int,
+    z: int,
+    x: int,
+    y: int,
+    filters: dict | None = None,
+    properties: list[str] | str | None = None,
+    cluster: ClusterOptions | None = None,
+    budget: TileBudget | None = None,
+) -> dict:
+    """
+    Render a vector tile, bypassing caches and archives, and report how it was rendered.
+
+    The report has the EXPLAIN (ANALYZE, BUFFERS) plan of the first rendering statement,
+    the number of features intersecting the tile, the size of the encoded tile, and the
+    time spent in SQL and in Python while rendering it.
+    """
+    properties, budget = resolve_tile_options(vector_data_id, properties, budget)
+    args = (vector_data_id, z, x, y, filters, properties, cluster, "default")
+    budget_options = {}
+    if budget is not None and cluster is None:
+        budget_options = {"max_features": budget["max_features"], "priority": budget["priority"]}
+
+    sql, params = get_tile_sql(*args, **budget_options)
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {sql}", params)
+        plan = [row[0] for row in cursor.fetchall()]
+
+    timer = QueryTimer()
+    start = time.perf_counter()
+    with connection.execute_wrapper(timer):
+        tile = render_vector_tile(*args[:7], budget, "default")
+    total_duration = time.perf_counter() - start
+
+    return {
+        "z": z,
+        "x": x,
+        "y": y,
+        "feature_count": execute_tile_sql(*args)[1],
+        "dropped_features": tile.dropped_features,
+        "bytes": len(tile.data),
+        "queries": timer.count,
+        "sql_time_ms": round(timer.duration * 1000, 3),
+        "python_time_ms": round((total_duration - timer.duration) * 1000, 3),
+        "total_time_ms": round(total_duration * 1000, 3),
+        "plan": plan,
+    }
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import decimal
+import json
+import math
+
+# Range lookups and the SQL comparison operators they compile to
+RANGE_LOOKUPS = {
+    "gt": ">",
+    "gte": ">=",
+    "lt": "<",
+    "lte": "<=",
+}
+LOOKUPS = {"exact", "in", "isnull", *RANGE_LOOKUPS}
+
+
+class FilterError(ValueError):
+    pass
+
+
+def _parse_key(key: str) -> tuple[list[str], str]:
+    """Split a filter key into a property path and a lookup, e.g. `a.b__gte`."""
+    name, _, lookup = key.rpartition("__")
+    if not name or lookup not in LOOKUPS:
+        name, lookup = key, "exact"
+    return name.split("."), lookup
+
+
+def _json_candidates(value: str) -> list[str]:
+    """
+    Return the JSON values a query string value may match.
+
+    Query string values are untyped, so a value matches both the string itself and the
+    number or boolean it spells, if any.
+    """
+    candidates = [json.dumps(value)]
+    try:
+        parsed = json.loads(value)
+    except ValueError:
+        return candidates
+    if isinstance(parsed, bool) or (isinstance(parsed, int | float) and math.isfinite(parsed)):
+        candidates.append(json.dumps(parsed))
+    return candidates
+
+
+def _nest(path: list[str], value: str) -> str:
+    """Wrap a JSON value in objects for each key of a property path."""
+    for key in reversed(path):
+        value = f"{{{json.dumps(key)}: {value}}}"
+    return value
+
+
+def _parse_number(value: str) -> decimal.Decimal:
+    try:
+        number = decimal.Decimal(value)
+    except decimal.InvalidOperation:
+        number = None
+    if number is None or not number.is_finite():
+        raise FilterError(f'Invalid number "{value}".')
+    return number
+
+
+def _parse_bool(value: str) -> bool:
+    if value.lower() in {"true", "1"}:
+        return True
+    if value.lower() in {"false", "0"}:
+        return False
+    raise FilterError(f'Invalid boolean "{value}".')
+
+
+def compile_filters(filters: dict[str, str] | None, alias: str = "t") -> tuple[str, dict]:
+    """
+    Compile feature property filters to a SQL condition on `<alias>.properties`.
+
+    Filter keys are property names, with `.` separating the keys of nested properties, and
+    an optional lookup suffix:
+
+    - `name=value`: equality; `value` matches strings, and numbers or booleans it spells
+    - `name__in=a,b`: equality to any of a comma separated list of values
+    - `name__gt`, `name__gte`, `name__lt`, `name__lte`: numeric comparisons
+    - `name__isnull=true|false`: whether the property is missing or null
+
+    Values are bound as parameters rather than inlined, so statements are plan-cacheable.
+    Equality lookups compile to jsonb containment, which can use a GIN `jsonb_path_ops`
+    index on the properties. Returns the condition, prefixed with `AND` for each filter,
+    and its parameters.
+    """
+    conditions = []
+    params = {}
+    for i, (key, value) in enumerate(sorted((filters or {}).items())):
+        path, lookup = _parse_key(key)
+        param = f"filter_{i}"
+        properties = f"{alias}.properties"
+        if lookup in {"exact", "in"}:
+            values = str(value).split(",") if lookup == "in" else [str(value)]
+            params[param] = [
+                _nest(path, candidate) for v in values for candidate in _json_candidates(v)
+            ]
+            conditions.append(f"{properties} @> ANY(%({param})s::jsonb[])")
+        elif lookup in RANGE_LOOKUPS:
+            params[f"{param}_path"] = path
+            params[param] = _parse_number(str(value))
+            field = f"{properties} #> %({param}_path)s::text[]"
+            conditions.append(
+                f"(CASE WHEN jsonb_typeof({field}) = 'number' "
+                f"THEN ({field})::numeric END) {RANGE_LOOKUPS[lookup]} %({param})s"
+            )
+        else:
+            params[f"{param}_path"] = path
+            field = f"{properties} #> %({param}_path)s::text[]"
+            isnull = f"coalesce(jsonb_typeof({field}), 'null') = 'null'"
+            conditions.append(isnull if _parse_bool(str(value)) else f"NOT {isnull}")
+
+    return "".join(f" AND {condition}" for condition in conditions), params
@@ -0,0 +1,4 @@
+from __future__ import annotations
+
+# Width of the web mercator projection, in meters, which is the width of the tile at zoom 0
+WEB_MERCATOR_WIDTH = 40075016.686
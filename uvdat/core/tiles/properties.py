@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+from uvdat.core.models import (
+    ColormapConfig,
+    FilterConfig,
+    LayerFrame,
+    LayerStyle,
+    SizeRangeConfig,
+)
+
+# Properties used by the web client regardless of style,
+# for network interactions and for coloring features by their own colors
+ALWAYS_INCLUDED_PROPERTIES = {
+    "node_id",
+    "edge_id",
+    "from_node_id",
+    "to_node_id",
+    "fill",
+    "stroke",
+}
+
+# Value of the `properties` tile parameter selecting the properties used by layer styles
+STYLE_PROPERTIES = "style"
+
+
+def parse_properties(value: str | None) -> list[str] | None:
+    """
+    Parse a comma separated list of property names.
+
+    Returns None, meaning all properties, for a `*` value.
+    """
+    if value is None or value.strip() == "*":
+        return None
+    return sorted({name.strip() for name in value.split(",") if name.strip()})
+
+
+def get_style_properties(vector_data_id: int) -> list[str] | None:
+    """
+    Return the feature properties rendered by the styles of layers showing a VectorData.
+
+    These are the properties styles color, size and filter by, and the properties frames
+    select features by. Returns None, meaning all properties, if no layer has a style yet.
+    """
+    frames = LayerFrame.objects.filter(vector_id=vector_data_id)
+    layer_ids = frames.values("layer_id")
+    if not LayerStyle.objects.filter(layer_id__in=layer_ids).exists():
+        return None
+
+    properties = set(ALWAYS_INCLUDED_PROPERTIES)
+    for source_filters in frames.values_list("source_filters", flat=True):
+        properties.update(source_filters or {})
+    properties.update(
+        ColormapConfig.objects.filter(color_config__style__layer_id__in=layer_ids)
+        .values_list("color_by", flat=True)
+        .union(
+            SizeRangeConfig.objects.filter(size_config__style__layer_id__in=layer_ids).values_list(
+                "size_by", flat=True
+            ),
+            FilterConfig.objects.filter(style__layer_id__in=layer_ids).values_list(
+                "filter_by", flat=True
+            ),
+        )
+    )
+    properties.discard("")
+    properties.discard(None)
+    return sorted(properties)
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+from concurrent.futures import Future
+import threading
+import time
+from typing import TYPE_CHECKING
+
+from django.core.cache import caches
+
+from .cache import TILE_CACHE_ALIAS
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+# Longest time a request waits for another process computing the same result,
+# after which it computes the result itself
+SINGLE_FLIGHT_TIMEOUT = 30
+
+# Interval at which a waiting request checks the cache for the result
+SINGLE_FLIGHT_POLL_INTERVAL = 0.05
+
+_flights: dict[str, Future] = {}
+_flights_lock = threading.Lock()
+
+
+def _compute_across_processes[T](key: str, compute: Callable[[], T]) -> T:
+    cache = caches[TILE_CACHE_ALIAS]
+    lock_key = f"single-flight:{key}"
+    deadline = time.monotonic() + SINGLE_FLIGHT_TIMEOUT
+    while True:
+        result = cache.get(key)
+        if result is not None:
+            return result
+        if cache.add(lock_key, 1, SINGLE_FLIGHT_TIMEOUT):
+            try:
+                return compute()
+            finally:
+                cache.delete(lock_key)
+        # If the computing process takes too long or died, don't wait for it any longer
+        if time.monotonic() > deadline:
+            return compute()
+        time.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+
+
+def coalesce[T](key: str, compute: Callable[[], T]) -> T:
+    """
+    Return the result of `compute`, sharing one computation between concurrent identical calls.
+
+    Within a process, concurrent calls with the same key wait for the first one and share its
+    result or exception. Across processes, a lock in the tile cache lets one process compute
+    while others wait for the result to appear in the tile cache under `key`, so `compute`
+    must store its result there. If it doesn't, waiting processes compute the result in turn.
+    """
+    with _flights_lock:
+        future = _flights.get(key)
+        is_leader = future is None
+        if is_leader:
+            future = _flights[key] = Future()
+    if not is_leader:
+        return future.result()
+
+    try:
+        result = _compute_across_processes(key, compute)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        with _flights_lock:
+            del _flights[key]
@@ -0,0 +1,287 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, NamedTuple
+
+from django.core.cache import caches
+from django.db import connection
+
+from .archive import read_archived_tile
+from .budget import (
+    DEFAULT_EXTENT,
+    FEATURE_RANK_SQL,
+    LOW_ZOOM_EXTENT,
+    LOW_ZOOM_MAX,
+    TileBudget,
+    get_priority_property,
+)
+from .cache import TILE_CACHE_ALIAS, get_layer_options_version, vector_tile_cache_key
+from .cluster import ClusterOptions, get_clustered_tile_sql, get_zoom_cluster
+from .filters import compile_filters
+from .properties import STYLE_PROPERTIES, get_style_properties
+from .singleflight import coalesce
+
+if TYPE_CHECKING:
+    from uvdat.core.models import VectorData
+
+# Features are filtered by the spatial index on their stored web mercator geometry,
+# so neither the features nor the tile envelope need to be transformed per request.
+# Geometries are rendered from the simplified geometry of the tile's zoom band, if any.
+# Only the highest ranked features within the tile's feature budget are encoded;
+# Features are identified by the id of their VectorFeature, by which clients fetch all of
+# their properties; the statement also returns the number of features in the tile.
+VECTOR_TILE_SQL = """
+WITH
+bounds as (
+    SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) as geom
+),
+features as (
+    SELECT
+        ST_AsMVTGeom(
+            COALESCE(s.geometry, t.web_mercator_geometry),
+            bounds.geom::box2d,
+            %(extent)s
+        ) AS geom,
+        REPLACE_WITH_PROPERTIES as properties,
+        t.id as feature_id,
+        REPLACE_WITH_RANK as feature_rank
+    FROM
+        core_vectorfeature t
+        CROSS JOIN bounds
+        LEFT JOIN core_simplifiedgeometry s ON (
+            s.feature_id = t.id
+            AND %(z)s BETWEEN s.min_zoom AND s.max_zoom
+        )
+    WHERE
+        t.vector_data_id = %(vector_data_id)s
+        AND ST_Intersects(t.web_mercator_geometry, bounds.geom)
+        REPLACE_WITH_FILTERS
+),
+mvtgeom as (
+    SELECT geom, properties, feature_id
+    FROM features
+    WHERE %(max_features)s::integer IS NULL OR feature_rank <= %(max_features)s::integer
+)
+SELECT
+    (SELECT ST_AsMVT(mvtgeom.*, %(layer_name)s, %(extent)s, 'geom', 'feature_id') FROM mvtgeom),
+    (SELECT count(*) FROM features)
+;
+"""
+
+
+# Only the requested properties are encoded, if a list of them is given
+PROJECTED_PROPERTIES_SQL = """(
+        SELECT jsonb_object_agg(p.key, p.value)
+        FROM jsonb_each(t.properties) p
+        WHERE p.key = ANY(%(properties)s)
+    )"""
+
+
+# Tiles over their byte budget are re-rendered with this fraction of the features which would
+# fit, if the size of the tile were proportional to its number of features
+BYTE_BUDGET_MARGIN = 0.9
+
+
+class RenderedTile(NamedTuple):
+    data: bytes
+    # The number of features left out to keep within the tile budget, if known
+    dropped_features: int | None = 0
+
+
+def get_tile_sql(  # noqa: PLR0913
+    vector_data_id: int,
+    z: int,
+    x: int,
+    y: int,
+    filters: dict | None,
+    properties: list[str] | None,
+    cluster: ClusterOptions | None,
+    layer_name: str,
+    *,
+    max_features: int | None = None,
+    priority: str | None = None,
+    extent: int = DEFAULT_EXTENT,
+) -> tuple[str, dict]:
+    """Return the statement rendering a tile, and its parameters."""
+    sql, cluster_params = VECTOR_TILE_SQL, {}
+    if cluster is not None:
+        sql, cluster_params = get_clustered_tile_sql(cluster, z)
+    filter_sql, filter_params = compile_filters(filters)
+    sql = sql.replace("REPLACE_WITH_FILTERS", filter_sql)
+    sql = sql.replace(
+        "REPLACE_WITH_PROPERTIES",
+        "t.properties" if properties is None else PROJECTED_PROPERTIES_SQL,
+    )
+    # Ranking features is only needed to choose the features within a budget
+    sql = sql.replace("REPLACE_WITH_RANK", "0" if max_features is None else FEATURE_RANK_SQL)
+    return sql, {
+        "z": z,
+        "x": x,
+        "y": y,
+        "vector_data_id": vector_data_id,
+        "properties": properties,
+        "layer_name": layer_name,
+        "max_features": max_features,
+        "priority": priority.split(".") if priority else None,
+        "extent": extent,
+        **cluster_params,
+        **filter_params,
+    }
+
+
+def execute_tile_sql(*args, **kwargs) -> tuple[bytes, int]:
+    """Execute the statement rendering a tile; return the tile and its number of features."""
+    with connection.cursor() as cursor:
+        cursor.execute(*get_tile_sql(*args, **kwargs))
+        tile, feature_count = cursor.fetchone()
+    return bytes(tile) if tile else b"", feature_count
+
+
+def render_vector_tile(  # noqa: PLR0913
+    vector_data_id: int,
+    z: int,
+    x: int,
+    y: int,
+    filters: dict | None = None,
+    properties: list[str] | None = None,
+    cluster: ClusterOptions | None = None,
+    budget: TileBudget | None = None,
+    layer_name: str = "default",
+) -> RenderedTile:
+    """
+    Render a Mapbox Vector Tile from the VectorFeatures of a VectorData.
+
+    If `properties` is given, features only carry those of their properties.
+    If `cluster` is given, points are aggregated into clusters.
+    If `budget` is given, the least significant features are dropped from tiles over it. Tiles
+    over the byte budget are re-rendered with a coarser extent at low zooms, then with as many
+    features as their size suggests would fit, until they fit.
+    """
+    args = (vector_data_id, z, x, y, filters, properties, cluster, layer_name)
+    # Clustered tiles are bounded by their number of clusters instead
+    if budget is None or cluster is not None:
+        return RenderedTile(execute_tile_sql(*args)[0])
+
+    max_features = budget["max_features"]
+    extent = DEFAULT_EXTENT
+    while True:
+        tile, feature_count = execute_tile_sql(
+            *args, max_features=max_features, priority=budget["priority"], extent=extent
+        )
+        kept_features = feature_count if max_features is None else min(max_features, feature_count)
+        if budget["max_bytes"] is None or len(tile) <= budget["max_bytes"] or not kept_features:
+            return RenderedTile(tile, feature_count - kept_features)
+        if z <= LOW_ZOOM_MAX and extent > LOW_ZOOM_EXTENT:
+            extent = LOW_ZOOM_EXTENT
+        else:
+            # Estimating the number of features from the size of the tile, rather than halving
+            # it, takes a rendering or two, rather than one per halving
+            estimate = int(kept_features * budget["max_bytes"] / len(tile) * BYTE_BUDGET_MARGIN)
+            max_features = min(estimate, kept_features - 1)
+
+
+def depends_on_layers(properties: list[str] | str | None, budget: TileBudget | None) -> bool:
+    """Whether tile options are found from the layers showing a VectorData."""
+    return properties == STYLE_PROPERTIES or (budget is not None and budget["priority"] is None)
+
+
+def resolve_tile_options(
+    vector_data_id: int, properties: list[str] | str | None, budget: TileBudget | None
+) -> tuple[list[str] | None, TileBudget | None]:
+    """
+    Find the tile options given by the layers showing a VectorData.
+
+    These are the properties of layer styles, for `style` properties, and the priority
+    property of layers, for budgets without a priority.
+    """
+    if properties == STYLE_PROPERTIES:
+        properties = get_style_properties(vector_data_id)
+    if budget is not None and budget["priority"] is None:
+        budget = {**budget, "priority": get_priority_property(vector_data_id)}
+    return properties, budget
+
+
+def get_vector_tile_key(  # noqa: PLR0913
+    vector_data: VectorData,
+    z: int,
+    x: int,
+    y: int,
+    filters: dict | None = None,
+    properties: list[str] | str | None = None,
+    cluster: ClusterOptions | None = None,
+    budget: TileBudget | None = None,
+    layer_name: str = "default",
+) -> str:
+    """
+    Return the cache key of a vector tile, which identifies its contents.
+
+    Options found from layers are not looked up; tiles depending on them are keyed by the
+    state of layers instead.
+    """
+    key = vector_tile_cache_key(
+        vector_data, z, x, y, filters, properties, get_zoom_cluster(cluster, z), budget, layer_name
+    )
+    if depends_on_layers(properties, budget):
+        key = f"{key}:layers-{get_layer_options_version()}"
+    return key
+
+
+def get_vector_tile(  # noqa: PLR0913
+    vector_data: VectorData,
+    z: int,
+    x: int,
+    y: int,
+    filters: dict | None = None,
+    properties: list[str] | str | None = None,
+    cluster: ClusterOptions | None = None,
+    budget: TileBudget | None = None,
+    layer_name: str = "default",
+) -> RenderedTile:
+    """
+    Return a vector tile, rendering it only if it is not already cached.
+
+    Concurrent requests for the same uncached tile, in any process, share one rendering.
+    Options found from layers are only looked up to render a tile.
+    """
+    cluster = get_zoom_cluster(cluster, z)
+    cache = caches[TILE_CACHE_ALIAS]
+    key = get_vector_tile_key(
+        vector_data, z, x, y, filters, properties, cluster, budget, layer_name
+    )
+
+    def load_tile() -> RenderedTile:
+        resolved_properties, resolved_budget = resolve_tile_options(
+            vector_data.id, properties, budget
+        )
+        tile = None
+        # Archives hold tiles as the tiles endpoint serves them by default
+        if not filters and cluster is None and layer_name == "default":
+            archived = read_archived_tile(
+                vector_data, z, x, y, resolved_properties, resolved_budget
+            )
+            if archived is not None:
+                tile = RenderedTile(archived, None)
+        if tile is None:
+            tile = render_vector_tile(
+                vector_data.id,
+                z,
+                x,
+                y,
+                filters,
+                resolved_properties,
+                cluster,
+                resolved_budget,
+                layer_name,
+            )
+        cache.set(key, tile)
+        return tile
+
+    tile = cache.get(key)
+    if tile is None:
+        # Concurrent requests for the same tile wait for a single rendering
+        tile = coalesce(key, load_tile)
+    return tile
+
+
+def encode_tile_batch(tiles: list[bytes]) -> bytes:
+    """Concatenate tiles, each prefixed by its length as a 4 byte big-endian integer."""
+    return b"".join(len(tile).to_bytes(4, "big") + tile for tile in tiles)
@@ -139,6 +139,14 @@ CORS_ALLOWED_ORIGINS: list[str] = env.list("DJANGO_CORS_ALLOWED_ORIGINS", cast=s
 CORS_ALLOWED_ORIGIN_REGEXES: list[str] = env.list(
     "DJANGO_CORS_ALLOWED_ORIGIN_REGEXES", cast=str, default=[]
 )
+# Response headers describing binary tile and raster data, which the client reads
+CORS_EXPOSE_HEADERS: list[str] = [
+    "X-Raster-Bounds",
+    "X-Raster-Dtype",
+    "X-Raster-Nodata",
+    "X-Raster-Shape",
+    "X-Tile-Dropped-Features",
+]
 
 # django-channels with Redis
 CHANNEL_LAYERS: dict[str, dict[str, Any]] = {
@@ -161,6 +169,62 @@ CHANNEL_LAYERS: dict[str, dict[str, Any]] = {
 LARGE_IMAGE_CACHE_BACKEND = "redis"
 LARGE_IMAGE_CACHE_REDIS_URL = env.url("DJANGO_REDIS_URL").geturl()
 
+# Vector tile cache, with Redis by default or on local disk if a directory is given.
+# Both are size-bounded with LRU eviction; for Redis, this requires an LRU "maxmemory-policy".
+UVDAT_TILE_CACHE_DIR: str = env.str("DJANGO_UVDAT_TILE_CACHE_DIR", default="")
+UVDAT_TILE_CACHE_TIMEOUT: int = env.int("DJANGO_UVDAT_TILE_CACHE_TIMEOUT", default=7 * 24 * 60 * 60)
+CACHES: dict[str, dict[str, Any]] = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "tiles": (
+        {
+            "BACKEND": "uvdat.core.tiles.cache.LRUFileBasedCache",
+            "LOCATION": UVDAT_TILE_CACHE_DIR,
+            "TIMEOUT": UVDAT_TILE_CACHE_TIMEOUT,
+            "OPTIONS": {
+                "MAX_SIZE": env.int("DJANGO_UVDAT_TILE_CACHE_MAX_SIZE", default=2 * 1024**3),
+                "MAX_ENTRIES": 1_000_000,
+            },
+        }
+        if UVDAT_TILE_CACHE_DIR
+        else {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            # Use database /2 for tiles, to keep them apart from the Channels backend; the
+            # database of the URL takes precedence over a "db" option, so it is replaced
+            "LOCATION": env.url("DJANGO_REDIS_URL")._replace(path="/2").geturl(),
+            "TIMEOUT": UVDAT_TILE_CACHE_TIMEOUT,
+        }
+    ),
+}
+
+# Default per-tile budget of vector tiles; tiles over it drop their least significant features.
+# A limit of 0 disables it, and budgets are disabled unless configured or requested.
+UVDAT_TILE_MAX_FEATURES: int = env.int("DJANGO_UVDAT_TILE_MAX_FEATURES", default=0)
+UVDAT_TILE_MAX_BYTES: int = env.int("DJANGO_UVDAT_TILE_MAX_BYTES", default=0)
+
+# Working directory of the seed_tiles command, where MBTiles archives of pre-rendered vector
+# tiles are seeded, and resumed, before they are saved to the default storage
+UVDAT_TILE_ARCHIVE_DIR: str = env.str(
+    "DJANGO_UVDAT_TILE_ARCHIVE_DIR", default=str(BASE_DIR / "tile_archives")
+)
+
+# Local cache of stored files read by workers, such as COGs, shared by their processes
+UVDAT_FILE_CACHE_DIR: str = env.str(
+    "DJANGO_UVDAT_FILE_CACHE_DIR", default=str(BASE_DIR / "file_cache")
+)
+UVDAT_FILE_CACHE_MAX_SIZE: int = env.int("DJANGO_UVDAT_FILE_CACHE_MAX_SIZE", default=20 * 1024**3)
+
+# How stored rasters are read: "local" reads local copies, and "vsis3" or "vsicurl" read them
+# with range requests, through the S3 API or presigned URLs. Presigned URLs change with each
+# request, so tile sources and GDAL's caches are only reused across requests with "vsis3",
+# which sets the storage credentials as GDAL options of the process at startup.
+UVDAT_RASTER_READ_MODE: str = env.str("DJANGO_UVDAT_RASTER_READ_MODE", default="local")
+
+# VRT mosaics of the rasters of datasets, written by each process serving them; their
+# overviews are built by workers and kept in the default storage
+UVDAT_MOSAIC_DIR: str = env.str("DJANGO_UVDAT_MOSAIC_DIR", default=str(BASE_DIR / "mosaics"))
+
 UVDAT_WEB_URL: str = env.url("DJANGO_UVDAT_WEB_URL").geturl()
 UVDAT_ENABLE_FLOOD_SIMULATION: bool = env.bool("DJANGO_UVDAT_ENABLE_FLOOD_SIMULATION", default=True)
 UVDAT_ENABLE_FLOOD_NETWORK_FAILURE: bool = env.bool(
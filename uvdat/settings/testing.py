@@ -19,5 +19,11 @@ MINIO_STORAGE_MEDIA_BUCKET_NAME = f"test-django-storage-{randbelow(1_000_000):06
 
 # Testing will set EMAIL_BACKEND to use the memory backend
 
+# Keep cached tiles local to each test process
+CACHES["tiles"] = {
+    "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    "LOCATION": "tiles",
+}
+
 CELERY_TASK_ALWAYS_EAGER = True
 CELERY_TASK_EAGER_PROPAGATES = CELERY_TASK_ALWAYS_EAGER
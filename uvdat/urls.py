@@ -15,10 +15,12 @@ from uvdat.core.rest import (
     ChartViewSet,
     ColormapViewSet,
     DatasetViewSet,
+    DerivedRasterDataViewSet,
     FileItemViewSet,
     LayerFrameViewSet,
     LayerStyleViewSet,
     LayerViewSet,
+    MosaicViewSet,
     NetworkViewSet,
     ProjectViewSet,
     RasterDataViewSet,
@@ -47,6 +49,8 @@ router.register(r"layer-frames", LayerFrameViewSet, basename="layer-frames")
 router.register(r"layer-styles", LayerStyleViewSet, basename="layer-styles")
 router.register(r"rasters", RasterDataViewSet, basename="rasters")
 router.register(r"vectors", VectorDataViewSet, basename="vectors")
+router.register(r"mosaics", MosaicViewSet, basename="mosaics")
+router.register(r"derived-rasters", DerivedRasterDataViewSet, basename="derived-rasters")
 router.register(r"source-regions", RegionViewSet, basename="source-regions")
 router.register(r"networks", NetworkViewSet, basename="networks")
 router.register(r"basemaps", BasemapViewSet, basename="basemaps")
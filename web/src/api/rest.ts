@@ -211,13 +211,32 @@ export async function getVectorSummary(
   return (await apiClient.get(`vectors/${vectorId}/summary/`)).data;
 }
 
+export async function getVectorFeatureProperties(
+  vectorId: number,
+  featureId: number,
+  dataVersion?: number,
+): Promise<Record<string, unknown>> {
+  return (
+    await apiClient.get(`vectors/${vectorId}/features/${featureId}/`, {
+      params: { v: dataVersion },
+    })
+  ).data.properties;
+}
+
 export async function getRasterDataValues(
   rasterId: number,
 ): Promise<RasterDataValues> {
-  const resolution = 0.1;
-  const data = (
-    await apiClient.get(`rasters/${rasterId}/raster-data/${resolution}/`)
-  ).data;
+  const response = await apiClient.get(`rasters/${rasterId}/raster-data/`, {
+    params: { size: 1024 },
+    responseType: "arraybuffer",
+  });
+  const [height, width] = response.headers["x-raster-shape"]
+    .split(",")
+    .map(Number);
+  const values = new Float32Array(response.data);
+  const data = Array.from({ length: height }, (_, row) =>
+    Array.from(values.subarray(row * width, (row + 1) * width)),
+  );
   const { bounds } = (await apiClient.get(`rasters/${rasterId}/info/metadata/`))
     .data;
   return {
@@ -508,7 +508,10 @@ export const useMapStore = defineStore("map", () => {
     const map = getMap();
     map.addSource(sourceId, {
       type: "vector",
-      tiles: [`${baseURL}vectors/${vector.id}/tiles/{z}/{x}/{y}/`],
+      tiles: [
+        // Tiles carry only the properties used by styles; the tooltip fetches the rest
+        `${baseURL}vectors/${vector.id}/tiles/{z}/{x}/{y}/?properties=style&v=${vector.data_version}`,
+      ],
     });
     const source = map.getSource(sourceId);
     if (source) {
@@ -524,8 +527,9 @@ export const useMapStore = defineStore("map", () => {
   ): Source | undefined {
     const map = getMap();
 
-    const queryParams: { projection: string; style?: string } = {
+    const queryParams: { projection: string; v: string; style?: string } = {
       projection: "epsg:3857",
+      v: `${raster.data_version}`,
     };
     const { layerId, layerCopyId } = parseSourceString(sourceId);
     const styleSpec =
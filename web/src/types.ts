@@ -137,6 +137,7 @@ export interface VectorData {
   geojson_data: string | null;
   source_file: null | number;
   file_size: number;
+  data_version: number;
   summary?: VectorSummary;
   metadata?: Record<string, any>;
 }
@@ -148,6 +149,7 @@ export interface RasterData {
   dataset: number;
   source_file: null | number;
   file_size: number;
+  data_version: number;
   metadata: RasterMetadata;
 }
 